@@ -0,0 +1,3 @@
+# This file informs Python that this directory is a package
+
+# It has no other purpose (at the moment)
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+A (deterministic) throughput benchmark of the consumers of an
+`FSWatcher`'s events, using a replayed event log.
+
+An event log (see `cputils.eventLog`) is either given, for example one
+recorded using `FSWatcher.recordEvents` while reproducing a problem, or
+generated (a storm of editor like saves: CREATE, MODIFY, ..., CLOSE_WRITE
+for each of a number of files).
+
+The log is replayed (as fast as possible, or at a given speed) through
+both `FSWatcher.watchForFileSystemEvents` and
+`FSWatcher.watchForFileSystemEventBatches`, and we measure the number of
+events per second, and the number of batches and (coalesced) changes.
+
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from asyncinotify import Mask
+
+from cputils.eventLog import EventRecorder, ReplayBackend
+from cputils.fsWatcher import FSEvent, FSWatcher
+
+def generateLog(logPath, numFiles, numModifies, eventInterval) :
+  """Generate a log of a storm of saves, returning the number of
+  events."""
+
+  aTime     = 0.0
+  numEvents = 0
+  with EventRecorder(logPath) as aRecorder :
+    for i in range(numFiles) :
+      aPath = f"/tmp/cputils-benchmark-replay/dir{i % 100}/file{i}.txt"
+      someMasks = [ Mask.CREATE ] + [ Mask.MODIFY ] * numModifies + \
+        [ Mask.CLOSE_WRITE ]
+      for aMask in someMasks :
+        aRecorder.record(FSEvent(aPath, aMask), aTime)
+        aTime     = aTime + eventInterval
+        numEvents = numEvents + 1
+  return numEvents
+
+async def replayEvents(logPath, speed) :
+  numEvents = 0
+  startTime = time.perf_counter()
+  async with FSWatcher(backend=ReplayBackend(logPath, speed)) as aWatcher :
+    async for anEvent in aWatcher.watchForFileSystemEvents() :
+      numEvents = numEvents + 1
+  return numEvents, time.perf_counter() - startTime
+
+async def replayBatches(logPath, speed, maxBatchDelay) :
+  numBatches = 0
+  numChanges = 0
+  startTime  = time.perf_counter()
+  async with FSWatcher(backend=ReplayBackend(logPath, speed)) as aWatcher :
+    async for aBatch in aWatcher.watchForFileSystemEventBatches(maxBatchDelay) :
+      numBatches = numBatches + 1
+      numChanges = numChanges + len(aBatch)
+    numEvents = aWatcher.backend.numReplayed
+  return numEvents, numBatches, numChanges, time.perf_counter() - startTime
+
+def main() :
+  argParser = argparse.ArgumentParser(
+    description="Replay an event log through an FSWatcher's consumers"
+  )
+  argParser.add_argument('-l', '--logPath',
+    help="The event log to replay (by default a storm is generated)"
+  )
+  argParser.add_argument('-n', '--numFiles', type=int, default=20000,
+    help="The number of files saved in the generated storm"
+  )
+  argParser.add_argument('-m', '--numModifies', type=int, default=3,
+    help="The number of MODIFY events in each generated save"
+  )
+  argParser.add_argument('-i', '--eventInterval', type=float, default=1e-5,
+    help="The (original) time, in seconds, between generated events"
+  )
+  argParser.add_argument('-s', '--speed', type=float, default=None,
+    help="The replay speed (by default, as fast as possible)"
+  )
+  argParser.add_argument('-b', '--maxBatchDelay', type=float, default=0.05,
+    help="The maximum delay, in seconds, of each batch"
+  )
+  cliArgs = argParser.parse_args()
+
+  logPath = cliArgs.logPath
+  if logPath is None :
+    logPath = '/tmp/cputils-benchmark-replay.log'
+    numEvents = generateLog(
+      logPath, cliArgs.numFiles, cliArgs.numModifies, cliArgs.eventInterval
+    )
+    print(f"log      : {numEvents} generated events ({os.path.getsize(logPath)} bytes)")
+
+  try :
+    numEvents, duration = asyncio.run(replayEvents(logPath, cliArgs.speed))
+    print(f"events   : {numEvents} in {duration:.3f} s ({numEvents / duration:.0f} events/s)")
+    numEvents, numBatches, numChanges, duration = asyncio.run(
+      replayBatches(logPath, cliArgs.speed, cliArgs.maxBatchDelay)
+    )
+    print(f"batches  : {numEvents} events in {duration:.3f} s ({numEvents / duration:.0f} events/s), {numBatches} batches, {numChanges} changes")
+  finally :
+    if cliArgs.logPath is None : os.remove(logPath)
+
+if __name__ == "__main__" :
+  main()
@@ -0,0 +1,86 @@
+"""
+A benchmark comparing the throughput of the hash algorithms which can be
+used by a `cputils.fileHasher.FileHasher`.
+
+For each available algorithm, we measure the throughput (in MB/s) of:
+
+- hashing an in-memory buffer (the cost of the hash alone),
+
+- hashing a (cached) file, using `cputils.fileHasher.hashFile` (the cost
+  of reading plus hashing).
+
+The `xxhash` and `blake3` algorithms are only measured if the optional
+`xxhash` and `blake3` packages are installed.
+
+"""
+
+import argparse
+import os
+import time
+
+from cputils.fileHasher import (
+  hashFile, isHashAlgorithmAvailable, newHash, resolveHashAlgorithm
+)
+
+someAlgorithms = [
+  'xxh3_64', 'xxh3_128', 'xxh64', 'blake3', 'blake2b', 'blake2s', 'md5',
+  'sha1', 'sha256', 'sha512'
+]
+
+def timeIt(aFunction, numBytes, minTime=1.0) :
+  """Return the throughput (in MB/s) of calling `aFunction` (which
+  processes `numBytes` bytes) repeatedly for at least `minTime` seconds."""
+
+  numCalls  = 0
+  startTime = time.perf_counter()
+  while True :
+    aFunction()
+    numCalls = numCalls + 1
+    duration = time.perf_counter() - startTime
+    if minTime <= duration : break
+  return numCalls * numBytes / duration / 1e6
+
+def main() :
+  argParser = argparse.ArgumentParser(
+    description="Compare the throughput of the FileHasher hash algorithms"
+  )
+  argParser.add_argument('-s', '--size', type=int, default=64,
+    help="The size (in MB) of the buffer and file to hash"
+  )
+  argParser.add_argument('-f', '--filePath',
+    default='/tmp/cputils-benchmark-fileHasher.bin',
+    help="The path of the (generated) file to hash"
+  )
+  argParser.add_argument('-t', '--minTime', type=float, default=1.0,
+    help="The minimum time (in seconds) to spend on each measurement"
+  )
+  cliArgs = argParser.parse_args()
+
+  numBytes = cliArgs.size * 1024 * 1024
+  aBuffer  = os.urandom(numBytes)
+  with open(cliArgs.filePath, 'wb') as f :
+    f.write(aBuffer)
+
+  print(f"fast      : {resolveHashAlgorithm('fast')}")
+  try :
+    for algorithm in someAlgorithms :
+      if not isHashAlgorithmAvailable(algorithm) :
+        print(f"{algorithm:9} : not available")
+        continue
+
+      def hashBuffer() :
+        aHash = newHash(algorithm)
+        aHash.update(aBuffer)
+        aHash.hexdigest()
+
+      def hashTheFile() :
+        hashFile(cliArgs.filePath, algorithm)
+
+      bufferRate = timeIt(hashBuffer, numBytes, cliArgs.minTime)
+      fileRate   = timeIt(hashTheFile, numBytes, cliArgs.minTime)
+      print(f"{algorithm:9} : buffer {bufferRate:8.0f} MB/s, file {fileRate:8.0f} MB/s")
+  finally :
+    os.remove(cliArgs.filePath)
+
+if __name__ == "__main__" :
+  main()
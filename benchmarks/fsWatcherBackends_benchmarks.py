@@ -0,0 +1,129 @@
+"""
+A benchmark comparing the `cputils.fsWatcherBackends`.
+
+For each available backend, we measure:
+
+- the time taken to register a (generated) directory tree, that is the
+  time taken for `FSWatcher.watchARootPath` to walk and watch the tree,
+
+- the latency of events, that is the time from (the end of) writing a
+  file to the file's event being read from the `FSWatcher`.
+
+The fanotify backend is only measured if the benchmark is run with the
+privileges required to use fanotify (for example as root).
+
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import time
+
+from cputils.fsWatcher import FSWatcher
+from cputils.fsWatcherBackends import FanotifyBackend
+
+def generateTree(rootDir, numFiles, filesPerDir, dirsPerDir=10) :
+  """Generate a tree of (empty) files, `filesPerDir` files in each
+  directory, with at most `dirsPerDir` sub-directories per directory.
+  An existing tree with the same shape is reused."""
+
+  markerPath = os.path.join(rootDir, f".tree-{numFiles}-{filesPerDir}")
+  if os.path.exists(markerPath) : return
+  if os.path.exists(rootDir) : shutil.rmtree(rootDir)
+
+  numDirs = max(1, (numFiles + filesPerDir - 1) // filesPerDir)
+  someDirs = [ rootDir ]
+  for i in range(1, numDirs) :
+    # directory i lives in directory (i-1)//dirsPerDir
+    someDirs.append(os.path.join(someDirs[(i - 1) // dirsPerDir], f"d{i}"))
+  numMade = 0
+  for aDir in someDirs :
+    os.makedirs(aDir, exist_ok=True)
+    for j in range(min(filesPerDir, numFiles - numMade)) :
+      open(os.path.join(aDir, f"f{j}.txt"), 'w').close()
+    numMade = numMade + filesPerDir
+  open(markerPath, 'w').close()
+
+async def benchmarkBackend(backendName, rootDir, numEvents) :
+  aWatcher = FSWatcher(backend=backendName)
+  manageTask = asyncio.create_task(aWatcher.managePathsToWatchQueue())
+
+  startTime = time.perf_counter()
+  await aWatcher.watchARootPath(rootDir)
+  await aWatcher.pathsToWatchQueue.join()
+  registerTime = time.perf_counter() - startTime
+  numWatches = aWatcher.getWatchStats()['numActiveWatches']
+
+  aWatcher.startReadingFileSystemEvents()
+  eventsDir = os.path.join(rootDir, 'd1')
+  latencies = [ ]
+  for i in range(numEvents) :
+    aPath = os.path.join(eventsDir, f"event{i}.txt")
+    with open(aPath, 'w') as f :
+      f.write("some text")
+    writtenTime = time.perf_counter()
+    while True :
+      anEvent = await aWatcher.fsWatchQueue.get()
+      if str(anEvent.path) == aPath : break
+    latencies.append(time.perf_counter() - writtenTime)
+  for i in range(numEvents) :
+    os.remove(os.path.join(eventsDir, f"event{i}.txt"))
+
+  aWatcher.stopWatchingFileSystem()
+  manageTask.cancel()
+  aWatcher.backend.close()
+  latencies.sort()
+  return {
+    'registerTime' : registerTime,
+    'numWatches'   : numWatches,
+    'median'       : statistics.median(latencies),
+    'p99'          : latencies[int(0.99 * (len(latencies) - 1))],
+    'max'          : latencies[-1],
+  }
+
+def main() :
+  argParser = argparse.ArgumentParser(
+    description="Compare the inotify and fanotify FSWatcher backends"
+  )
+  argParser.add_argument('-r', '--rootDir',
+    default='/tmp/cputils-benchmark-backends',
+    help="The directory in which to generate the tree"
+  )
+  argParser.add_argument('-n', '--numFiles', type=int, default=500000,
+    help="The number of files in the generated tree"
+  )
+  argParser.add_argument('-f', '--filesPerDir', type=int, default=100,
+    help="The number of files in each directory"
+  )
+  argParser.add_argument('-e', '--numEvents', type=int, default=200,
+    help="The number of events whose latency is measured"
+  )
+  argParser.add_argument('-k', '--keep', action='store_true',
+    help="Keep the generated tree (for later runs)"
+  )
+  cliArgs = argParser.parse_args()
+
+  startTime = time.perf_counter()
+  generateTree(cliArgs.rootDir, cliArgs.numFiles, cliArgs.filesPerDir)
+  print(f"tree     : {cliArgs.numFiles} files ({time.perf_counter() - startTime:.1f} s to generate)")
+
+  backendNames = [ 'inotify' ]
+  try :
+    FanotifyBackend().close()
+    backendNames.append('fanotify')
+  except OSError as err :
+    print(f"fanotify : not available ({err})")
+
+  try :
+    for aBackendName in backendNames :
+      results = asyncio.run(
+        benchmarkBackend(aBackendName, cliArgs.rootDir, cliArgs.numEvents)
+      )
+      print(f"{aBackendName:8} : register {results['registerTime']:.3f} s ({results['numWatches']} watches), latency median {results['median']*1e6:.0f} us, p99 {results['p99']*1e6:.0f} us, max {results['max']*1e6:.0f} us")
+  finally :
+    if not cliArgs.keep : shutil.rmtree(cliArgs.rootDir)
+
+if __name__ == "__main__" :
+  main()
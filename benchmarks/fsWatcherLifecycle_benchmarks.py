@@ -0,0 +1,96 @@
+"""
+A benchmark of how quickly `FSWatcher`s can be started and stopped.
+
+Each of a (large) number of watchers is created (as an async context
+manager), watches a small directory tree, starts reading events, computes
+a SHA256 check sum (so that its SHA256 workers are running), and is then
+closed. We measure the time taken by each start and each stop, and check
+that no tasks or file descriptors are leaked.
+
+Watchers are started and stopped one at a time, since (by default) a
+user may only have 128 inotify instances open at once (see
+`/proc/sys/fs/inotify/max_user_instances`).
+
+Stopping a watcher is dominated by the kernel releasing the watches of
+its inotify file descriptor (which `FSWatcher.close` does in a worker
+thread, so the event loop is not blocked).
+
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import time
+
+from cputils.fsWatcher import FSWatcher
+
+def countFds() :
+  return len(os.listdir('/proc/self/fd'))
+
+async def benchmarkLifecycle(rootDir, numWatchers) :
+  aPath = os.path.join(rootDir, 'a.txt')
+  startTimes = [ ]
+  stopTimes  = [ ]
+  numFds   = countFds()
+  numTasks = len(asyncio.all_tasks())
+  for i in range(numWatchers) :
+    startTime = time.perf_counter()
+    aWatcher  = FSWatcher()
+    async with aWatcher :
+      await aWatcher.watchARootPath(rootDir)
+      await aWatcher.pathsToWatchQueue.join()
+      aWatcher.startReadingFileSystemEvents()
+      await (await aWatcher.computeSHA256For(aPath))
+      stopTime = time.perf_counter()
+      startTimes.append(stopTime - startTime)
+    stopTimes.append(time.perf_counter() - stopTime)
+  return {
+    'startTimes'   : startTimes,
+    'stopTimes'    : stopTimes,
+    'leakedFds'    : countFds() - numFds,
+    'leakedTasks'  : len(asyncio.all_tasks()) - numTasks,
+  }
+
+def summarise(someTimes) :
+  someTimes = sorted(someTimes)
+  return f"median {statistics.median(someTimes)*1e3:.2f} ms, p99 {someTimes[int(0.99 * (len(someTimes) - 1))]*1e3:.2f} ms, total {sum(someTimes):.2f} s"
+
+def main() :
+  argParser = argparse.ArgumentParser(
+    description="Measure how quickly FSWatchers can be started and stopped"
+  )
+  argParser.add_argument('-r', '--rootDir',
+    default='/tmp/cputils-benchmark-lifecycle',
+    help="The directory in which to generate a small tree"
+  )
+  argParser.add_argument('-n', '--numWatchers', type=int, default=1000,
+    help="The number of watchers to start and stop"
+  )
+  argParser.add_argument('-d', '--numDirs', type=int, default=10,
+    help="The number of directories in the generated tree"
+  )
+  cliArgs = argParser.parse_args()
+
+  os.makedirs(cliArgs.rootDir, exist_ok=True)
+  for i in range(cliArgs.numDirs) :
+    os.makedirs(os.path.join(cliArgs.rootDir, f"d{i}"), exist_ok=True)
+  with open(os.path.join(cliArgs.rootDir, 'a.txt'), 'w') as f :
+    f.write("some text")
+
+  try :
+    startTime = time.perf_counter()
+    results   = asyncio.run(
+      benchmarkLifecycle(cliArgs.rootDir, cliArgs.numWatchers)
+    )
+    duration  = time.perf_counter() - startTime
+    print(f"watchers : {cliArgs.numWatchers} in {duration:.2f} s ({cliArgs.numWatchers / duration:.0f} per second)")
+    print(f"start    : {summarise(results['startTimes'])}")
+    print(f"stop     : {summarise(results['stopTimes'])}")
+    print(f"leaked   : {results['leakedFds']} file descriptors, {results['leakedTasks']} tasks")
+  finally :
+    shutil.rmtree(cliArgs.rootDir)
+
+if __name__ == "__main__" :
+  main()
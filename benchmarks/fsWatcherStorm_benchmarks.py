@@ -0,0 +1,266 @@
+"""
+A benchmark of an `FSWatcher` under (synthetic) file system storms.
+
+A directory tree of a configurable shape (its depth, the number of
+sub-directories of each directory, and the number of files) is generated
+in a tmpfs (by default in `/dev/shm`, so that the disk is not measured).
+The tree is watched, and then storms of creates, modifies, moves and
+deletes of files (spread across every directory of the tree) are driven
+from a worker thread, while the events are consumed (using
+`FSWatcher.watchForFileSystemEvents`) on the event loop.
+
+We measure:
+
+- the time taken to register the tree (and the number of watches used),
+
+- for each storm: the number of operations per second, the number of
+  events per second consumed, the latency (from just before each
+  operation until its event is consumed) percentiles, and the number of
+  operations whose events never arrived (dropped events, for example
+  because the inotify event queue overflowed),
+
+- the memory used: the resident set size after registration and after
+  the storms, and (optionally, since it slows everything down) the peak
+  Python allocations traced by `tracemalloc`.
+
+The results are emitted as JSON (to stdout, or to a file), so that runs of
+different releases can be compared.
+
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from asyncinotify import Mask
+
+from cputils.fsWatcher import FSWatcher, getEventPath
+
+stormKinds = ( 'create', 'modify', 'move', 'delete' )
+
+def generateTree(rootDir, depth, fanOut, numFiles) :
+  """Generate a tree `depth` directories deep, with `fanOut`
+  sub-directories in each (non leaf) directory, and spread `numFiles`
+  (empty) files evenly over its directories. Returns the list of the
+  tree's directories."""
+
+  if os.path.exists(rootDir) : shutil.rmtree(rootDir)
+  someDirs  = [ rootDir ]
+  someLeafs = [ rootDir ]
+  for aLevel in range(depth) :
+    newLeafs = [ ]
+    for aDir in someLeafs :
+      for i in range(fanOut) :
+        newLeafs.append(os.path.join(aDir, f"d{i}"))
+    someDirs.extend(newLeafs)
+    someLeafs = newLeafs
+  for aDir in someDirs : os.makedirs(aDir, exist_ok=True)
+  for i in range(numFiles) :
+    aDir = someDirs[i % len(someDirs)]
+    open(os.path.join(aDir, f"f{i}.txt"), 'w').close()
+  return someDirs
+
+def getRSS() :
+  """Return the current resident set size (in bytes)."""
+
+  with open('/proc/self/statm') as statmFile :
+    numPages = int(statmFile.read().split()[1])
+  return numPages * os.sysconf('SC_PAGE_SIZE')
+
+def getEventKind(aMask) :
+  """Return the kind of storm operation which generates an event."""
+
+  if Mask.ISDIR in aMask : return None
+  if Mask.CREATE in aMask : return 'create'
+  if Mask.MODIFY in aMask : return 'modify'
+  if Mask.MOVED_TO in aMask : return 'move'
+  if Mask.DELETE in aMask : return 'delete'
+  return None
+
+class StormState :
+  """The operations of the current storm which are still waiting for
+  their events."""
+
+  def __init__(self) :
+    self.pending      = { }
+    self.latencies    = [ ]
+    self.numEvents    = 0
+    self.lastTime     = 0.0
+
+  def eventConsumed(self, event) :
+    now = time.perf_counter()
+    self.numEvents = self.numEvents + 1
+    self.lastTime  = now
+    aKind = getEventKind(event.mask)
+    if aKind is None : return
+    startTime = self.pending.pop((aKind, getEventPath(event)), None)
+    if startTime is not None : self.latencies.append(now - startTime)
+
+def runStorm(aKind, someDirs, stormSize, aState) :
+  """Perform the operations of one storm (in a worker thread), recording
+  the time just before each operation in the storm's state."""
+
+  for i in range(stormSize) :
+    aDir     = someDirs[i % len(someDirs)]
+    aPath    = os.path.join(aDir, f"s{i}.txt")
+    movePath = os.path.join(aDir, f"m{i}.txt")
+    if aKind == 'create' :
+      aState.pending[(aKind, aPath)] = time.perf_counter()
+      open(aPath, 'w').close()
+    elif aKind == 'modify' :
+      aState.pending[(aKind, aPath)] = time.perf_counter()
+      with open(aPath, 'a') as aFile : aFile.write("some text")
+    elif aKind == 'move' :
+      aState.pending[(aKind, movePath)] = time.perf_counter()
+      os.rename(aPath, movePath)
+    else :
+      aState.pending[(aKind, movePath)] = time.perf_counter()
+      os.remove(movePath)
+
+def percentile(someValues, aFraction) :
+  if not someValues : return None
+  return someValues[int(aFraction * (len(someValues) - 1))]
+
+async def benchmarkStorms(
+  backendName, rootDir, someDirs, stormSize, settleTime
+) :
+  results = { }
+  rssBefore = getRSS()
+  async with FSWatcher(backend=backendName) as aWatcher :
+    startTime = time.perf_counter()
+    await aWatcher.watchARootPath(rootDir)
+    await aWatcher.pathsToWatchQueue.join()
+    results['backend']      = aWatcher.backend.name
+    results['registerTime'] = time.perf_counter() - startTime
+    results['numWatches']   = aWatcher.getWatchStats()['numActiveWatches']
+    results['rssRegistered'] = getRSS() - rssBefore
+
+    aState = StormState()
+    async def consumeEvents() :
+      async for event in aWatcher.watchForFileSystemEvents() :
+        aState.eventConsumed(event)
+    consumeTask = aWatcher.createTask(consumeEvents())
+
+    results['storms'] = { }
+    for aKind in stormKinds :
+      aState.__init__()
+      numOverflows = aWatcher.numOverflows
+      startTime = time.perf_counter()
+      await asyncio.to_thread(runStorm, aKind, someDirs, stormSize, aState)
+      opsTime = time.perf_counter() - startTime
+
+      # wait for the remaining events, until none have arrived for
+      # `settleTime` seconds
+      #
+      lastTime = time.perf_counter()
+      while aState.pending :
+        numLeft = len(aState.pending)
+        await asyncio.sleep(0.01)
+        if len(aState.pending) < numLeft : lastTime = time.perf_counter()
+        elif settleTime < time.perf_counter() - lastTime : break
+
+      someLatencies = sorted(aState.latencies)
+      eventsTime    = max(aState.lastTime - startTime, 1e-9)
+      results['storms'][aKind] = {
+        'numOps'       : stormSize,
+        'opsPerSec'    : stormSize / opsTime,
+        'numEvents'    : aState.numEvents,
+        'eventsPerSec' : aState.numEvents / eventsTime,
+        'latency'      : {
+          'p50'  : percentile(someLatencies, 0.5),
+          'p90'  : percentile(someLatencies, 0.9),
+          'p99'  : percentile(someLatencies, 0.99),
+          'max'  : percentile(someLatencies, 1.0),
+        },
+        'numDropped'   : len(aState.pending),
+        'numOverflows' : aWatcher.numOverflows - numOverflows,
+      }
+    consumeTask.cancel()
+    results['rssStorms'] = getRSS() - rssBefore
+    results['watchStats'] = aWatcher.getWatchStats()
+  return results
+
+def main() :
+  defaultRoot = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+  argParser = argparse.ArgumentParser(
+    description="Measure an FSWatcher under synthetic file system storms"
+  )
+  argParser.add_argument('-r', '--rootDir',
+    default=os.path.join(defaultRoot, 'cputils-benchmark-storm'),
+    help="The directory (ideally in a tmpfs) in which to generate the tree"
+  )
+  argParser.add_argument('-d', '--depth', type=int, default=3,
+    help="The depth of the generated tree"
+  )
+  argParser.add_argument('-f', '--fanOut', type=int, default=10,
+    help="The number of sub-directories of each (non leaf) directory"
+  )
+  argParser.add_argument('-n', '--numFiles', type=int, default=10000,
+    help="The number of files in the generated tree"
+  )
+  argParser.add_argument('-s', '--stormSize', type=int, default=5000,
+    help="The number of operations in each storm"
+  )
+  argParser.add_argument('-b', '--backend', default='inotify',
+    help="The FSWatcher backend (inotify, fanotify or auto)"
+  )
+  argParser.add_argument('-t', '--settleTime', type=float, default=1.0,
+    help="How long (in seconds) to wait for the last events of a storm"
+  )
+  argParser.add_argument('-m', '--tracemalloc', action='store_true',
+    help="Trace the peak Python allocations (slows everything down)"
+  )
+  argParser.add_argument('-o', '--output',
+    help="The file to which the JSON results are written (default stdout)"
+  )
+  cliArgs = argParser.parse_args()
+
+  startTime = time.perf_counter()
+  someDirs  = generateTree(
+    cliArgs.rootDir, cliArgs.depth, cliArgs.fanOut, cliArgs.numFiles
+  )
+  results = {
+    'python'   : platform.python_version(),
+    'platform' : platform.platform(),
+    'config'   : {
+      'depth'      : cliArgs.depth,
+      'fanOut'     : cliArgs.fanOut,
+      'numDirs'    : len(someDirs),
+      'numFiles'   : cliArgs.numFiles,
+      'stormSize'  : cliArgs.stormSize,
+      'settleTime' : cliArgs.settleTime,
+    },
+    'generateTime' : time.perf_counter() - startTime,
+  }
+
+  try :
+    if cliArgs.tracemalloc : tracemalloc.start()
+    results.update(asyncio.run(benchmarkStorms(
+      cliArgs.backend, cliArgs.rootDir, someDirs,
+      cliArgs.stormSize, cliArgs.settleTime
+    )))
+    if cliArgs.tracemalloc :
+      results['tracemallocPeak'] = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+    # ru_maxrss is in kilobytes (on Linux)
+    results['maxRSS'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+  finally :
+    shutil.rmtree(cliArgs.rootDir)
+
+  if cliArgs.output :
+    with open(cliArgs.output, 'w') as outputFile :
+      json.dump(results, outputFile, indent=2)
+  else :
+    json.dump(results, sys.stdout, indent=2)
+    print("")
+
+if __name__ == "__main__" :
+  main()
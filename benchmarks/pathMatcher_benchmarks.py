@@ -0,0 +1,94 @@
+"""
+A microbenchmark of the `cputils.pathMatcher.PathMatcher`.
+
+We compare the time taken to classify a large collection of (synthetic)
+relative paths using a (precompiled) `PathMatcher` against the time taken
+by a naive implementation which checks each path against each pattern
+using `fnmatch`.
+
+"""
+
+import argparse
+import fnmatch
+import random
+import time
+
+from cputils.pathMatcher import PathMatcher, commonExcludePatterns
+
+benchmarkPatterns = commonExcludePatterns + [
+  '*.o', '*.a', '*.so', '*.pyc', '*.log', '!important.log',
+  '/build', '/dist', 'docs/_build/', '**/tmp', '*.aux', '*.toc',
+]
+
+def generatePaths(numPaths, seed=42) :
+  """Generate a reproducible collection of relative paths."""
+
+  aRandom    = random.Random(seed)
+  dirNames   = [
+    'src', 'lib', 'docs', 'tests', 'build', 'tmp', 'node_modules',
+    '.git', '__pycache__', 'include', 'examples', 'paper'
+  ]
+  extensions = [ '.c', '.h', '.o', '.py', '.pyc', '.tex', '.log', '.md' ]
+  somePaths = [ ]
+  for i in range(numPaths) :
+    depth = aRandom.randint(0, 6)
+    parts = [ aRandom.choice(dirNames) for d in range(depth) ]
+    parts.append(f"file{i}{aRandom.choice(extensions)}")
+    somePaths.append('/'.join(parts))
+  return somePaths
+
+def naiveIsExcluded(somePatterns, relPath) :
+  """Check a path against each pattern in turn (last match wins)."""
+
+  isExcluded = False
+  for aPattern in somePatterns :
+    isNegated = aPattern.startswith('!')
+    if isNegated : aPattern = aPattern[1:]
+    aPattern = aPattern.rstrip('/')
+    if '/' in aPattern :
+      aPattern = aPattern.lstrip('/').replace('**/', '*')
+      if fnmatch.fnmatchcase(relPath, aPattern) :
+        isExcluded = not isNegated
+    elif fnmatch.fnmatchcase(relPath.rsplit('/', 1)[-1], aPattern) :
+      isExcluded = not isNegated
+  return isExcluded
+
+def timeIt(aFunc, somePaths) :
+  startTime = time.perf_counter()
+  numExcluded = 0
+  for aPath in somePaths :
+    if aFunc(aPath) : numExcluded += 1
+  return (time.perf_counter() - startTime, numExcluded)
+
+def main() :
+  argParser = argparse.ArgumentParser(
+    description="Benchmark the gitignore-style PathMatcher"
+  )
+  argParser.add_argument('-n', '--numPaths', type=int, default=500000,
+    help="The number of synthetic paths to classify"
+  )
+  cliArgs = argParser.parse_args()
+
+  somePaths = generatePaths(cliArgs.numPaths)
+
+  startTime = time.perf_counter()
+  aMatcher  = PathMatcher('/root', benchmarkPatterns)
+  compileTime = time.perf_counter() - startTime
+
+  matcherTime, matcherExcluded = timeIt(
+    lambda aPath : aMatcher.isExcluded(aPath), somePaths
+  )
+  naiveTime, naiveExcluded = timeIt(
+    lambda aPath : naiveIsExcluded(benchmarkPatterns, aPath), somePaths
+  )
+
+  numPaths = len(somePaths)
+  print(f"patterns : {len(benchmarkPatterns)}")
+  print(f"paths    : {numPaths}")
+  print(f"compile  : {compileTime*1e3:.3f} ms")
+  print(f"matcher  : {matcherTime:.3f} s ({numPaths/matcherTime:,.0f} paths/s, {matcherExcluded} excluded)")
+  print(f"naive    : {naiveTime:.3f} s ({numPaths/naiveTime:,.0f} paths/s, {naiveExcluded} excluded)")
+  print(f"speedup  : {naiveTime/matcherTime:.1f}x")
+
+if __name__ == "__main__" :
+  main()
@@ -0,0 +1,77 @@
+"""
+A (micro)benchmark of the settling timers (see `cputils.settlingTimerMixin`).
+
+We measure how many `unSettle` calls per second can be made, both on a
+single (busy) timer, and spread across many objects' timers (as happens
+during a registration storm), together with the number of asyncio tasks
+left running while the timers are unsettled.
+
+We also measure (using `tracemalloc`) the memory used by each named timer
+of a `SettlingTimerSet` holding thousands of timers (for example one per
+artefact).
+
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from cputils.settlingTimerMixin import mixinSettlingTimer, SettlingTimerSet
+
+class SimpleObject :
+  pass
+
+async def benchmarkUnSettle(numCalls, numObjects, timeOut) :
+  someObjects = [ SimpleObject() for i in range(numObjects) ]
+  for anObject in someObjects : mixinSettlingTimer(anObject, timeOut)
+  numTasks = len(asyncio.all_tasks())
+
+  startTime = time.perf_counter()
+  for i in range(numCalls) :
+    await someObjects[i % numObjects].unSettle()
+  duration = time.perf_counter() - startTime
+
+  numTimerTasks = len(asyncio.all_tasks()) - numTasks
+  for anObject in someObjects : await anObject.waitUntilSettled()
+  return duration, numTimerTasks
+
+def measureTimerMemory(numTimers) :
+  someNames = [ f"artefact{i}" for i in range(numTimers) ]
+  tracemalloc.start()
+  startSize = tracemalloc.get_traced_memory()[0]
+  timerSet  = SettlingTimerSet()
+  for aName in someNames : timerSet.addSettlingTimer(aName, 0.5)
+  numBytes = tracemalloc.get_traced_memory()[0] - startSize
+  tracemalloc.stop()
+  return numBytes / numTimers
+
+def main() :
+  argParser = argparse.ArgumentParser(
+    description="Measure the number of unSettle calls per second"
+  )
+  argParser.add_argument('-n', '--numCalls', type=int, default=200000,
+    help="The number of unSettle calls"
+  )
+  argParser.add_argument('-o', '--numObjects', type=int, default=1000,
+    help="The number of objects (each with a settling timer) unsettled"
+  )
+  argParser.add_argument('-t', '--timeOut', type=float, default=0.1,
+    help="The timeout (in seconds) of each settling timer"
+  )
+  argParser.add_argument('-m', '--numTimers', type=int, default=10000,
+    help="The number of named timers whose memory is measured"
+  )
+  cliArgs = argParser.parse_args()
+
+  for numObjects in [ 1, cliArgs.numObjects ] :
+    duration, numTimerTasks = asyncio.run(
+      benchmarkUnSettle(cliArgs.numCalls, numObjects, cliArgs.timeOut)
+    )
+    print(f"{numObjects:6} timers : {cliArgs.numCalls / duration:.0f} unSettle calls per second ({numTimerTasks} timer tasks)")
+
+  bytesPerTimer = measureTimerMemory(cliArgs.numTimers)
+  print(f"memory        : {bytesPerTimer:.0f} bytes per timer ({cliArgs.numTimers} named timers)")
+
+if __name__ == "__main__" :
+  main()
@@ -1,3 +1,4 @@
+import os
 import yaml
 
 from cputils.settlingTimerMixin import mixinSettlingTimer
@@ -5,19 +6,31 @@ from cputils.settlingTimerMixin import mixinSettlingTimer
 class ArtefactManager :
   """ The ComputePods Artefact Manager component. """
 
-  def __init__(self, natsClient) :
-    self.projects  = { }
-    self.targets   = { }
-    self.artefacts = { }
-    self.tasks     = { }
-    self.nc        = natsClient
+  def __init__(self, natsClient, projectRoot=None) :
+    """Create an artefact manager.
+
+    - `projectRoot` : the directory to which the artefact names (of the
+      registered tasks) are relative, so that absolute file paths can be
+      checked (see `isTaskDependency`).
+
+    """
+
+    self.projects    = { }
+    self.targets     = { }
+    self.artefacts   = { }
+    self.tasks       = { }
+    self.nc          = natsClient
+    self.projectRoot = None
+    if projectRoot is not None : self.projectRoot = os.path.abspath(projectRoot)
 
     mixinSettlingTimer(self)
     self.addSettlingTimer(
-      'projectRegistration', 0.5, self.projectRegistrationSettled
+      'projectRegistration', 0.5, self.projectRegistrationSettled,
+      adaptive=True, minTimeOut=0.15, maxTimeOut=5.0, maxWait=10.0
     )
     self.addSettlingTimer(
-      'taskRegistration', 0.5, self.taskRegistrationSettled
+      'taskRegistration', 0.5, self.taskRegistrationSettled,
+      adaptive=True, minTimeOut=0.15, maxTimeOut=5.0, maxWait=10.0
     )
 
   def getTargets(self) :
@@ -36,6 +49,24 @@ class ArtefactManager :
   def getTaskNames(self) :
     return sorted(self.tasks.keys())
 
+  def isTaskDependency(self, anArtefactName) :
+    """Returns True if the artefact is a (primary or secondary) dependency
+    of some registered task.
+
+    An absolute file path (as passed by the `FSWatcher`'s SHA256 queue,
+    see `cputils.hashQueue.HashQueue`) is first converted into an artefact
+    name relative to the `projectRoot` (a path outside of the project is
+    never a task dependency)."""
+
+    anArtefactName = str(anArtefactName)
+    if os.path.isabs(anArtefactName) :
+      if self.projectRoot is None : return False
+      anArtefactName = os.path.relpath(anArtefactName, self.projectRoot)
+      if anArtefactName.startswith('..') : return False
+    anArtefact = self.artefacts.get(anArtefactName)
+    if anArtefact is None : return False
+    return 'creates' in anArtefact or 'usedBy' in anArtefact
+
   async def taskRegistrationSettled(self) :
 
     await self.nc.sendMessage(
@@ -0,0 +1,198 @@
+"""
+Chunked hashing of (very) large files.
+
+A large file is hashed as a sequence of fixed size chunks. Each chunk is
+read into a single (reused) buffer, and its digest is recorded in a
+`ChunkManifest` together with a (fast) check digest of the chunk. The
+file's hash is the root of a Merkle tree of the chunk digests.
+
+The file is read (rather than memory-mapped), so a file which is
+truncated (by another process) while it is being hashed is simply hashed
+up to its new end, rather than killing the process with a SIGBUS.
+
+When a file which has been hashed before is re-hashed, only the check
+digests of its chunks are computed, and only those chunks whose check
+digests (or lengths) have changed are re-hashed. The check digests use
+the `fast` algorithm (see `cputils.hashAlgorithms`), so with the
+`fastHash` extra installed (`xxh3_128` or `blake3`) appending to, or
+modifying part of, a multi-gigabyte file costs a (much faster than
+SHA256) check pass plus the hashing of the changed chunks. Unlike a
+CRC32 checksum, a 128 bit (or longer) check digest makes reusing the
+digest of a changed chunk vanishingly unlikely. (Without the extra, the
+`fast` algorithm is `blake2b`, which, on CPUs with SHA extensions, is
+slower than `sha256`.) With `verify=True` every chunk is re-hashed.
+
+Note that a Merkle root is *not* the same as the hash of the whole file.
+
+"""
+
+import hashlib
+import os
+import struct
+
+from cputils.hashAlgorithms import newHash, resolveHashAlgorithm
+
+defaultChunkSize = 8 * 1024 * 1024
+
+# the manifest header: chunkSize, file size, number of chunks, algorithm
+# name length, check algorithm name length, check digest length
+manifestHeader = struct.Struct('=IQIBBB')
+
+class ChunkManifest :
+  """The per-chunk check digests and digests of a file, together with the
+  Merkle root of the digests."""
+
+  __slots__ = (
+    'algorithm', 'checkAlgorithm', 'chunkSize', 'size', 'checks', 'digests',
+    'root'
+  )
+
+  def __init__(
+    self, algorithm='sha256', chunkSize=defaultChunkSize, size=0,
+    checkAlgorithm='blake2b'
+  ) :
+    self.algorithm      = algorithm
+    self.checkAlgorithm = checkAlgorithm
+    self.chunkSize      = chunkSize
+    self.size           = size
+    self.checks         = [ ]
+    self.digests        = [ ]
+    self.root           = None
+
+  def __len__(self) :
+    return len(self.digests)
+
+  def getChunkLength(self, index) :
+    return min(self.chunkSize, self.size - index * self.chunkSize)
+
+  def toBytes(self) :
+    """Return a compact binary encoding of this manifest."""
+
+    algorithmName = self.algorithm.encode('ascii')
+    checkName     = self.checkAlgorithm.encode('ascii')
+    checkLen      = len(self.checks[0]) if self.checks else 0
+    someParts = [
+      manifestHeader.pack(
+        self.chunkSize, self.size, len(self.digests), len(algorithmName),
+        len(checkName), checkLen
+      ),
+      algorithmName,
+      checkName,
+    ]
+    someParts.extend(self.checks)
+    someParts.extend(self.digests)
+    return b''.join(someParts)
+
+  @classmethod
+  def fromBytes(cls, someBytes) :
+    """Decode a manifest encoded by `toBytes`."""
+
+    chunkSize, size, numChunks, nameLen, checkNameLen, checkLen = \
+      manifestHeader.unpack_from(someBytes)
+    offset    = manifestHeader.size
+    algorithm = someBytes[offset:offset+nameLen].decode('ascii')
+    offset    = offset + nameLen
+    checkAlgorithm = someBytes[offset:offset+checkNameLen].decode('ascii')
+    offset    = offset + checkNameLen
+    aManifest = cls(algorithm, chunkSize, size, checkAlgorithm)
+    aManifest.checks = [
+      bytes(someBytes[offset+i*checkLen:offset+(i+1)*checkLen])
+        for i in range(numChunks)
+    ]
+    offset    = offset + checkLen * numChunks
+    digestLen = hashlib.new(algorithm).digest_size
+    aManifest.digests = [
+      bytes(someBytes[offset+i*digestLen:offset+(i+1)*digestLen])
+        for i in range(numChunks)
+    ]
+    aManifest.root = merkleRoot(aManifest.digests, algorithm)
+    return aManifest
+
+def merkleRoot(someDigests, algorithm='sha256') :
+  """Return the (hex) root of the Merkle tree of a list of (binary)
+  digests. Each level hashes adjacent pairs of digests, an odd digest at
+  the end of a level is promoted unchanged. The root of an empty list is
+  the hash of no bytes."""
+
+  if not someDigests : return hashlib.new(algorithm).hexdigest()
+  aLevel = list(someDigests)
+  while 1 < len(aLevel) :
+    nextLevel = [ ]
+    for i in range(0, len(aLevel) - 1, 2) :
+      nextLevel.append(hashlib.new(algorithm, aLevel[i] + aLevel[i+1]).digest())
+    if len(aLevel) % 2 : nextLevel.append(aLevel[-1])
+    aLevel = nextLevel
+  if len(someDigests) == 1 :
+    # a single chunk is still hashed once more so that the root of a one
+    # chunk file differs from the digest of its contents
+    return hashlib.new(algorithm, aLevel[0]).hexdigest()
+  return aLevel[0].hex()
+
+def hashFileInChunks(
+  aPath, oldManifest=None, chunkSize=defaultChunkSize, algorithm='sha256',
+  verify=False, checkAlgorithm='fast'
+) :
+  """Hash a file in chunks. The digests of any chunks of the
+  `oldManifest` (of an earlier version of the same file) whose lengths
+  and check digests (using the `checkAlgorithm`, by default the `fast`
+  algorithm) are unchanged are re-used, unless `verify` is True.
+
+  Returns a tuple of the new `ChunkManifest` and the number of chunks
+  which were (re)hashed."""
+
+  checkAlgorithm = resolveHashAlgorithm(checkAlgorithm)
+  if oldManifest is not None and (
+    verify or oldManifest.chunkSize != chunkSize
+      or oldManifest.algorithm != algorithm
+      or oldManifest.checkAlgorithm != checkAlgorithm
+  ) :
+    oldManifest = None
+
+  numHashed = 0
+  aBuffer   = bytearray(chunkSize)
+  aView     = memoryview(aBuffer)
+  with open(aPath, 'rb', buffering=0) as aFile :
+    aManifest = ChunkManifest(
+      algorithm, chunkSize, os.fstat(aFile.fileno()).st_size, checkAlgorithm
+    )
+    size  = 0
+    index = 0
+    while True :
+      chunkLen = readChunk(aFile, aView)
+      if not chunkLen : break
+      aChunk = aView[:chunkLen]
+      aCheck = newHash(checkAlgorithm)
+      aCheck.update(aChunk)
+      aCheck = aCheck.digest()
+      aManifest.checks.append(aCheck)
+      if oldManifest is not None and index < len(oldManifest) \
+        and oldManifest.checks[index] == aCheck \
+        and oldManifest.getChunkLength(index) == chunkLen :
+        aManifest.digests.append(oldManifest.digests[index])
+      elif checkAlgorithm == algorithm :
+        aManifest.digests.append(aCheck)
+        numHashed = numHashed + 1
+      else :
+        aManifest.digests.append(hashlib.new(algorithm, aChunk).digest())
+        numHashed = numHashed + 1
+      aChunk.release()
+      size  = size + chunkLen
+      index = index + 1
+      if chunkLen < chunkSize : break
+    # the file may have changed size while it was being read
+    aManifest.size = size
+  aView.release()
+  aManifest.root = merkleRoot(aManifest.digests, algorithm)
+  return (aManifest, numHashed)
+
+def readChunk(aFile, aView) :
+  """Fill the buffer from the file (short reads are retried), returning
+  the number of bytes read, which is only less than the buffer's length at
+  the end of the file."""
+
+  numRead = 0
+  while numRead < len(aView) :
+    someRead = aFile.readinto(aView[numRead:])
+    if not someRead : break
+    numRead = numRead + someRead
+  return numRead
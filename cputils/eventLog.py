@@ -0,0 +1,182 @@
+"""
+Record, and replay, the events yielded by an `FSWatcher`.
+
+Real inotify timing can not be reproduced, so neither can performance
+problems in the code which consumes an `FSWatcher`'s events (debouncing,
+settling, ...). An `EventRecorder` writes each event yielded by a watcher
+(see `FSWatcher.recordEvents`), together with its (monotonic) time, to a
+compact binary log file. A `ReplayBackend` stands in for the inotify (or
+fanotify) backend of a watcher, and feeds the logged events back to the
+watcher (and so to its consumers) at their original speed, at an
+accelerated speed, or as fast as possible.
+
+The log file starts with a header (the `logMagic` and a format version),
+followed by one record for each event:
+
+- a record header (see `recordHeader`): the event's time (a double, in
+  seconds), mask, cookie, and the length of its path,
+
+- the (file system encoded) path itself.
+
+"""
+
+import asyncio
+import os
+from pathlib import Path
+import struct
+import time
+
+from asyncinotify import Mask
+
+from cputils.fsEvent import FSEvent
+
+logMagic     = b'CPEL'
+logVersion   = 1
+logHeader    = struct.Struct('=4sH')
+recordHeader = struct.Struct('=dIIH')
+
+class EventRecorder :
+  """Write events, with their (monotonic) times, to a log file.
+
+  - `logPath` : the path of the log file (which is overwritten).
+
+  """
+
+  def __init__(self, logPath) :
+    self.logPath     = logPath
+    self.logFile     = open(logPath, 'wb')
+    self.logFile.write(logHeader.pack(logMagic, logVersion))
+    self.numRecorded = 0
+
+  def record(self, event, aTime=None) :
+    """Record an event (at the `time.monotonic()` time `aTime`, by default
+    now). Events without a path are not recorded."""
+
+    aPath = getattr(event, 'pathStr', None)
+    if aPath is None :
+      if event.path is None : return
+      aPath = str(event.path)
+    if aTime is None : aTime = time.monotonic()
+    pathBytes = os.fsencode(aPath)
+    self.logFile.write(recordHeader.pack(
+      aTime, int(event.mask), event.cookie, len(pathBytes)
+    ))
+    self.logFile.write(pathBytes)
+    self.numRecorded = self.numRecorded + 1
+
+  def close(self) :
+    if not self.logFile.closed : self.logFile.close()
+
+  def __enter__(self) :
+    return self
+
+  def __exit__(self, excType, excValue, traceback) :
+    self.close()
+
+def readEventLog(logPath) :
+  """Return a generator of the `(time, FSEvent)` tuples recorded in
+  a log file. Raises ValueError if the file is not an event log."""
+
+  with open(logPath, 'rb') as logFile :
+    someBytes = logFile.read()
+  if len(someBytes) < logHeader.size :
+    raise ValueError(f"{logPath} is not an event log")
+  aMagic, aVersion = logHeader.unpack_from(someBytes)
+  if aMagic != logMagic or aVersion != logVersion :
+    raise ValueError(f"{logPath} is not a (version {logVersion}) event log")
+  return iterateEvents(someBytes)
+
+def iterateEvents(someBytes) :
+  offset    = logHeader.size
+  numBytes  = len(someBytes)
+  someMasks = { }
+  while offset + recordHeader.size <= numBytes :
+    aTime, aMask, aCookie, pathLen = recordHeader.unpack_from(someBytes, offset)
+    offset  = offset + recordHeader.size
+    aPath   = os.fsdecode(someBytes[offset:offset+pathLen])
+    offset  = offset + pathLen
+    theMask = someMasks.get(aMask)
+    if theMask is None : theMask = someMasks[aMask] = Mask(aMask)
+    yield (aTime, FSEvent(aPath, theMask, aCookie))
+
+class ReplayWatch :
+  """The (watch like) record of a path "watched" by a `ReplayBackend`."""
+
+  __slots__ = ( 'wd', 'path', 'mask' )
+
+  def __init__(self, wd, path, mask) :
+    self.wd   = wd
+    self.path = path
+    self.mask = mask
+
+class ReplayBackend :
+  """An `FSWatcher` backend which replays the events of a log file.
+
+  - `logPath` : the path of the log file (see `EventRecorder`).
+
+  - `speed` : the speed of the replay relative to the original events (so
+    `1` replays the events with their original timing, and `10` replays
+    them ten times faster). When `speed` is None, the events are replayed
+    as fast as they can be consumed.
+
+  Like fanotify, a replay does not need a watch per directory, so the
+  `FSWatcher` only "watches" each root path. Once every event has been
+  replayed, iterating the backend stops (and so the watcher's consumers
+  stop)."""
+
+  watchesDirectories = False
+  name               = 'replay'
+
+  def __init__(self, logPath, speed=1.0) :
+    self.logPath     = logPath
+    self.speed       = speed
+    self.events      = readEventLog(logPath)
+    self.startTime   = None
+    self.firstTime   = None
+    self.watches     = { }
+    self.nextWd      = 1
+    self.numReplayed = 0
+    self.isClosed    = False
+
+  def add_watch(self, aPath, aMask) :
+    aWatch = ReplayWatch(self.nextWd, Path(aPath), aMask)
+    self.watches[aWatch.wd] = aWatch
+    self.nextWd = self.nextWd + 1
+    return aWatch
+
+  def rm_watch(self, aWatch) :
+    self.watches.pop(aWatch.wd, None)
+
+  def close(self) :
+    self.isClosed = True
+    self.events.close()
+
+  def __enter__(self) :
+    return self
+
+  def __exit__(self, excType, excValue, traceback) :
+    self.close()
+
+  def __aiter__(self) :
+    return self
+
+  async def __anext__(self) :
+    if self.isClosed : raise StopAsyncIteration
+    try :
+      aTime, event = next(self.events)
+    except StopIteration :
+      raise StopAsyncIteration
+    if self.speed :
+      loop = asyncio.get_running_loop()
+      if self.startTime is None :
+        self.startTime = loop.time()
+        self.firstTime = aTime
+      # keep to the (absolute) schedule, so that delays do not accumulate
+      delay = self.startTime + (aTime - self.firstTime) / self.speed \
+        - loop.time()
+      if 0 < delay : await asyncio.sleep(delay)
+    else :
+      # let the consumers keep up
+      await asyncio.sleep(0)
+    self.numReplayed = self.numReplayed + 1
+    return event
@@ -0,0 +1,180 @@
+"""
+In-process file hashing.
+
+Files are read, in large chunks, into a (re-used) buffer which is fed to
+a `hashlib` hash object. Both reading a file and hashing a large buffer
+release Python's GIL, so a `FileHasher` can hash several files in
+parallel using a pool of worker threads.
+
+A `HashCache` remembers the hashes of recently hashed files together with
+their (inode, mtime_ns, size) signatures, so that a file whose signature
+has not changed is not hashed again.
+
+Any `hashlib` algorithm can be used. To decide if a file has changed, a
+cryptographic hash is not needed, so the (much faster) non-cryptographic
+`xxhash` algorithms (`xxh3_64`, `xxh3_128`, `xxh64`, ...), and `blake3`,
+can also be used if the optional `xxhash` and `blake3` packages are
+installed. The `fast` algorithm is the fastest available of `xxh3_128`,
+`blake3` and (the always available) `blake2b`. (On CPUs with SHA
+extensions, `sha256` may be faster than `blake2b`; use
+`benchmarks/fileHasher_benchmarks.py` to compare the algorithms.)
+
+"""
+
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from cputils.fsSnapshot import statSignature
+from cputils.hashAlgorithms import (
+  fastHashAlgorithms, isHashAlgorithmAvailable, newHash, resolveHashAlgorithm
+)
+
+defaultChunkSize = 1024 * 1024
+
+def hashFile(aPath, algorithm='sha256', chunkSize=defaultChunkSize) :
+  """Return the (hex) digest of the contents of a file."""
+
+  aHash   = newHash(algorithm)
+  aBuffer = bytearray(chunkSize)
+  aView   = memoryview(aBuffer)
+  with open(aPath, 'rb', buffering=0) as aFile :
+    while True :
+      numRead = aFile.readinto(aBuffer)
+      if not numRead : break
+      aHash.update(aView[:numRead])
+  return aHash.hexdigest()
+
+def hashFileWithSignature(
+  aPath, algorithm='sha256', chunkSize=defaultChunkSize
+) :
+  """Return a tuple of the (hex) digest of the contents of a file, and
+  the file's signature (see `cputils.fsSnapshot.statSignature`). The
+  signature is None if the file changed while it was being hashed."""
+
+  aHash   = newHash(algorithm)
+  aBuffer = bytearray(chunkSize)
+  aView   = memoryview(aBuffer)
+  with open(aPath, 'rb', buffering=0) as aFile :
+    aSignature = statSignature(os.fstat(aFile.fileno()))
+    while True :
+      numRead = aFile.readinto(aBuffer)
+      if not numRead : break
+      aHash.update(aView[:numRead])
+    if statSignature(os.fstat(aFile.fileno())) != aSignature :
+      aSignature = None
+  return (aHash.hexdigest(), aSignature)
+
+class HashCache :
+  """A bounded, least recently used, cache of file hashes, each of which
+  is only valid while its file's signature is unchanged.
+
+  - `maxEntries` : the maximum number of hashes to remember.
+
+  """
+
+  def __init__(self, maxEntries=65536) :
+    self.maxEntries   = max(1, maxEntries)
+    self.entries      = collections.OrderedDict()
+    self.numHits      = 0
+    self.numMisses    = 0
+    self.numEvictions = 0
+
+  def __len__(self) :
+    return len(self.entries)
+
+  def get(self, aPath, aSignature) :
+    """Return the cached hash of the path if the path's signature is
+    unchanged (or None)."""
+
+    anEntry = self.entries.get(aPath)
+    if anEntry is None or anEntry[0] != aSignature :
+      self.numMisses = self.numMisses + 1
+      return None
+    self.entries.move_to_end(aPath)
+    self.numHits = self.numHits + 1
+    return anEntry[1]
+
+  def getLastHash(self, aPath) :
+    """Return the most recently cached hash of the path, whatever its
+    signature (or None). This does not count as a hit or a miss."""
+
+    anEntry = self.entries.get(aPath)
+    if anEntry is None : return None
+    return anEntry[1]
+
+  def put(self, aPath, aSignature, aHash) :
+    self.entries[aPath] = (aSignature, aHash)
+    self.entries.move_to_end(aPath)
+    if self.maxEntries < len(self.entries) :
+      self.entries.popitem(last=False)
+      self.numEvictions = self.numEvictions + 1
+
+  def discard(self, aPath) :
+    self.entries.pop(aPath, None)
+
+  def getStats(self) :
+    return {
+      'numCachedHashes'  : len(self.entries),
+      'numHashHits'      : self.numHits,
+      'numHashMisses'    : self.numMisses,
+      'numHashEvictions' : self.numEvictions,
+    }
+
+class FileHasher :
+  """Hash files using a pool of worker threads.
+
+  - `numWorkers` : the number of worker threads (and so the number of
+    files which can be hashed at the same time).
+
+  - `algorithm` : the name of the hash algorithm to use (see
+    `resolveHashAlgorithm`).
+
+  - `chunkSize` : the number of bytes read (and hashed) at a time.
+
+  - `hashCache` : an optional `HashCache` used to avoid re-hashing files
+    whose signatures have not changed.
+
+  - `executor` : an optional (shared) `concurrent.futures.Executor` used
+    instead of this hasher's own pool of `numWorkers` threads.
+
+  """
+
+  def __init__(
+    self, numWorkers=3, algorithm='sha256', chunkSize=defaultChunkSize,
+    hashCache=None, executor=None
+  ) :
+    self.numWorkers = max(1, numWorkers)
+    self.algorithm  = resolveHashAlgorithm(algorithm)
+    self.chunkSize  = chunkSize
+    self.hashCache  = hashCache
+    self.ownsExecutor = executor is None
+    if executor is None :
+      executor = ThreadPoolExecutor(
+        max_workers=self.numWorkers, thread_name_prefix='FileHasher'
+      )
+    self.executor   = executor
+
+  async def hashFile(self, aPath) :
+    """Return the (hex) digest of a file, which is hashed in one of the
+    worker threads unless its hash is cached."""
+
+    aPath = str(aPath)
+    loop  = asyncio.get_running_loop()
+    if self.hashCache is None :
+      return await loop.run_in_executor(
+        self.executor, hashFile, aPath, self.algorithm, self.chunkSize
+      )
+
+    aHash = self.hashCache.get(aPath, statSignature(os.stat(aPath)))
+    if aHash is not None : return aHash
+    aHash, aSignature = await loop.run_in_executor(
+      self.executor, hashFileWithSignature, aPath, self.algorithm,
+      self.chunkSize
+    )
+    if aSignature is not None : self.hashCache.put(aPath, aSignature, aHash)
+    return aHash
+
+  def shutdown(self, wait=True) :
+    if self.ownsExecutor : self.executor.shutdown(wait=wait)
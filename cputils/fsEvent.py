@@ -0,0 +1,52 @@
+"""
+The (lazy path) file system event shared by the `FSWatcher` and its
+backends.
+
+The `FSWatcher` consumes `asyncinotify.Event`s, but the events found by
+rescanning a tree, read from fanotify (see `cputils.fsWatcherBackends`),
+or replayed from an event log (see `cputils.eventLog`) are not read from
+inotify. All of these are `FSEvent`s.
+
+"""
+
+import os
+from pathlib import Path
+
+from asyncinotify import Mask
+
+class FSEvent :
+  """A file system event which has not been read from inotify (for
+  example, a change found by rescanning a tree, an event read from
+  fanotify, or an event replayed from a log).
+
+  An `FSEvent` has the same `path`, `mask`, `cookie`, `name` and `watch`
+  attributes as an `asyncinotify.Event`. To keep events cheap, the path
+  is kept as a string (`pathStr`), and is only converted to a `Path`
+  when the `path` (or `name`) is first used."""
+
+  __slots__ = ( 'pathStr', 'pathObj', 'mask', 'cookie', 'watch' )
+
+  def __init__(self, path, mask, cookie=0, watch=None) :
+    if path is not None : path = os.fspath(path)
+    self.pathStr = path
+    self.pathObj = None
+    self.mask    = mask if type(mask) is Mask else Mask(mask)
+    self.cookie  = cookie
+    self.watch   = watch
+
+  @property
+  def path(self) :
+    if self.pathObj is None and self.pathStr is not None :
+      self.pathObj = Path(self.pathStr)
+    return self.pathObj
+
+  @property
+  def name(self) :
+    if self.pathStr is None : return None
+    return Path(os.path.basename(self.pathStr))
+
+  def __contains__(self, value) :
+    return value in self.mask
+
+  def __repr__(self) :
+    return f"<FSEvent path={self.path!r} mask={self.mask!r}>"
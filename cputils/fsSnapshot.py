@@ -0,0 +1,393 @@
+"""
+A (stat based) snapshot of a file system tree.
+
+An `FSSnapshot` records the (inode, mtime_ns, size) signature of every
+file and directory in one or more directory trees. Two snapshots of the
+same tree can be compared to determine exactly which paths have been
+created, modified or deleted between the times the snapshots were taken.
+
+A snapshot can also record a (content) hash, and the chunk manifest (see
+`cputils.chunkedHasher`), of any of its files, and can be saved to (and
+loaded from) a compact SQLite database, so that the changes made to a
+tree while it was not being watched can be found.
+
+"""
+
+import os
+from pathlib import Path
+import sqlite3
+import stat
+
+from cputils.chunkedHasher import ChunkManifest
+
+# The version of the SQLite database format used by `FSSnapshot.save`
+# (version 2 added the manifests table, version 3 replaced the manifests'
+# CRC32 checksums with check digests) and the versions `FSSnapshot.load`
+# can read (the manifests of versions 1 and 2 are not loaded)
+snapshotFormatVersion    = 3
+compatibleFormatVersions = ( '1', '2', '3' )
+
+class FSSnapshot :
+  """A mapping of (string) paths to their (inode, mtime_ns, size, isDir)
+  signatures.
+
+  The `children` index maps each directory to the set of its (recorded)
+  children, so that the paths at or below a path can be found (see
+  `iterateTree`) without checking every recorded path. The index may
+  also hold paths which are no longer recorded."""
+
+  def __init__(self) :
+    self.entries   = { }
+    self.hashes    = { }
+    self.manifests = { }
+    self.children  = { }
+
+  def __len__(self) :
+    return len(self.entries)
+
+  def __contains__(self, aPath) :
+    return str(aPath) in self.entries
+
+  def get(self, aPath) :
+    return self.entries.get(str(aPath))
+
+  def getHash(self, aPath) :
+    """Return the recorded hash of the path (or None)."""
+
+    return self.hashes.get(str(aPath))
+
+  def setHash(self, aPath, aHash, aSignature=None) :
+    """Record the hash of the path. If the signature of the path's
+    contents, when hashed, is supplied and it differs from the recorded
+    signature, the hash is ignored (the file has changed since it was
+    hashed)."""
+
+    aPath = str(aPath)
+    if aSignature is not None and self.entries.get(aPath) != aSignature :
+      return
+    self.hashes[aPath] = aHash
+
+  def getManifest(self, aPath) :
+    """Return the recorded (`cputils.chunkedHasher.ChunkManifest`) chunk
+    manifest of the path (or None).
+
+    Unlike a hash, a manifest is kept when its path's signature changes,
+    so that it can be used to re-hash only the changed chunks of the
+    path."""
+
+    return self.manifests.get(str(aPath))
+
+  def setManifest(self, aPath, aManifest) :
+    self.manifests[str(aPath)] = aManifest
+
+  def indexPath(self, aPath) :
+    """Add the path to the `children` index, linking in any of its parent
+    directories which have not yet been indexed."""
+
+    children = self.children
+    while True :
+      aParent = os.path.dirname(aPath)
+      if aParent == aPath : return
+      someChildren = children.get(aParent)
+      if someChildren is not None :
+        someChildren.add(aPath)
+        return
+      children[aParent] = { aPath }
+      aPath = aParent
+
+  def iterateTree(self, aPath) :
+    """Return a generator of the recorded paths at or below the path."""
+
+    aPath    = str(aPath).rstrip('/')
+    entries  = self.entries
+    children = self.children
+    pathsToVisit = [ aPath ]
+    while pathsToVisit :
+      aPath = pathsToVisit.pop()
+      if aPath in entries : yield aPath
+      someChildren = children.get(aPath)
+      if someChildren : pathsToVisit.extend(someChildren)
+
+  def scanTree(self, rootPath, pathMatcher=None) :
+    """Add the signatures of all of the files and directories at or below
+    the root path, pruning any directories excluded by the (optional)
+    `cputils.pathMatcher.PathMatcher`.
+
+    Any existing signatures below the root path are replaced. Returns the
+    number of paths scanned."""
+
+    rootPath = str(rootPath).rstrip('/')
+    self.removeTree(rootPath)
+
+    try :
+      rootStat = os.stat(rootPath)
+    except OSError :
+      return 0
+    self.entries[rootPath] = statSignature(rootStat)
+    self.indexPath(rootPath)
+    if not stat.S_ISDIR(rootStat.st_mode) : return 1
+
+    relRoot = None
+    if pathMatcher is not None and not pathMatcher.isEmpty() :
+      relRoot = pathMatcher.relativePath(rootPath)
+
+    entries    = self.entries
+    children   = self.children
+    numScanned = 1
+    dirsToScan = [ (rootPath, relRoot) ]
+    while dirsToScan :
+      aDir, relDir = dirsToScan.pop()
+      dirChildren = [ ]
+      try :
+        with os.scandir(aDir) as dirEntries :
+          for anEntry in dirEntries :
+            isDir   = anEntry.is_dir(follow_symlinks=False)
+            relPath = None
+            if relDir is not None :
+              relPath = relDir + '/' + anEntry.name if relDir else anEntry.name
+              if not pathMatcher.isIncluded(relPath, isDir) : continue
+            try :
+              entries[anEntry.path] = statSignature(
+                anEntry.stat(follow_symlinks=False)
+              )
+            except OSError :
+              continue
+            dirChildren.append(anEntry.path)
+            numScanned = numScanned + 1
+            if isDir : dirsToScan.append((anEntry.path, relPath))
+      except (FileNotFoundError, NotADirectoryError, PermissionError) :
+        pass
+      if dirChildren : children.setdefault(aDir, set()).update(dirChildren)
+    return numScanned
+
+  def updatePath(self, aPath) :
+    """(Re)record the signature of a single path (which is forgotten if
+    it no longer exists)."""
+
+    aPath = str(aPath)
+    try :
+      aSignature = statSignature(os.stat(aPath, follow_symlinks=False))
+    except OSError :
+      self.entries.pop(aPath, None)
+      self.hashes.pop(aPath, None)
+      self.manifests.pop(aPath, None)
+      return
+    oldSignature = self.entries.get(aPath)
+    if oldSignature is None : self.indexPath(aPath)
+    if oldSignature != aSignature :
+      self.hashes.pop(aPath, None)
+    self.entries[aPath] = aSignature
+
+  def removeTree(self, aPath) :
+    """Forget the signatures of the path and of every path below it."""
+
+    aPath    = str(aPath).rstrip('/')
+    children = self.children
+    aParent  = os.path.dirname(aPath)
+    siblings = children.get(aParent)
+    if siblings is not None :
+      siblings.discard(aPath)
+      if not siblings : del children[aParent]
+    pathsToRemove = [ aPath ]
+    while pathsToRemove :
+      aPath = pathsToRemove.pop()
+      self.entries.pop(aPath, None)
+      self.hashes.pop(aPath, None)
+      self.manifests.pop(aPath, None)
+      someChildren = children.pop(aPath, None)
+      if someChildren : pathsToRemove.extend(someChildren)
+
+  def subSnapshot(self, aPath) :
+    """Return a new snapshot containing only the signatures of the path
+    and of every path below it."""
+
+    aSnapshot = FSSnapshot()
+    for anEntryPath in self.iterateTree(aPath) :
+      aSnapshot.entries[anEntryPath] = self.entries[anEntryPath]
+      aSnapshot.indexPath(anEntryPath)
+      aHash = self.hashes.get(anEntryPath)
+      if aHash is not None : aSnapshot.hashes[anEntryPath] = aHash
+      aManifest = self.manifests.get(anEntryPath)
+      if aManifest is not None : aSnapshot.manifests[anEntryPath] = aManifest
+    return aSnapshot
+
+  def merge(self, otherSnapshot) :
+    """Merge the entries of another snapshot into this snapshot. Recorded
+    hashes are kept only while the signature of their path is
+    unchanged."""
+
+    for aPath, aSignature in otherSnapshot.entries.items() :
+      oldSignature = self.entries.get(aPath)
+      if oldSignature is None : self.indexPath(aPath)
+      if oldSignature != aSignature :
+        self.hashes.pop(aPath, None)
+    self.entries.update(otherSnapshot.entries)
+    self.hashes.update(otherSnapshot.hashes)
+    self.manifests.update(otherSnapshot.manifests)
+
+  def replaceTree(self, aPath, newSnapshot) :
+    """Replace the entries at or below the path with those of a newer
+    snapshot of the same tree, keeping the recorded hashes of any paths
+    whose signatures are unchanged (and the manifests of any paths which
+    still exist)."""
+
+    aPath         = str(aPath).rstrip('/')
+    newEntries    = newSnapshot.entries
+    keptHashes    = { }
+    keptManifests = { }
+    for anEntryPath in self.iterateTree(aPath) :
+      aHash = self.hashes.get(anEntryPath)
+      if aHash is not None and \
+        newEntries.get(anEntryPath) == self.entries[anEntryPath] :
+        keptHashes[anEntryPath] = aHash
+      aManifest = self.manifests.get(anEntryPath)
+      if aManifest is not None and anEntryPath in newEntries :
+        keptManifests[anEntryPath] = aManifest
+    self.removeTree(aPath)
+    self.merge(newSnapshot)
+    self.hashes.update(keptHashes)
+    self.manifests.update(keptManifests)
+
+  def save(self, dbPath) :
+    """Save this snapshot to a (new) SQLite database.
+
+    The database is written to a temporary file which then (atomically)
+    replaces any existing database."""
+
+    dbPath  = str(dbPath)
+    tmpPath = dbPath + '.tmp'
+    if os.path.exists(tmpPath) : os.remove(tmpPath)
+    dbDir = os.path.dirname(dbPath)
+    if dbDir : os.makedirs(dbDir, exist_ok=True)
+
+    hashes = self.hashes
+    db = sqlite3.connect(tmpPath)
+    try :
+      db.execute("PRAGMA journal_mode = OFF")
+      db.execute("PRAGMA synchronous = OFF")
+      db.execute("CREATE TABLE meta ( key TEXT PRIMARY KEY, value TEXT )")
+      db.execute("""
+        CREATE TABLE entries (
+          path    TEXT PRIMARY KEY,
+          inode   INTEGER,
+          mtimeNs INTEGER,
+          size    INTEGER,
+          isDir   INTEGER,
+          hash    TEXT
+        ) WITHOUT ROWID
+      """)
+      db.execute("""
+        CREATE TABLE manifests (
+          path     TEXT PRIMARY KEY,
+          manifest BLOB
+        ) WITHOUT ROWID
+      """)
+      db.execute(
+        "INSERT INTO meta VALUES ('version', ?)", (str(snapshotFormatVersion),)
+      )
+      db.executemany(
+        "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+        (
+          (aPath, sig[0], sig[1], sig[2], int(sig[3]), hashes.get(aPath))
+            for aPath, sig in self.entries.items()
+        )
+      )
+      db.executemany(
+        "INSERT INTO manifests VALUES (?, ?)",
+        (
+          (aPath, aManifest.toBytes())
+            for aPath, aManifest in self.manifests.items()
+              if aPath in self.entries
+        )
+      )
+      db.commit()
+    finally :
+      db.close()
+    os.replace(tmpPath, dbPath)
+
+  def load(self, dbPath, rootPath=None) :
+    """Load the entries (at or below the optional root path) saved in a
+    SQLite database by `save`, merging them into this snapshot.
+
+    Returns the number of entries loaded (a missing, unreadable or
+    incompatible database loads nothing)."""
+
+    dbPath = str(dbPath)
+    if not os.path.exists(dbPath) : return 0
+
+    query  = "SELECT path, inode, mtimeNs, size, isDir, hash FROM entries"
+    manifestQuery = "SELECT path, manifest FROM manifests"
+    params = ( )
+    if rootPath is not None :
+      rootPath = str(rootPath).rstrip('/')
+      # all paths below the root path sort between "root/" and "root0"
+      # ('0' is the character after '/')
+      whereClause   = " WHERE path = ? OR ( ? < path AND path < ? )"
+      query         = query + whereClause
+      manifestQuery = manifestQuery + whereClause
+      params = ( rootPath, rootPath + '/', rootPath + '0' )
+
+    numLoaded = 0
+    try :
+      dbURI = Path(dbPath).resolve().as_uri() + "?mode=ro"
+      db = sqlite3.connect(dbURI, uri=True)
+    except sqlite3.Error :
+      return 0
+    try :
+      aVersion = db.execute(
+        "SELECT value FROM meta WHERE key = 'version'"
+      ).fetchone()
+      if aVersion is None or aVersion[0] not in compatibleFormatVersions :
+        return 0
+      entries = self.entries
+      hashes  = self.hashes
+      for aPath, inode, mtimeNs, size, isDir, aHash in db.execute(query, params) :
+        if aPath not in entries : self.indexPath(aPath)
+        entries[aPath] = (inode, mtimeNs, size, bool(isDir))
+        if aHash is not None : hashes[aPath] = aHash
+        numLoaded = numLoaded + 1
+      if aVersion[0] == str(snapshotFormatVersion) :
+        for aPath, aManifest in db.execute(manifestQuery, params) :
+          self.manifests[aPath] = ChunkManifest.fromBytes(aManifest)
+    except sqlite3.Error :
+      return 0
+    finally :
+      db.close()
+    return numLoaded
+
+  def diff(self, newSnapshot) :
+    """Compare this (old) snapshot with a newer snapshot of the same
+    trees.
+
+    Returns a tuple of three lists of (path, isDir) pairs: the created,
+    modified and deleted paths. A path whose inode has changed (for
+    example, a file replaced by an editor's "atomic save") is reported as
+    modified. Modified directories are not reported (their changes are
+    reported as changes to the paths they contain)."""
+
+    oldEntries = self.entries
+    newEntries = newSnapshot.entries
+    created  = [ ]
+    modified = [ ]
+    deleted  = [ ]
+    for aPath, newSignature in newEntries.items() :
+      oldSignature = oldEntries.get(aPath)
+      if oldSignature is None :
+        created.append((aPath, newSignature[3]))
+      elif oldSignature != newSignature and not newSignature[3] :
+        modified.append((aPath, newSignature[3]))
+    for aPath, oldSignature in oldEntries.items() :
+      if aPath not in newEntries :
+        deleted.append((aPath, oldSignature[3]))
+    return (created, modified, deleted)
+
+def statSignature(aStat) :
+  """Return the (inode, mtime_ns, size, isDir) signature of an
+  `os.stat_result`."""
+
+  return (
+    aStat.st_ino,
+    aStat.st_mtime_ns,
+    aStat.st_size,
+    stat.S_ISDIR(aStat.st_mode)
+  )
@@ -11,13 +11,45 @@
 
 import asyncio
 from asyncinotify import Inotify, Event, Mask
+import errno
 import logging
+import os
 from pathlib import Path
 import sys
+import threading
+import time
 import traceback
 
+from cputils.chunkedHasher import defaultChunkSize, hashFileInChunks
+from cputils.eventLog import EventRecorder
+from cputils.fsEvent import FSEvent
+from cputils.fileHasher import FileHasher, HashCache, resolveHashAlgorithm
+from cputils.fsSnapshot import FSSnapshot
+from cputils.fsWatcherBackends import createBackend
+from cputils.hashQueue import HashQueue, copyFutureResult
+from cputils.pathMatcher import PathMatcher
+from cputils.pollingScanner import PollingScanner
+from cputils.watchMetrics import TimedQueue, WatchMetrics
+from cputils.watchPathTrie import WatchPathTrie
+
 NUM_SHA256_WORKERS = 3
 
+# The file which contains the system's limit on the number of inotify
+# watches per user, and the limit assumed if it can not be read
+#
+maxUserWatchesPath    = "/proc/sys/fs/inotify/max_user_watches"
+defaultMaxUserWatches = 8192
+
+def getMaxUserWatches() :
+  """Return the system's limit on the number of inotify watches which
+  may be held by (all of the processes of) one user."""
+
+  try :
+    with open(maxUserWatchesPath) as limitFile :
+      return int(limitFile.read().strip())
+  except (OSError, ValueError) :
+    return defaultMaxUserWatches
+
 # We want Mask.MASK_ADD so that watches are updated
 # For the purposes of ComputePods we only care about:
 # Mask.CREATE, Mask.MODIFY, Mask.MOVE, and Mask.DELETE
@@ -51,49 +83,411 @@ mask2text = {
   int(Mask.ISDIR | Mask.DELETE) : 'DeletedDir',
 }
 
+# The names of the masks seen so far (see `getMaskName`). Building a
+# name is slow (every `Mask` operation creates a new enum member), and
+# only a handful of distinct masks occur in practice, so each name is
+# only built once.
+#
+maskNames    = { }
+maxMaskNames = 4096
+
+def buildMaskName(aMask) :
+  someNames = [
+    aPotentialName for aPotentialMask, aPotentialName in mask2text.items()
+      if aMask & aPotentialMask
+  ]
+  return ' '.join(someNames)
+
 def getMaskName(aMask) :
   """ Translate a raw Mask number into a human readable name. """
 
-  maskName = ""
-  for aPotentialMask, aPotentialName in mask2text.items() :
-    if aMask & aPotentialMask :
-      maskName = maskName + ' ' + aPotentialName
-  return maskName.lstrip()
+  aMask    = int(aMask)
+  maskName = maskNames.get(aMask)
+  if maskName is None :
+    maskName = buildMaskName(aMask)
+    if len(maskNames) < maxMaskNames : maskNames[aMask] = maskName
+  return maskName
 
-def get_directories_recursive(path) :
+# Pre-compute the names of the masks of the events we expect to see
+for aMask in list(mask2text) + [ int(aFlag) for aFlag in cpMask ] :
+  for anIsDir in ( 0, int(Mask.ISDIR) ) :
+    getMaskName(aMask | anIsDir)
+
+class WalkStats :
+  """ Counts the work done by `get_directories_recursive`.
+
+  The `numStatsSaved` counter records the number of `stat` system calls
+  which the original `Path.is_dir()`/`Path.is_file()` based walk would
+  have made, but which have been avoided by re-using the file type
+  information returned by `os.scandir`. """
+
+  def __init__(self) :
+    self.numDirs       = 0
+    self.numFiles      = 0
+    self.numPruned     = 0
+    self.numStatsSaved = 0
+
+  def clear(self) :
+    self.numDirs       = 0
+    self.numFiles      = 0
+    self.numPruned     = 0
+    self.numStatsSaved = 0
+
+def get_directories_recursive(path, walkStats=None, pathMatcher=None) :
   """
-  Recursively list all directories under path, including path itself, if
-  it's a directory.
+  List all directories under path, including path itself, if it's a
+  directory. If path is a file, then only the path itself is yielded.
 
   The path itself is always yielded before its children are iterated, so you
   can pre-process a path (by watching it with inotify) before you get the
   directory listing.
+
+  The walk is iterative (it uses an explicit stack of directories rather
+  than recursion) so very deep trees can not exhaust Python's recursion
+  limit. Each directory is listed using `os.scandir`, whose `DirEntry`
+  objects carry the file type read from the directory itself, so (on most
+  Linux file systems) no `stat` call is needed to decide if an entry is a
+  sub-directory. Plain files below path are counted (in the optional
+  `walkStats`) but never yielded, and symbolic links are not followed.
+
+  If a (`cputils.pathMatcher`) `pathMatcher` is supplied, any directories
+  it excludes are pruned from the walk (and counted in the `walkStats`).
   """
 
-  if path.is_dir() :
-    yield path
-    for child in path.iterdir():
-      yield from get_directories_recursive(child)
-  elif path.is_file() :
-    yield path
+  if walkStats is None : walkStats = WalkStats()
+
+  path = Path(path)
+  if not path.is_dir() :
+    if path.is_file() : yield path
+    return
+
+  relPath = None
+  if pathMatcher is not None and not pathMatcher.isEmpty() :
+    relPath = pathMatcher.relativePath(path)
+  if relPath is not None and pathMatcher.isExcluded(relPath, True) :
+    walkStats.numPruned += 1
+    return
+
+  dirsToWalk = [ (str(path), relPath) ]
+  while dirsToWalk :
+    aDir, relDir = dirsToWalk.pop()
+    yield Path(aDir)
+    walkStats.numDirs += 1
+
+    subDirs = [ ]
+    try :
+      with os.scandir(aDir) as dirEntries :
+        for anEntry in dirEntries :
+          if anEntry.is_dir(follow_symlinks=False) :
+            walkStats.numStatsSaved += 1
+            relSubDir = None
+            if relDir is not None :
+              relSubDir = relDir + '/' + anEntry.name if relDir else anEntry.name
+              if pathMatcher.isExcluded(relSubDir, True) :
+                walkStats.numPruned += 1
+                continue
+            subDirs.append((anEntry.path, relSubDir))
+          else :
+            walkStats.numFiles += 1
+            walkStats.numStatsSaved += 2
+    except (FileNotFoundError, NotADirectoryError, PermissionError) :
+      # this directory has been removed (or hidden) since it was listed
+      continue
+
+    # push the sub-directories in reverse so that they are walked in
+    # their listed order
+    subDirs.reverse()
+    dirsToWalk.extend(subDirs)
+
+# The event put onto the `fsWatchQueue` once there will be no more events
+# (once the backend has no more events, or the watcher has been closed)
+#
+endOfEvents = FSEvent(None, 0)
+
+def getEventPath(event) :
+  """Return the (string) path of an event (or None), avoiding converting a
+  `Path` to a string whenever the event already has its path as a
+  string."""
+
+  aPath = getattr(event, 'pathStr', None)
+  if aPath is not None or event.path is None : return aPath
+  return str(event.path)
+
+def eventToMessage(event) :
+  """Return a (JSON serializable) dict describing an event, suitable for
+  sending to NATS."""
+
+  return {
+    'path'     : getEventPath(event),
+    'mask'     : int(event.mask),
+    'maskName' : getMaskName(event.mask),
+  }
+
+class FSChange :
+  """A single (coalesced) change to a path.
+
+  The `kind` of a change is one of:
+
+  - `changed` : the path has been created, modified or written (a
+    CREATE, MODIFY and/or CLOSE_WRITE event),
+
+  - `deleted` : the path has been deleted,
+
+  - `movedFrom` : the path has been moved away,
+
+  - `movedTo` : the path has been moved into place.
+
+  The `kind` is the path's final state (for example, a file which is
+  written, deleted and then written again is `changed`). The `mask` is
+  the union of the masks of the events which have been coalesced into
+  this change since its `kind` was last set, and `numEvents` is the
+  number of all of the path's events. """
+
+  __slots__ = ( 'path', 'kind', 'mask', 'numEvents' )
+
+  def __init__(self, path, kind, mask) :
+    self.path      = path
+    self.kind      = kind
+    self.mask      = mask
+    self.numEvents = 1
+
+  def isDir(self) :
+    return bool(self.mask & Mask.ISDIR)
+
+  def __repr__(self) :
+    return f"<FSChange path={self.path!r} kind={self.kind} numEvents={self.numEvents}>"
+
+changedMask = Mask.CREATE | Mask.MODIFY | Mask.CLOSE_WRITE
+deletedMask = Mask.DELETE | Mask.DELETE_SELF
+
+def getChangeKind(aMask) :
+  """Classify an event mask into the kind of an `FSChange`."""
+
+  if aMask & changedMask      : return 'changed'
+  if aMask & deletedMask      : return 'deleted'
+  if aMask & Mask.MOVED_FROM  : return 'movedFrom'
+  if aMask & Mask.MOVED_TO    : return 'movedTo'
+  return getMaskName(aMask)
+
+class EventCoalescer :
+  """Coalesce a sequence of file system events into a list of `FSChange`s.
+
+  The events of a path are merged into a single `FSChange`, which
+  records the path's final state, so, for example, the CREATE, MODIFY,
+  MODIFY, ... , CLOSE_WRITE events generated by writing a new file are
+  folded into one `changed` change, and a file which is written and then
+  deleted is (only) `deleted`. The changes are listed in the order in
+  which each path reached its final kind of change."""
+
+  def __init__(self) :
+    self.changes   = { }
+    self.numEvents = 0
+
+  def __len__(self) :
+    return len(self.changes)
+
+  def addEvent(self, event) :
+    self.numEvents = self.numEvents + 1
+    aMask   = event.mask
+    aPath   = event.path
+    aKind   = getChangeKind(aMask)
+    aChange = self.changes.get(aPath)
+    if aChange is None :
+      self.changes[aPath] = FSChange(aPath, aKind, aMask)
+    elif aChange.kind == aKind :
+      aChange.mask      = aChange.mask | aMask
+      aChange.numEvents = aChange.numEvents + 1
+    else :
+      # the path's state has changed, so (re)list it in the order of its
+      # final kind of change
+      del self.changes[aPath]
+      self.changes[aPath] = aChange
+      aChange.kind      = aKind
+      aChange.mask      = aMask
+      aChange.numEvents = aChange.numEvents + 1
+
+  def getChanges(self) :
+    return list(self.changes.values())
 
 class FSWatcher :
   """ The file system watcher class (`FSWatcher`) uses the
-  [asyncinotify](https://gitlab.com/Taywee/asyncinotify) project to
-  monitor a Linux file system for changes. This code was originally based
-  upon the asyncinotify project's `examples/recursivewatch.py` example."""
+  [asyncinotify](https://gitlab.com/Taywee/asyncinotify) project (or,
+  optionally, fanotify, see `cputils.fsWatcherBackends`) to monitor a
+  Linux file system for changes. This code was originally based upon the
+  asyncinotify project's `examples/recursivewatch.py` example."""
+
+  def __init__(
+    self,
+    logger=None,
+    walkInThread=False,
+    maxWatchesPerTick=256,
+    maxBatchesInFlight=4,
+    moveTimeout=0.1,
+    keepSnapshot=False,
+    maxWatches=None,
+    watchHighWaterMark=0.9,
+    watchLowWaterMark=0.8,
+    minPollInterval=0.5,
+    maxPollInterval=30.0,
+    backend='inotify',
+    collectMetrics=False,
+    numSHA256Workers=NUM_SHA256_WORKERS,
+    hashCacheSize=65536,
+    suppressUnchanged=False,
+    hashAlgorithm='sha256',
+    isTaskDependency=None
+  ) :
+    """Create a file system watcher.
+
+    - `walkInThread` : when True, the directory trees of newly watched
+      paths are walked in a worker thread, so that walking a very large
+      tree does not block the asyncio event loop.
+
+    - `maxWatchesPerTick` : the maximum number of inotify watches added
+      before the watcher yields control back to the event loop.
+
+    - `maxBatchesInFlight` : the maximum number of batches of directories
+      (each of at most `maxWatchesPerTick` directories) which the worker
+      thread may walk ahead of the watches being added.
+
+    - `moveTimeout` : the time (in seconds) to wait for the MOVED_TO event
+      which completes the move of a watched directory. A directory whose
+      MOVED_TO event does not arrive has been moved out of the watched
+      trees, and so its watches are removed.
+
+    - `keepSnapshot` : when True, a (stat based) `FSSnapshot` of the
+      watched trees is kept up to date, so that if the inotify event queue
+      overflows, a rescan can report exactly the changes whose events were
+      lost.
+
+    - `maxWatches` : the maximum number of inotify watches this watcher
+      may use. By default this is the system's limit on the number of
+      inotify watches per user (see `getMaxUserWatches`).
+
+    - `watchHighWaterMark`, `watchLowWaterMark` : once the number of
+      watches reaches `watchHighWaterMark * maxWatches`, the coldest
+      (least recently active) sub-trees of the watched trees are given up
+      and polled instead (see `cputils.pollingScanner`), until the number
+      of watches is below `watchLowWaterMark * maxWatches`.
+
+    - `minPollInterval`, `maxPollInterval` : the bounds (in seconds) of
+      the adaptive polling interval of each polled sub-tree.
+
+    - `backend` : the kernel interface used to watch the file system,
+      either a backend object or one of the names `inotify`, `fanotify`
+      or `auto` (see `cputils.fsWatcherBackends.createBackend`). The
+      fanotify backend watches each root path's whole file system with a
+      single mark (no directory trees need to be walked), but requires
+      privileges. Without them, the watcher falls back to inotify. A
+      `cputils.eventLog.ReplayBackend` replays recorded events (see
+      `recordEvents`).
+
+    - `collectMetrics` : when True, histograms of the queue depths, the
+      event latencies, the time taken to add each watch and the rate of
+      events of each root path are collected (see `getWatchMetrics`).
+      When False (the default) no metrics are collected.
+
+    - `numSHA256Workers` : the number of files whose SHA256 checksums may
+      be computed at the same time (see `computeSHA256For`).
+
+    - `hashCacheSize` : the maximum number of file hashes remembered (a
+      file is only re-hashed once its (inode, mtime_ns, size) signature
+      has changed).
+
+    - `suppressUnchanged` : when True, events which do not change the
+      contents of any file are not yielded (see `isUnchangedEvent`), so,
+      for example, an editor saving identical bytes does not trigger a
+      rebuild.
+
+    - `hashAlgorithm` : the (default) hash algorithm used to decide if a
+      file has changed (see `isUnchangedEvent` and `computeChangeHashFor`).
+      Change detection does not need a cryptographic hash, so `fast`
+      (the fastest available of `xxh3_128`, `blake3` and `blake2b`, see
+      `cputils.fileHasher.resolveHashAlgorithm`) is usually the better
+      choice. SHA256 checksums are then only computed when they are asked
+      for (see `computeSHA256For`). Each root path may use its own
+      algorithm (see `watchARootPath`).
+
+    - `isTaskDependency` : an optional callable which returns True if a
+      path is a dependency of some task (for example
+      `cputils.artefactManager.ArtefactManager.isTaskDependency`). The
+      SHA256 checksums of such paths are computed first (see
+      `computeSHA256For`).
+
+    """
 
-  def __init__(self, logger=None) :
-    self.inotify               = Inotify()
-    self.rootPaths             = []
-    self.pathsToWatchQueue     = asyncio.Queue()
-    self.computeSHA256Queue    = asyncio.Queue()
-    self.fsWatchQueue          = asyncio.Queue()
     if logger is None : logger = logging.getLogger("FSWatcher")
+    if isinstance(backend, str) : backend = createBackend(backend, logger)
+    self.backend               = backend
+    self.rootPaths             = []
+    self.pathMatchers          = {}
+    self.metrics               = None
+    if collectMetrics :
+      self.metrics             = WatchMetrics()
+      self.pathsToWatchQueue   = TimedQueue(
+        self.recordWatchRequestPut, self.recordWatchRequestGet
+      )
+      self.fsWatchQueue        = TimedQueue(
+        self.recordEventPut, self.recordEventGet
+      )
+    else :
+      self.pathsToWatchQueue   = asyncio.Queue()
+      self.fsWatchQueue        = asyncio.Queue()
+    self.computeSHA256Queue    = HashQueue(isTaskDependency)
+    self.numSHA256Workers      = max(1, numSHA256Workers)
+    self.hashCache             = HashCache(hashCacheSize)
+    self.sha256Hasher          = FileHasher(
+      self.numSHA256Workers, hashCache=self.hashCache
+    )
+    self.hashCacheSize         = hashCacheSize
+    self.hashers               = { 'sha256' : self.sha256Hasher }
+    self.hashAlgorithm         = resolveHashAlgorithm(hashAlgorithm)
+    self.rootHashAlgorithms    = { }
+    self.suppressUnchanged     = suppressUnchanged
+    self.closeWritePaths       = { }
+    self.numEventsSuppressed   = 0
+    self.numChunksHashed       = 0
+    self.numChunksReused       = 0
+    self.sha256Workers         = [ ]
     self.logger                = logger
-    self.numWatches         = 0
-    self.numUnWatches       = 0
+    self.numWatches            = 0
+    self.numUnWatches          = 0
+    self.walkStats             = WalkStats()
+    self.watchPathTrie         = WatchPathTrie()
+    self.pendingMoves          = {}
+    self.moveTimeout           = moveTimeout
+    self.numMovesTracked       = 0
+    self.numMovesOut           = 0
+    self.numWatchesRenamed     = 0
+    self.keepSnapshot          = keepSnapshot
+    self.fsSnapshot            = FSSnapshot()
+    self.snapshotPaths         = {}
+    self.snapshotsToLoad       = set()
+    self.rescanTask            = None
+    self.rescanRequested       = False
+    self.numOverflows          = 0
+    self.numRescans            = 0
+    self.numRescanEvents       = 0
+    if maxWatches is None : maxWatches = getMaxUserWatches()
+    self.maxWatches            = maxWatches
+    self.watchHighWater        = int(maxWatches * watchHighWaterMark)
+    self.watchLowWater         = int(maxWatches * watchLowWaterMark)
+    self.poller                = PollingScanner(
+      self.reportPolledChange, minPollInterval, maxPollInterval
+    )
+    self.pollingTask           = None
+    self.numSubTreesPolled     = 0
+    self.numPolledEvents       = 0
+    self.numWatchLimitErrors   = 0
+    self.walkInThread          = walkInThread
+    self.maxWatchesPerTick     = max(1, maxWatchesPerTick)
+    self.maxBatchesInFlight    = max(1, maxBatchesInFlight)
     self.continueWatchingFS    = True
+    self.readEventsTask        = None
+    self.eventRecorder         = None
+    self.managePathsTask       = None
+    self.tasks                 = set()
+    self.isClosed              = False
 
     # We want Mask.MASK_ADD so that watches are updated
     # For the purposes of ComputePods we only care about:
@@ -116,18 +510,212 @@ class FSWatcher :
     return self.rootPaths
 
   def stopWatchingFileSystem(self) :
-    """(Gracefully) stop watching the file system"""
+    """(Gracefully) stop watching the file system (see also `close`)."""
 
     self.continueWatchingFS = False
+    self.poller.stopPolling()
+
+  def createTask(self, aCoroutine) :
+    """Create an asyncio task which is owned by this watcher (and so is
+    cancelled by `close`)."""
+
+    aTask = asyncio.create_task(aCoroutine)
+    self.tasks.add(aTask)
+    aTask.add_done_callback(self.tasks.discard)
+    return aTask
+
+  async def __aenter__(self) :
+    self.startManagingPathsToWatchQueue()
+    return self
+
+  async def __aexit__(self, excType, excValue, traceback) :
+    await self.close()
+
+  async def close(self, timeout=1.0) :
+    """Stop watching the file system and release all of this watcher's
+    resources.
+
+    The pending requests to (un)watch paths and to compute SHA256 check
+    sums are given (at most) `timeout` seconds to drain. Then all of this
+    watcher's tasks are cancelled (any SHA256 futures which are still
+    pending are cancelled), any consumer waiting for events is woken, the
+    snapshots of any root paths with a `snapshotPath` are saved, and the
+    inotify (or fanotify) file descriptor is closed.
+
+    Closing a watcher more than once does nothing."""
+
+    if self.isClosed : return
+    self.isClosed = True
+    loop     = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    # Drain the queues (if anything is still working on them)
+    #
+    someJoins = [ ]
+    if self.managePathsTask is not None and not self.managePathsTask.done() :
+      someJoins.append(self.pathsToWatchQueue.join())
+    if self.sha256Workers :
+      someJoins.append(self.computeSHA256Queue.join())
+    if someJoins :
+      try :
+        await asyncio.wait_for(asyncio.gather(*someJoins), timeout)
+      except asyncio.TimeoutError :
+        self.logger.warning("FSWatcher closed before its queues drained")
+
+    # Stop, and wake anything waiting on our queues
+    #
+    self.stopWatchingFileSystem()
+    for aPath, moveTimer in self.pendingMoves.values() :
+      moveTimer.cancel()
+    self.pendingMoves.clear()
+    self.pathsToWatchQueue.put_nowait((False, None, None))
+    self.fsWatchQueue.put_nowait(endOfEvents)
+    while not self.computeSHA256Queue.empty() :
+      aPath, aFuture = self.computeSHA256Queue.get_nowait()
+      aFuture.cancel()
+      self.computeSHA256Queue.task_done()
+
+    # Cancel our tasks
+    #
+    someTasks = list(self.tasks)
+    for aTask in someTasks : aTask.cancel()
+    if someTasks :
+      await asyncio.wait(someTasks, timeout=max(0, deadline - loop.time()))
+    self.sha256Workers.clear()
+    self.stopRecordingEvents()
+
+    # Closing an inotify file descriptor waits for the kernel to release
+    # its watches (which can take several milliseconds), so we close it
+    # in a worker thread rather than blocking the event loop
+    #
+    if self.snapshotPaths :
+      await loop.run_in_executor(self.sha256Hasher.executor, self.saveSnapshots)
+    await loop.run_in_executor(self.sha256Hasher.executor, self.backend.close)
+    for aHasher in self.hashers.values() : aHasher.shutdown(wait=False)
 
 ########################################################################
 
   def clearWatchStats(self) :
-    self.numWatches   = 0
-    self.numUnWatches = 0
+    self.numWatches          = 0
+    self.numUnWatches        = 0
+    self.numMovesTracked     = 0
+    self.numMovesOut         = 0
+    self.numWatchesRenamed   = 0
+    self.numOverflows        = 0
+    self.numRescans          = 0
+    self.numRescanEvents     = 0
+    self.numSubTreesPolled   = 0
+    self.numPolledEvents     = 0
+    self.numWatchLimitErrors = 0
+    self.numEventsSuppressed = 0
+    self.numChunksHashed     = 0
+    self.numChunksReused     = 0
+    self.computeSHA256Queue.numCollapsed = 0
+    self.walkStats.clear()
 
   def getWatchStats(self) :
-    return (self.numWatches, self.numUnWatches)
+    """Return a dict of the watch statistics collected since this
+    watcher was created (or since the last call to `clearWatchStats`).
+
+    The `numActiveWatches` and `numPolledTrees`/`numPolledPaths` values
+    give the current split between the paths watched by inotify and the
+    paths being polled."""
+
+    return {
+      'numWatches'          : self.numWatches,
+      'numUnWatches'        : self.numUnWatches,
+      'numActiveWatches'    : len(self.watchPathTrie),
+      'numDirsWalked'       : self.walkStats.numDirs,
+      'numFilesSeen'        : self.walkStats.numFiles,
+      'numDirsPruned'       : self.walkStats.numPruned,
+      'numStatsSaved'       : self.walkStats.numStatsSaved,
+      'numMovesTracked'     : self.numMovesTracked,
+      'numMovesOut'         : self.numMovesOut,
+      'numWatchesRenamed'   : self.numWatchesRenamed,
+      'numOverflows'        : self.numOverflows,
+      'numRescans'          : self.numRescans,
+      'numRescanEvents'     : self.numRescanEvents,
+      'maxWatches'          : self.maxWatches,
+      'numPolledTrees'      : len(self.poller),
+      'numPolledPaths'      : self.poller.getNumPolledPaths(),
+      'numSubTreesPolled'   : self.numSubTreesPolled,
+      'numPolledEvents'     : self.numPolledEvents,
+      'numWatchLimitErrors' : self.numWatchLimitErrors,
+      'numEventsSuppressed' : self.numEventsSuppressed,
+      'numCachedHashes'     : sum(
+        len(aHasher.hashCache) for aHasher in self.hashers.values()
+      ),
+      'numHashHits'         : sum(
+        aHasher.hashCache.numHits for aHasher in self.hashers.values()
+      ),
+      'numHashMisses'       : sum(
+        aHasher.hashCache.numMisses for aHasher in self.hashers.values()
+      ),
+      'numHashEvictions'    : sum(
+        aHasher.hashCache.numEvictions for aHasher in self.hashers.values()
+      ),
+      'numChunksHashed'     : self.numChunksHashed,
+      'numChunksReused'     : self.numChunksReused,
+      'numHashesCollapsed'  : self.computeSHA256Queue.numCollapsed,
+    }
+
+  def getWatchMetrics(self) :
+    """Return a (JSON serializable) dict of the metrics collected since
+    this watcher was created (or since the last call to
+    `clearWatchMetrics`), or None if this watcher is not collecting
+    metrics (see `cputils.watchMetrics.WatchMetrics`).
+
+    Event latencies are measured from the time an event is read from the
+    kernel (neither inotify nor fanotify record when an event occurred).
+    """
+
+    if self.metrics is None : return None
+    return self.metrics.toDict()
+
+  def clearWatchMetrics(self) :
+    if self.metrics is not None : self.metrics = WatchMetrics()
+
+  async def publishWatchMetrics(
+    self, natsClient, aSubject="fsWatcher.metrics", aPeriod=10
+  ) :
+    """A long running asyncio process which periodically sends the watch
+    statistics and metrics of this watcher to NATS (using the
+    `cputils.natsClient.NatsClient`'s `sendMessage`)."""
+
+    while self.continueWatchingFS :
+      await asyncio.sleep(aPeriod)
+      await natsClient.sendMessage(aSubject, {
+        'stats'   : self.getWatchStats(),
+        'metrics' : self.getWatchMetrics(),
+      })
+
+  def getRootPath(self, aPath) :
+    """Return the (innermost) root path containing the path, or None."""
+
+    aPath    = os.path.abspath(aPath)
+    bestRoot = None
+    for aRootPath in self.rootPaths :
+      aRootPath = os.path.abspath(aRootPath)
+      if aPath != aRootPath and not aPath.startswith(aRootPath + '/') :
+        continue
+      if bestRoot is None or len(bestRoot) < len(aRootPath) :
+        bestRoot = aRootPath
+    return bestRoot
+
+  def recordWatchRequestPut(self, aRequest, aDepth) :
+    self.metrics.queueDepths['pathsToWatch'].record(aDepth)
+
+  def recordWatchRequestGet(self, aRequest, waitTime) :
+    self.metrics.watchRequestWaits.record(waitTime)
+
+  def recordEventPut(self, event, aDepth) :
+    self.metrics.queueDepths['fsWatch'].record(aDepth)
+    aPath = getEventPath(event)
+    if aPath is not None :
+      self.metrics.recordRootEvent(self.getRootPath(aPath), time.perf_counter())
+
+  def recordEventGet(self, event, waitTime) :
+    self.metrics.recordEventLatency(getChangeKind(event.mask), waitTime)
 
   async def watchAPath(self, pathToWatch) :
     """Add a file system path to the list of paths to be watched."""
@@ -135,15 +723,89 @@ class FSWatcher :
     self.logger.debug("Adding path to watch queue {}".format(pathToWatch))
     await self.pathsToWatchQueue.put((True, pathToWatch, None))
 
-  async def watchARootPath(self, pathToWatch) :
+  async def watchARootPath(
+    self, pathToWatch, excludePatterns=None, includePatterns=None,
+    snapshotPath=None, hashAlgorithm=None
+  ) :
     """Add a single directory or file to the list of "root" paths to watch
     as well as schedule it to be watched. When one of the root paths is
-    deleted, it will be re-watched."""
+    deleted, it will be re-watched.
+
+    The optional `excludePatterns` and `includePatterns` are lists of
+    gitignore-style patterns (see `cputils.pathMatcher`), relative to this
+    root path. Excluded directories are neither walked nor watched, and
+    events for excluded (or not included) paths are never yielded.
+
+    The optional `snapshotPath` is the path of a (SQLite) database used to
+    save this root path's `FSSnapshot` (see `saveSnapshots`). When this
+    root path is first watched, any saved snapshot is loaded and compared
+    with the current tree, and (synthetic) events are reported for every
+    change made while the tree was not being watched. Giving a
+    `snapshotPath` ensures this watcher keeps a snapshot.
+
+    The optional `hashAlgorithm` is the hash algorithm used to decide if
+    the files below this root path have changed (by default, the
+    watcher's `hashAlgorithm`).
 
+    A relative root path is made absolute, so the paths of all of the
+    events below it are absolute."""
+
+    pathToWatch = os.path.abspath(pathToWatch)
     self.logger.debug("Adding root path [{}]".format(pathToWatch))
     self.rootPaths.append(pathToWatch)
+    if hashAlgorithm is not None :
+      self.rootHashAlgorithms[pathToWatch] = resolveHashAlgorithm(hashAlgorithm)
+    if snapshotPath is not None :
+      self.keepSnapshot = True
+      self.snapshotPaths[pathToWatch] = snapshotPath
+      self.snapshotsToLoad.add(pathToWatch)
+    if excludePatterns or includePatterns :
+      aMatcher = PathMatcher(pathToWatch, excludePatterns, includePatterns)
+      self.pathMatchers[aMatcher.rootPath] = aMatcher
     await self.watchAPath(pathToWatch)
 
+  def getPathMatcher(self, aPath) :
+    """Return the `PathMatcher` of the (innermost) root path containing the
+    path, or None if no such root path has any patterns."""
+
+    if not self.pathMatchers : return None
+    aPath       = str(aPath)
+    bestMatcher = None
+    for aMatcher in self.pathMatchers.values() :
+      if aMatcher.relativePath(aPath) is None : continue
+      if bestMatcher is None or \
+        len(bestMatcher.rootPath) < len(aMatcher.rootPath) :
+        bestMatcher = aMatcher
+    return bestMatcher
+
+  def isBelowARootPath(self, aPath) :
+    """Returns True if the path is (at or) below one of the root paths."""
+
+    aPath = os.path.abspath(aPath)
+    for aRootPath in self.rootPaths :
+      aRootPath = os.path.abspath(aRootPath)
+      if aPath == aRootPath or aPath.startswith(aRootPath + '/') :
+        return True
+    return False
+
+  def shouldReportEvent(self, event) :
+    """Returns True if the event's path is not excluded by the patterns of
+    its root path (and, for backends which watch whole file systems, is
+    below one of the root paths).
+
+    Backends which do not watch directories do not walk (and so do not
+    prune) the watched trees, so the path's ancestor directories are also
+    checked against the exclude patterns."""
+
+    aPath = getEventPath(event)
+    if aPath is None : return True
+    notWalked = not self.backend.watchesDirectories
+    if notWalked and self.rootPaths and not self.isBelowARootPath(aPath) :
+      return False
+    aMatcher = self.getPathMatcher(aPath)
+    if aMatcher is None : return True
+    return aMatcher.shouldReport(aPath, Mask.ISDIR in event.mask, notWalked)
+
   async def unWatchAPath(self, pathToWatch, aWatch) :
     """ Add a single directory or file to be unWatched by this instance of
     `FSWatcher` to the `pathsToWatchQueue`. """
@@ -151,6 +813,163 @@ class FSWatcher :
     self.logger.debug("Adding path to (un)watch queue {}".format(pathToWatch))
     await self.pathsToWatchQueue.put((False, pathToWatch, aWatch))
 
+  async def addAWatch(self, aPath) :
+    """Add an inotify watch for a single directory or file.
+
+    Paths inside polled sub-trees are not watched. Once the number of
+    watches reaches the high water mark, the coldest sub-trees are polled
+    instead (see `pollColdestSubTrees`). If no watches can be freed (or
+    the system refuses any more watches), the path itself is polled."""
+
+    if self.poller.isPolled(aPath) : return
+    if self.watchHighWater <= len(self.watchPathTrie) :
+      self.pollColdestSubTrees()
+      if self.watchHighWater <= len(self.watchPathTrie) :
+        self.pollSubTree(aPath)
+        return
+
+    try :
+      self.numWatches = self.numWatches + 1
+      if self.metrics is None :
+        aWatch = self.backend.add_watch(aPath, wrMask)
+      else :
+        startTime = time.perf_counter()
+        aWatch = self.backend.add_watch(aPath, wrMask)
+        self.metrics.addWatchTimes.record(time.perf_counter() - startTime)
+      self.watchPathTrie.addWatch(os.path.abspath(aPath), aWatch)
+      self.logger.info(f'INIT: watching {aPath}')
+    except PermissionError as err :
+      pass
+    except (FileNotFoundError, NotADirectoryError) as err :
+      # this path has been removed (or replaced) since it was walked, its
+      # removal will be reported by its parent's watch
+      self.logger.debug(f'INIT: can not watch (removed) {aPath}')
+    except OSError as err :
+      if err.errno != errno.ENOSPC :
+        self.logger.error(f"Exception while trying to watch: [{aPath}]")
+        self.logger.exception(err)
+        return
+      # the system's limit on the number of watches (shared with all of
+      # this user's processes) has been reached... so we can not use more
+      # watches than we have now
+      self.numWatchLimitErrors = self.numWatchLimitErrors + 1
+      self.watchHighWater = min(self.watchHighWater, len(self.watchPathTrie))
+      self.watchLowWater  = min(self.watchLowWater, self.watchHighWater)
+      self.logger.warning(f"The inotify watch limit has been reached... polling {aPath}")
+      self.pollSubTree(aPath)
+
+  def pollColdestSubTrees(self) :
+    """Replace the watches of the coldest sub-trees (those whose most
+    recent events are the oldest) with polling, until the number of
+    watches is below the low water mark. The root paths themselves are
+    never polled. Returns the number of sub-trees now being polled."""
+
+    numToFree = len(self.watchPathTrie) - self.watchLowWater
+    if numToFree <= 0 : return 0
+    someSubTrees = self.watchPathTrie.getColdestSubTrees(
+      numToFree, [ os.path.abspath(aRootPath) for aRootPath in self.rootPaths ]
+    )
+    for aSubTree in someSubTrees :
+      self.pollSubTree(aSubTree)
+    return len(someSubTrees)
+
+  def pollSubTree(self, aPath) :
+    """Remove any watches at or below the path, and poll the path's tree
+    instead."""
+
+    aPath = os.path.abspath(aPath)
+    for aWatch in self.watchPathTrie.getWatchesBelow(aPath) :
+      self.watchPathTrie.removeWatch(aWatch.wd)
+      try :
+        self.backend.rm_watch(aWatch)
+      except OSError :
+        pass
+    aSnapshot = None
+    if self.keepSnapshot and aPath in self.fsSnapshot :
+      aSnapshot = self.fsSnapshot.subSnapshot(aPath)
+    self.poller.addTree(aPath, self.getPathMatcher(aPath), aSnapshot)
+    self.numSubTreesPolled = self.numSubTreesPolled + 1
+    self.logger.info(f'POLLING: {aPath}')
+    if self.pollingTask is None :
+      self.pollingTask = self.createTask(self.poller.runPolling())
+
+  async def reportPolledChange(self, aPath, aMask) :
+    """Report a change found by polling a sub-tree."""
+
+    event = FSEvent(aPath, aMask)
+    self.numPolledEvents = self.numPolledEvents + 1
+    if not self.shouldReportEvent(event) : return
+    if self.keepSnapshot : self.updateSnapshot(event)
+    await self.fsWatchQueue.put(event)
+
+  async def watchTree(self, aPathToWatch) :
+    """Walk and watch a directory tree on the event loop, yielding control
+    back to the event loop after every `maxWatchesPerTick` watches."""
+
+    numWatchesThisTick = 0
+    for aPath in get_directories_recursive(
+      aPathToWatch, self.walkStats, self.getPathMatcher(aPathToWatch)
+    ) :
+      await self.addAWatch(aPath)
+      numWatchesThisTick = numWatchesThisTick + 1
+      if self.maxWatchesPerTick <= numWatchesThisTick :
+        numWatchesThisTick = 0
+        await asyncio.sleep(0)
+
+  async def watchTreeInThread(self, aPathToWatch) :
+    """Walk a directory tree in a worker thread, while adding the watches
+    on the event loop.
+
+    The worker thread hands the directories back to the event loop in
+    batches of at most `maxWatchesPerTick` directories. The event loop
+    adds the watches for one batch and then yields control, so the event
+    loop remains responsive while a large tree is being registered. At
+    most `maxBatchesInFlight` batches are walked ahead of the watches
+    being added. """
+
+    loop        = asyncio.get_running_loop()
+    batches     = asyncio.Queue()
+    batchSlots  = threading.BoundedSemaphore(self.maxBatchesInFlight)
+    stopWalking = threading.Event()
+    pathMatcher = self.getPathMatcher(aPathToWatch)
+
+    def sendBatch(aBatch, isLast) :
+      try :
+        loop.call_soon_threadsafe(batches.put_nowait, (aBatch, isLast))
+      except RuntimeError :
+        # the event loop has been closed
+        stopWalking.set()
+
+    def walkTree() :
+      aBatch = [ ]
+      try :
+        for aPath in get_directories_recursive(
+          aPathToWatch, self.walkStats, pathMatcher
+        ) :
+          aBatch.append(aPath)
+          if len(aBatch) < self.maxWatchesPerTick : continue
+          while not batchSlots.acquire(timeout=0.1) :
+            if stopWalking.is_set() : return
+          sendBatch(aBatch, False)
+          aBatch = [ ]
+          if stopWalking.is_set() : return
+      finally :
+        sendBatch(aBatch, True)
+
+    walkFuture = loop.run_in_executor(None, walkTree)
+    try :
+      isLast = False
+      while not isLast :
+        aBatch, isLast = await batches.get()
+        for aPath in aBatch :
+          await self.addAWatch(aPath)
+        if not isLast :
+          batchSlots.release()
+          await asyncio.sleep(0)
+    finally :
+      stopWalking.set()
+    await walkFuture
+
   async def managePathsToWatchQueue(self) :
     """A long running asyncio process which ensures all path in the list
     of paths are added to the inotify watch system.
@@ -158,98 +977,422 @@ class FSWatcher :
     Implement all (pending) requests to watch/unWatch a directory or
     file which are in the `pathsToWatchQueue`.
 
-    When watching, the paths contained in all directories are themselves
-    recursively added to the `pathsToWatchQueue`. """
+    When watching, all of the directories below a path are walked and
+    watched (the directory watches report changes to the files they
+    contain). """
 
     while self.continueWatchingFS :
       addPath, aPathToWatch, theWatch = await self.pathsToWatchQueue.get()
+      if not self.continueWatchingFS :
+        self.pathsToWatchQueue.task_done()
+        return
 
-      if addPath :
-        for aPath in get_directories_recursive(Path(aPathToWatch)) :
-          try :
-            self.numWatches = self.numWatches + 1
-            self.inotify.add_watch(aPath, wrMask)
-            self.logger.info(f'INIT: watching {aPath}')
-          except PermissionError as err :
-            pass
-          except Exception as err:
-            print(f"Exception whild trying to watch: [{aPath}]")
-            traceback.print_exc(err)
-            # we can't watch this path just yet...
-            # ... schedule its parent and try again...
-            await self.watchAPath(aPath.parent)
+      if addPath and self.poller.isPolled(aPathToWatch) :
+        # changes inside polled sub-trees are found by polling
+        pass
+      elif addPath and not self.backend.watchesDirectories :
+        # one watch reports the changes in the path's whole file system
+        await self.addAWatch(Path(aPathToWatch))
+        if self.keepSnapshot :
+          await self.snapshotOrLoad(aPathToWatch)
+      elif addPath :
+        if self.walkInThread :
+          await self.watchTreeInThread(Path(aPathToWatch))
+        else :
+          await self.watchTree(Path(aPathToWatch))
+        if self.keepSnapshot :
+          await self.snapshotOrLoad(aPathToWatch)
       else :
         # according to the documentation.... the corresponding
         # Mask.IGNORE event will automatically remove this watch.
         #self.inotify.rm_watch(theWatch)
         self.numUnWatches = self.numUnWatches + 1
         self.logger.debug(f'INIT: unWatching {aPathToWatch}')
-        if aPathToWatch in self.rootPaths :
+        if os.path.abspath(aPathToWatch) in self.rootPaths :
           self.logger.debug(f'INIT: found root path... rewatching it {aPathToWatch}')
           await self.watchAPath(aPathToWatch)
       self.pathsToWatchQueue.task_done()
 
+  def startManagingPathsToWatchQueue(self) :
+    """Ensure the (owned) `managePathsToWatchQueue` task is running."""
+
+    if self.managePathsTask is None :
+      self.managePathsTask = self.createTask(self.managePathsToWatchQueue())
+
 ########################################################################
 
-  async def computeSHA256For(self, aPath) :
-    """Add a file to the list of file for which a SHA256 check sum will be
-    computed."""
+  def moveFrom(self, event) :
+    """Record the start of the move of a watched directory (a MOVED_FROM
+    event), so that it can be paired, by its cookie, with the
+    corresponding MOVED_TO event."""
+
+    aPath = os.path.abspath(event.path)
+    if aPath not in self.watchPathTrie : return
+    loop = asyncio.get_running_loop()
+    self.pendingMoves[event.cookie] = (
+      aPath,
+      loop.call_later(self.moveTimeout, self.moveOut, event.cookie)
+    )
+
+  async def moveTo(self, event) :
+    """Complete the move of a directory (a MOVED_TO event).
+
+    If the corresponding MOVED_FROM event has been seen, the moved
+    sub-tree of watches is re-keyed in place (the inotify watches
+    themselves follow the moved directories). Otherwise the directory has
+    been moved into the watched trees and so needs to be watched."""
+
+    aPath = os.path.abspath(event.path)
+    pendingMove = self.pendingMoves.pop(event.cookie, None)
+    if pendingMove is None :
+      await self.watchAPath(event.path)
+      return
+
+    oldPath, moveTimer = pendingMove
+    moveTimer.cancel()
+    numRenamed = self.watchPathTrie.moveSubTree(oldPath, aPath)
+    self.numMovesTracked   = self.numMovesTracked + 1
+    self.numWatchesRenamed = self.numWatchesRenamed + numRenamed
+    self.logger.debug(f'MOVED: {oldPath} -> {aPath} ({numRenamed} watches)')
+
+  def moveOut(self, cookie) :
+    """Remove the watches on a directory which has been moved out of the
+    watched trees (no MOVED_TO event arrived within the `moveTimeout`)."""
+
+    pendingMove = self.pendingMoves.pop(cookie, None)
+    if pendingMove is None : return
+
+    oldPath, moveTimer = pendingMove
+    self.numMovesOut = self.numMovesOut + 1
+    self.logger.debug(f'MOVED OUT: {oldPath}')
+    for aWatch in self.watchPathTrie.getWatchesBelow(oldPath) :
+      try :
+        # the corresponding IGNORED event will remove this watch from the
+        # watchPathTrie
+        self.backend.rm_watch(aWatch)
+      except OSError :
+        pass
+
+########################################################################
+
+  async def scanTree(self, aPath) :
+    """Take a new snapshot of the tree at the path (in a worker thread)."""
+
+    aPath     = os.path.abspath(aPath)
+    aSnapshot = FSSnapshot()
+    await asyncio.get_running_loop().run_in_executor(
+      None, aSnapshot.scanTree, aPath, self.getPathMatcher(aPath)
+    )
+    return aSnapshot
+
+  async def snapshotTree(self, aPath) :
+    """Replace the part of the `fsSnapshot` at or below the path with a
+    new snapshot."""
+
+    aSnapshot = await self.scanTree(aPath)
+    self.fsSnapshot.replaceTree(os.path.abspath(aPath), aSnapshot)
+
+  async def snapshotOrLoad(self, aPath) :
+    """Take a new snapshot of a newly watched path, or, the first time a
+    root path with a `snapshotPath` is watched, load its saved
+    snapshot."""
+
+    aPath = os.path.abspath(aPath)
+    if aPath in self.snapshotsToLoad :
+      self.snapshotsToLoad.discard(aPath)
+      await self.loadSnapshot(aPath)
+    else :
+      await self.snapshotTree(aPath)
+
+  def updateSnapshot(self, event) :
+    """Update the `fsSnapshot` to reflect a (reported) event."""
+
+    aPath = os.path.abspath(event.path)
+    if event.mask & (Mask.DELETE | Mask.DELETE_SELF | Mask.MOVED_FROM) :
+      self.fsSnapshot.removeTree(aPath)
+    elif Mask.MOVED_TO in event.mask and Mask.ISDIR in event.mask :
+      # the moved directory's contents are (re)scanned by snapshotTree
+      self.fsSnapshot.updatePath(aPath)
+      return True
+    else :
+      self.fsSnapshot.updatePath(aPath)
+    return False
+
+  def requestRescan(self) :
+    """Ensure all of the root paths will be rescanned."""
+
+    if self.rescanTask is not None and not self.rescanTask.done() :
+      self.rescanRequested = True
+      return
+    self.rescanTask = self.createTask(self.rescanRoots())
+
+  async def rescanRoots(self) :
+    """Rescan all of the root paths, comparing each root's new snapshot
+    with the `fsSnapshot`, and report (synthetic) events for any paths
+    which have been created, modified or deleted.
+
+    If this watcher is not keeping a snapshot, every path is reported as
+    having been created."""
+
+    self.rescanRequested = True
+    while self.rescanRequested :
+      self.rescanRequested = False
+      self.numRescans = self.numRescans + 1
+      if not self.keepSnapshot :
+        self.logger.warning("No snapshot kept... rescan will report every path")
+      for aRootPath in list(self.rootPaths) :
+        await self.rescanRoot(aRootPath)
+
+  async def rescanRoot(self, aRootPath) :
+    """Rescan one root path, comparing its new snapshot with the
+    `fsSnapshot`, and report (synthetic) events for any paths which have
+    been created, modified or deleted.
+
+    The created directories have already been walked by the scan, so
+    they are watched here (rather than walking the tree of each of them
+    again)."""
+
+    aRootPath   = os.path.abspath(aRootPath)
+    newSnapshot = await self.scanTree(aRootPath)
+    oldSnapshot = self.fsSnapshot.subSnapshot(aRootPath)
+    created, modified, deleted = oldSnapshot.diff(newSnapshot)
+    self.fsSnapshot.replaceTree(aRootPath, newSnapshot)
+    if self.backend.watchesDirectories :
+      await self.watchDirectories(
+        aPath for aPath, isDir in created if isDir
+      )
+    someEvents = [ ]
+    for aPath, isDir in created :
+      someEvents.append(FSEvent(aPath, Mask.CREATE | (Mask.ISDIR if isDir else 0)))
+    for aPath, isDir in modified :
+      someEvents.append(FSEvent(aPath, Mask.CLOSE_WRITE))
+    for aPath, isDir in deleted :
+      someEvents.append(FSEvent(aPath, Mask.DELETE | (Mask.ISDIR if isDir else 0)))
+    self.logger.info(f"RESCAN: {aRootPath} {len(someEvents)} changes")
+    for anEvent in someEvents :
+      self.numRescanEvents = self.numRescanEvents + 1
+      if await self.processEvent(anEvent, watchNewDirs=False) :
+        await self.fsWatchQueue.put(anEvent)
+
+  async def watchDirectories(self, someDirs) :
+    """Watch each of the (already walked) directories which is not yet
+    being watched, yielding control back to the event loop after every
+    `maxWatchesPerTick` watches."""
+
+    numWatchesThisTick = 0
+    for aDir in someDirs :
+      if aDir in self.watchPathTrie : continue
+      await self.addAWatch(Path(aDir))
+      numWatchesThisTick = numWatchesThisTick + 1
+      if self.maxWatchesPerTick <= numWatchesThisTick :
+        numWatchesThisTick = 0
+        await asyncio.sleep(0)
+
+  async def loadSnapshot(self, aRootPath) :
+    """Load the snapshot saved for a root path, and report (synthetic)
+    events for all of the changes made to the root path's tree since the
+    snapshot was saved. If no snapshot has been saved, every path is
+    reported as having been created."""
+
+    aRootPath = os.path.abspath(aRootPath)
+    aSnapshot = FSSnapshot()
+    numLoaded = await asyncio.get_running_loop().run_in_executor(
+      None, aSnapshot.load, self.snapshotPaths[aRootPath], aRootPath
+    )
+    self.logger.info(f"LOADED: {numLoaded} snapshot entries for {aRootPath}")
+    self.fsSnapshot.removeTree(aRootPath)
+    self.fsSnapshot.merge(aSnapshot)
+    await self.rescanRoot(aRootPath)
+
+  def saveSnapshots(self) :
+    """Save the snapshots of each root path which has a `snapshotPath`.
+
+    Saving the snapshot of a very large tree can take some time, so this
+    method may be run in a worker thread (using `run_in_executor`)."""
+
+    for aRootPath, aSnapshotPath in self.snapshotPaths.items() :
+      self.fsSnapshot.subSnapshot(aRootPath).save(aSnapshotPath)
+
+########################################################################
+
+  def setTaskDependencyCheck(self, isTaskDependency) :
+    """Set the callable which returns True if a path is a dependency of
+    some task (see `computeSHA256For`)."""
+
+    self.computeSHA256Queue.isDependency = isTaskDependency
+
+  async def computeSHA256For(self, aPath, eventTime=None) :
+    """Add a file to the list of files for which a SHA256 check sum will
+    be computed, returning an `asyncio.Future` of the file's (hex) SHA256
+    digest. The future's exception is set if the file can not be read.
+
+    Files are not hashed in the order they are added, but (see
+    `cputils.hashQueue.HashQueue`) task dependencies first, and then the
+    files whose events are the most recent (at the `time.monotonic()`
+    time `eventTime`, by default now) first. A file which is added while
+    it is still waiting to be hashed is only hashed once (the same future
+    is returned)."""
+
+    await self.manageComputeSHA256Queue()
+    return self.computeSHA256Queue.requestHash(str(aPath), eventTime)
+
+  async def computeChunkedHashFor(
+    self, aPath, chunkSize=defaultChunkSize, verify=False
+  ) :
+    """Return the Merkle root of the chunked (SHA256) hash of a (large)
+    file (see `cputils.chunkedHasher`), which is computed in one of the
+    `sha256Hasher`'s worker threads.
 
-    print(f"Requesting computing SHA256 for [{aPath}]")
-    await self.computeSHA256Queue.put(aPath)
+    The file's chunk manifest is recorded in the `fsSnapshot` (and so is
+    saved with the file's hash record by `saveSnapshots`), so the next
+    time the file is hashed only the chunks whose (fast) check digests
+    have changed are re-hashed (see `cputils.chunkedHasher`). When
+    `verify` is True, every chunk is re-hashed."""
+
+    aPath = os.path.abspath(aPath)
+    aManifest, numHashed = await asyncio.get_running_loop().run_in_executor(
+      self.sha256Hasher.executor, hashFileInChunks, aPath,
+      self.fsSnapshot.getManifest(aPath), chunkSize, 'sha256', verify
+    )
+    self.fsSnapshot.setManifest(aPath, aManifest)
+    self.numChunksHashed = self.numChunksHashed + numHashed
+    self.numChunksReused = self.numChunksReused + len(aManifest) - numHashed
+    return aManifest.root
+
+  def getHasher(self, algorithm) :
+    """Return the `FileHasher` (with its own `HashCache`) used for the
+    (named) hash algorithm. All hashers share the `sha256Hasher`'s worker
+    threads."""
+
+    algorithm = resolveHashAlgorithm(algorithm)
+    aHasher   = self.hashers.get(algorithm)
+    if aHasher is None :
+      aHasher = self.hashers[algorithm] = FileHasher(
+        self.numSHA256Workers, algorithm,
+        hashCache=HashCache(self.hashCacheSize),
+        executor=self.sha256Hasher.executor
+      )
+    return aHasher
+
+  def getChangeHasher(self, aPath) :
+    """Return the `FileHasher` used to decide if a path has changed (see
+    the `hashAlgorithm` of `watchARootPath`)."""
+
+    algorithm = self.rootHashAlgorithms.get(
+      self.getRootPath(aPath), self.hashAlgorithm
+    ) if self.rootHashAlgorithms else self.hashAlgorithm
+    return self.getHasher(algorithm)
+
+  async def computeChangeHashFor(self, aPath) :
+    """Return the (hex) change detection hash of a file (see
+    `getChangeHasher`), which is cached until the file's (inode,
+    mtime_ns, size) signature changes."""
+
+    return await self.getChangeHasher(aPath).hashFile(aPath)
+
+  async def isUnchangedEvent(self, event) :
+    """Returns True if an event does not change the contents of any file.
+
+    A MODIFY event is unchanged only if a CLOSE_WRITE event has been seen
+    for its file (so the file is written by a process which closes it,
+    and its CLOSE_WRITE event will follow). The MODIFY events of other
+    files (written through mmap, truncated, or kept open, like logs) are
+    never unchanged, since no CLOSE_WRITE may follow them. A CLOSE_WRITE
+    (or file MOVED_TO) event is unchanged if its file's change detection
+    hash (see `getChangeHasher`) is the same as when the file was last
+    hashed.
+    (The first such event for any file is never unchanged, but it does
+    record the file's hash). Events which create or delete paths are
+    never unchanged."""
+
+    aMask = event.mask
+    if event.path is None or Mask.ISDIR in aMask : return False
+    if aMask & (Mask.CREATE | Mask.DELETE | Mask.DELETE_SELF | Mask.MOVED_FROM) :
+      return False
+    aPath = getEventPath(event)
+    if not aMask & (Mask.CLOSE_WRITE | Mask.MOVED_TO) :
+      return bool(aMask & Mask.MODIFY) and aPath in self.closeWritePaths
+
+    if Mask.CLOSE_WRITE in aMask and aPath not in self.closeWritePaths :
+      if self.hashCacheSize <= len(self.closeWritePaths) :
+        # forget the oldest path
+        del self.closeWritePaths[next(iter(self.closeWritePaths))]
+      self.closeWritePaths[aPath] = True
+    aHasher = self.getChangeHasher(aPath)
+    oldHash = aHasher.hashCache.getLastHash(aPath)
+    try :
+      newHash = await aHasher.hashFile(aPath)
+    except OSError :
+      return False
+    return oldHash is not None and oldHash == newHash
 
   async def computeSHA256Worker(self, i) :
     """A long running asyncio process which ensures SHA256 checksums are
-    computed for all files in the SHA256 file list."""
+    computed for all files in the SHA256 file list.
+
+    Each file is hashed in-process (using `hashlib`) in one of the
+    `sha256Hasher`'s worker threads."""
 
-    print(f"Starting compute SHA256 worker {i}")
+    self.logger.debug(f"Starting compute SHA256 worker {i}")
     while True :
-      aPathToSHA256 = await self.computeSHA256Queue.get()
-      self.logger.info(f"Computing SHA256 for [{aPathToSHA256}]")
-      print(f"Computing SHA256 for [{aPathToSHA256}]")
-      sha256Cmd = f"sha256sum {aPathToSHA256}"
-      sha256Proc = await asyncio.create_subprocess_shell(
-        sha256Cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE)
-
-      stdout, stderr = await sha256Proc.communicate()
-
-      print(f'[{sha256Cmd!r} exited with {sha256Proc.returncode}]')
-      if stdout:
-        print(f'[stdout]\n{stdout.decode()}')
-      if stderr:
-        print(f'[stderr]\n{stderr.decode()}')
+      aPathToSHA256, aFuture = await self.computeSHA256Queue.get()
+      self.logger.debug(f"Computing SHA256 for [{aPathToSHA256}]")
+      # hash in a task of its own, so that the traceback of a failed hash
+      # does not hold this (long running) worker's frame
+      hashTask = self.createTask(self.sha256Hasher.hashFile(aPathToSHA256))
+      await asyncio.wait([ hashTask ])
+      copyFutureResult(hashTask, aFuture)
       self.computeSHA256Queue.task_done()
 
   async def manageComputeSHA256Queue(self) :
-    for i in range(1, NUM_SHA256_WORKERS + 1) :
-      asyncio.create_task(self.computeSHA256Worker(i))
+    """Ensure the `numSHA256Workers` compute SHA256 workers are running."""
+
+    if self.sha256Workers : return
+    for i in range(1, self.numSHA256Workers + 1) :
+      self.sha256Workers.append(
+        self.createTask(self.computeSHA256Worker(i))
+      )
 
 ########################################################################
 
-  #async def watch_recursive(self):
-  async def watchForFileSystemEvents(self):
-    """An asyncio/asyncinotify generator which generates file system
-    change (Linux inotify) events for all watched files and
-    directories."""
+  async def processEvent(self, event, watchNewDirs=True) :
+    """Do the book-keeping required by a single (inotify) event, returning
+    True if the event should be reported to the consumers of this
+    watcher's events.
 
-    # Things that can throw this off:
+    When `watchNewDirs` is False, the tree of a created directory is not
+    walked and watched (for example, when the directories found by a
+    rescan have already been watched, see `rescanRoot`)."""
+
+    # If the inotify event queue has overflowed, some events have been
+    # lost... so rescan the root paths to find the changes we missed
     #
-    # * Moving a watched directory out of the watch tree (will still
-    #   generate events even when outside of directory tree)
+    if Mask.Q_OVERFLOW in event.mask :
+      self.numOverflows = self.numOverflows + 1
+      self.logger.warning("The inotify event queue overflowed... rescanning")
+      self.requestRescan()
+      return False
+
+    # Record how recently each watch has been active (the coldest
+    # sub-trees are the first to be polled)
+    #
+    if event.watch is not None :
+      self.watchPathTrie.touchWatch(event.watch.wd, time.monotonic())
+
+    # Things that can throw this off:
     #
     # * Doing two changes on a directory or something before the program
     #   has a time to handle it (this will also throw off a lot of inotify
     #   code, though)
     #
-    # * Moving a watched directory within a watched directory will get the
-    #   wrong path.  This needs to use the cookie system to link events
-    #   together and complete the move properly, which can still make some
-    #   events get the wrong path if you get file events during the move or
-    #   something silly like that, since MOVED_FROM and MOVED_TO aren't
-    #   guaranteed to be contiguous.  That exercise is left up to the
-    #   reader.
+    # * Moving a watched directory uses the cookie system to link the
+    #   MOVED_FROM and MOVED_TO events together (see `moveFrom` and
+    #   `moveTo`). File events which arrive *during* the move (between the
+    #   MOVED_FROM and MOVED_TO events) can still get the old path.
+    #
+    # * Moving a watched directory out of the watch tree will only remove
+    #   its watches once the `moveTimeout` has passed (until then it will
+    #   still generate events even when outside of directory tree)
     #
     # * Trying to watch a path that doesn't exist won't automatically
     #   create it or anything of the sort.
@@ -257,48 +1400,184 @@ class FSWatcher :
     # * Deleting and recreating or moving the watched directory won't do
     #   anything special, but it probably should.
     #
-    async for event in self.inotify:
+    # If this is the creation of a directory, add a watch for the new
+    # directory (and its subdirectories if any)
+    #
+    if Mask.CREATE in event.mask and Mask.ISDIR in event.mask \
+      and watchNewDirs and event.path is not None \
+      and self.backend.watchesDirectories :
+      await self.watchAPath(event.path)
 
-      if not self.continueWatchingFS :
+    if Mask.DELETE_SELF in event.mask and event.path is not None :
+      await self.unWatchAPath(event.path, event.watch)
+
+    if Mask.IGNORED in event.mask and event.watch is not None :
+      self.watchPathTrie.removeWatch(event.watch.wd)
+
+    # Pair up the moves of directories using their cookies
+    #
+    if Mask.ISDIR in event.mask and event.path is not None \
+      and self.backend.watchesDirectories :
+      if Mask.MOVED_FROM in event.mask :
+        self.moveFrom(event)
+      elif Mask.MOVED_TO in event.mask :
+        await self.moveTo(event)
+
+    # If there are some bits in the cpMask in the event.mask report this
+    # event
+    #
+    if event.mask & cpMask:
+      if not self.shouldReportEvent(event) : return False
+      if event.mask & (Mask.DELETE | Mask.MOVED_FROM) and event.path is not None :
+        for aHasher in self.hashers.values() :
+          aHasher.hashCache.discard(getEventPath(event))
+        self.closeWritePaths.pop(getEventPath(event), None)
+      if self.keepSnapshot and event.path is not None :
+        if self.updateSnapshot(event) :
+          await self.snapshotTree(event.path)
+      return True
+
+    # Note that these events are needed for cleanup purposes.
+    # We'll always get IGNORED events so the watch can be removed
+    # from the inotify.  We don't need to do anything with the
+    # events, but they do need to be generated for cleanup.
+    # We don't need to pass IGNORED events up, because the end-user
+    # doesn't have the inotify instance anyway, and IGNORED is just
+    # used for management purposes.
+    #
+    self.logger.debug(f'UNYIELDED EVENT: {event}')
+    return False
+
+  async def readFileSystemEvents(self) :
+    """A long running asyncio process which reads the (inotify) events,
+    does the book-keeping required by each event, and places the events
+    which should be reported onto the `fsWatchQueue`."""
+
+    async for event in self.backend :
+      if not self.continueWatchingFS : return
+      try :
+        if await self.processEvent(event) :
+          await self.fsWatchQueue.put(event)
+      except Exception as err :
+        self.logger.error(f"Exception while processing event {event}")
+        self.logger.exception(err)
+
+    # the backend has no more events (for example, a replay has finished)
+    await self.fsWatchQueue.put(endOfEvents)
+
+  def recordEvents(self, logPath) :
+    """Record every event yielded by this watcher (by either
+    `watchForFileSystemEvents` or `watchForFileSystemEventBatches`), with
+    its (monotonic) time, to a log file, which can be replayed using a
+    `cputils.eventLog.ReplayBackend`."""
+
+    self.stopRecordingEvents()
+    self.eventRecorder = EventRecorder(logPath)
+
+  def stopRecordingEvents(self) :
+    if self.eventRecorder is not None :
+      self.eventRecorder.close()
+      self.eventRecorder = None
+
+  def startReadingFileSystemEvents(self) :
+    """Ensure the `readFileSystemEvents` task is running."""
+
+    if self.readEventsTask is None :
+      self.readEventsTask = self.createTask(self.readFileSystemEvents())
+
+  #async def watch_recursive(self):
+  async def watchForFileSystemEvents(self):
+    """An asyncio/asyncinotify generator which generates file system
+    change (Linux inotify) events for all watched files and
+    directories.
+
+    Each event is only generated once, so to share this watcher's events
+    between many consumers use a `cputils.fsWatcherHub.FSWatcherHub`."""
+
+    self.startReadingFileSystemEvents()
+    while self.continueWatchingFS :
+      event = await self.fsWatchQueue.get()
+      if event is endOfEvents or not self.continueWatchingFS :
         return
+      #await self.computeSHA256For(event.path)
+      if self.suppressUnchanged and await self.isUnchangedEvent(event) :
+        self.numEventsSuppressed = self.numEventsSuppressed + 1
+        continue
+      if self.eventRecorder is not None : self.eventRecorder.record(event)
+      yield event
+
+  async def watchForFileSystemEventBatches(
+    self, maxBatchDelay=0.05, maxBatchSize=1024
+  ) :
+    """An asyncio generator which generates batches of coalesced file
+    system changes (see `EventCoalescer`) for all watched files and
+    directories.
+
+    A batch is started by the first event to arrive, and is yielded once
+    either `maxBatchDelay` seconds have passed or `maxBatchSize` events
+    have been collected. Each batch is a list of `FSChange`s."""
+
+    self.startReadingFileSystemEvents()
+    loop       = asyncio.get_running_loop()
+    pendingGet = None
 
-      # If this is a creation event, add a watch for the new path (and its
-      # subdirectories if any)
-      #
-      if Mask.CREATE in event.mask and event.path is not None :
-        await self.watchAPath(event.path)
-
-      if Mask.DELETE_SELF in event.mask and event.path is not None :
-        await self.unWatchAPath(event.path, event.watch)
-
-      # If there are some bits in the cpMask in the event.mask yield this
-      # event
-      #
-      if event.mask & cpMask:
-        #await self.computeSHA256For(event.path)
-        yield event
-      else:
-        # Note that these events are needed for cleanup purposes.
-        # We'll always get IGNORED events so the watch can be removed
-        # from the inotify.  We don't need to do anything with the
-        # events, but they do need to be generated for cleanup.
-        # We don't need to pass IGNORED events up, because the end-user
-        # doesn't have the inotify instance anyway, and IGNORED is just
-        # used for management purposes.
-        #
-        self.logger.debug(f'UNYIELDED EVENT: {event}')
+    async def addEvent(aCoalescer, anEvent) :
+      """Add an event to the batch, returning False at the end of the
+      events."""
+
+      if anEvent is endOfEvents : return False
+      if self.suppressUnchanged and await self.isUnchangedEvent(anEvent) :
+        self.numEventsSuppressed = self.numEventsSuppressed + 1
+        return True
+      if self.eventRecorder is not None : self.eventRecorder.record(anEvent)
+      aCoalescer.addEvent(anEvent)
+      return True
+
+    try :
+      while self.continueWatchingFS :
+        if pendingGet is None :
+          pendingGet = asyncio.ensure_future(self.fsWatchQueue.get())
+        event = await pendingGet
+        pendingGet = None
+        if event is endOfEvents or not self.continueWatchingFS :
+          return
+
+        aCoalescer = EventCoalescer()
+        moreEvents = await addEvent(aCoalescer, event)
+        deadline   = loop.time() + maxBatchDelay
+        while moreEvents and aCoalescer.numEvents < maxBatchSize :
+          try :
+            moreEvents = await addEvent(
+              aCoalescer, self.fsWatchQueue.get_nowait()
+            )
+            continue
+          except asyncio.QueueEmpty :
+            pass
+          timeLeft = deadline - loop.time()
+          if timeLeft <= 0 : break
+          # we do not cancel an unfinished get (which might lose an
+          # event), instead we keep it for the start of the next batch
+          pendingGet = asyncio.ensure_future(self.fsWatchQueue.get())
+          done, pending = await asyncio.wait([ pendingGet ], timeout=timeLeft)
+          if not done : break
+          moreEvents = await addEvent(aCoalescer, pendingGet.result())
+          pendingGet = None
+
+        # every event in this batch may have been suppressed
+        if len(aCoalescer) : yield aCoalescer.getChanges()
+        if not moreEvents : return
+    finally :
+      if pendingGet is not None : pendingGet.cancel()
 
 ########################################################################
 
-async def watchForInotifyEvents(watches, natsClient):
-  """A long running asyncio process which forwards all file system change
-  events to a NATS server."""
+async def watchForInotifyEvents(
+  fsWatcher, natsClient, aSubject="fsWatcher.events"
+) :
+  """A long running asyncio process which forwards all of an `FSWatcher`'s
+  file system change events to a NATS server (see `eventToMessage`)."""
 
-  async for event in watch_recursive(watches):
-    # logger.info ( f'MAIN: got {event} for path {event.path}')
-    theMsg = {
-      'mask': str(event.mask),
-      'path': str(event.path)
-    }
-    logger.info(f'MAIN: {theMsg}')
-    await natsClient.sendMessage("silly", theMsg)
+  async for event in fsWatcher.watchForFileSystemEvents() :
+    theMsg = eventToMessage(event)
+    fsWatcher.logger.debug(f'FORWARDING: {theMsg}')
+    await natsClient.sendMessage(aSubject, theMsg, sleepTime=-1)
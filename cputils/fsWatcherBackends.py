@@ -0,0 +1,336 @@
+"""
+The (Linux) kernel interfaces used by the `FSWatcher` to watch a file
+system.
+
+A backend provides the same (small) interface as an
+`asyncinotify.Inotify` object:
+
+- `add_watch(path, mask)` : start watching a path, returning a watch
+  object (which has a `wd` and a `path`),
+
+- `rm_watch(watch)` : stop using a watch,
+
+- asynchronous iteration over the events (each of which has a `path`,
+  `mask`, `cookie`, `name` and `watch`),
+
+- `close()`.
+
+together with a `watchesDirectories` attribute which is True if the
+backend needs one watch per directory (the `FSWatcher` then walks and
+watches each directory tree), or False if one watch on a root path
+reports the changes made anywhere in the root path's file system.
+
+Two backends are provided:
+
+- `InotifyBackend` : uses inotify (one watch per directory). This works
+  for any user, but the number of watches is limited (see
+  `cputils.fsWatcher.getMaxUserWatches`).
+
+- `FanotifyBackend` : uses fanotify with `FAN_REPORT_DFID_NAME` (Linux
+  5.9 or later) to watch a whole file system with a single mark. This
+  requires the `CAP_SYS_ADMIN` (and, to resolve the paths of events,
+  `CAP_DAC_READ_SEARCH`) capabilities.
+
+Use `createBackend` to create a backend by name, falling back to inotify
+if fanotify can not be used.
+
+"""
+
+import asyncio
+import collections
+import ctypes
+import ctypes.util
+import logging
+import os
+from pathlib import Path
+import struct
+
+from asyncinotify import Inotify, Mask
+
+from cputils.fsEvent import FSEvent
+
+class InotifyBackend(Inotify) :
+  """The inotify backend, an `asyncinotify.Inotify` which needs one watch
+  per directory."""
+
+  watchesDirectories = True
+  name               = 'inotify'
+
+########################################################################
+# The fanotify constants we need (see: linux/fanotify.h)
+#
+FAN_CLOEXEC          = 0x00000001
+FAN_NONBLOCK         = 0x00000002
+FAN_CLASS_NOTIF      = 0x00000000
+FAN_REPORT_DIR_FID   = 0x00000400
+FAN_REPORT_NAME      = 0x00000800
+FAN_REPORT_DFID_NAME = FAN_REPORT_DIR_FID | FAN_REPORT_NAME
+
+FAN_MARK_ADD         = 0x00000001
+FAN_MARK_REMOVE      = 0x00000002
+FAN_MARK_FILESYSTEM  = 0x00000100
+
+FAN_MODIFY           = 0x00000002
+FAN_CLOSE_WRITE      = 0x00000008
+FAN_MOVED_FROM       = 0x00000040
+FAN_MOVED_TO         = 0x00000080
+FAN_CREATE           = 0x00000100
+FAN_DELETE           = 0x00000200
+FAN_DELETE_SELF      = 0x00000400
+FAN_Q_OVERFLOW       = 0x00004000
+FAN_ONDIR            = 0x40000000
+
+FAN_EVENT_INFO_TYPE_FID       = 1
+FAN_EVENT_INFO_TYPE_DFID_NAME = 2
+FAN_EVENT_INFO_TYPE_DFID      = 3
+
+AT_FDCWD = -100
+
+# The fanotify event bits have the same values as the corresponding
+# inotify (`asyncinotify.Mask`) bits (FAN_ONDIR is IN_ISDIR)
+#
+fanotifyMask = FAN_MODIFY | FAN_CLOSE_WRITE | FAN_MOVED_FROM | \
+  FAN_MOVED_TO | FAN_CREATE | FAN_DELETE | FAN_ONDIR
+
+# struct fanotify_event_metadata
+eventMetadata     = struct.Struct('=IBBHQii')
+# struct fanotify_event_info_header followed by a __kernel_fsid_t
+eventInfoHeader   = struct.Struct('=BBHii')
+# the first two fields of a struct file_handle
+fileHandleHeader  = struct.Struct('=Ii')
+
+class FanotifyMark :
+  """The (watch like) record of one fanotify file system mark."""
+
+  __slots__ = ( 'wd', 'path', 'mask', 'fsid', 'mountFd' )
+
+  def __init__(self, wd, path, mask, fsid, mountFd) :
+    self.wd      = wd
+    self.path    = path
+    self.mask    = mask
+    self.fsid    = fsid
+    self.mountFd = mountFd
+
+libc = None
+
+def getLibC() :
+  """Load (once) the C library functions used by the fanotify backend."""
+
+  global libc
+  if libc is None :
+    aLibC = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    aLibC.fanotify_init.argtypes = [ ctypes.c_uint, ctypes.c_uint ]
+    aLibC.fanotify_init.restype  = ctypes.c_int
+    aLibC.fanotify_mark.argtypes = [
+      ctypes.c_int, ctypes.c_uint, ctypes.c_uint64, ctypes.c_int,
+      ctypes.c_char_p
+    ]
+    aLibC.fanotify_mark.restype  = ctypes.c_int
+    aLibC.open_by_handle_at.argtypes = [
+      ctypes.c_int, ctypes.c_char_p, ctypes.c_int
+    ]
+    aLibC.open_by_handle_at.restype  = ctypes.c_int
+    libc = aLibC
+  return libc
+
+def raiseErrno(aMessage, aPath=None) :
+  anErrno = ctypes.get_errno()
+  raise OSError(anErrno, f"{aMessage}: {os.strerror(anErrno)}", aPath)
+
+class FanotifyBackend :
+  """The fanotify backend, which watches the whole file system containing
+  each watched path with a single (`FAN_MARK_FILESYSTEM`) mark.
+
+  Events are reported for *every* change in a marked file system, so the
+  `FSWatcher` ignores the events for paths outside of its root paths.
+  The directory of each event is reported as a file handle, which is
+  resolved to a path using `open_by_handle_at`. Resolved directories are
+  cached until a directory is moved or deleted.
+
+  Raises `PermissionError` if the process does not have the privileges
+  required to use fanotify."""
+
+  watchesDirectories = False
+  name               = 'fanotify'
+
+  def __init__(self, maxCachedDirs=65536) :
+    aLibC = getLibC()
+    self.fd = aLibC.fanotify_init(
+      FAN_CLASS_NOTIF | FAN_CLOEXEC | FAN_NONBLOCK | FAN_REPORT_DFID_NAME,
+      os.O_RDONLY | os.O_LARGEFILE
+    )
+    if self.fd < 0 : raiseErrno("fanotify_init")
+    self.marks         = { }
+    self.marksByFsid   = { }
+    self.nextWd        = 1
+    self.events        = collections.deque()
+    self.dirCache      = { }
+    self.maxCachedDirs = maxCachedDirs
+
+  def add_watch(self, aPath, aMask) :
+    """Mark the file system containing the path. Only one mark is made
+    for each file system, so later calls for paths in an already marked
+    file system return the existing mark."""
+
+    aPath = Path(aPath)
+    fsid  = os.statvfs(aPath).f_fsid
+    aMark = self.marksByFsid.get(fsid)
+    if aMark is not None : return aMark
+
+    aLibC = getLibC()
+    if aLibC.fanotify_mark(
+      self.fd, FAN_MARK_ADD | FAN_MARK_FILESYSTEM, fanotifyMask,
+      AT_FDCWD, os.fsencode(aPath)
+    ) < 0 :
+      raiseErrno("fanotify_mark", str(aPath))
+    # open_by_handle_at needs a file descriptor on the same file system
+    mountFd = os.open(aPath, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC) \
+      if aPath.is_dir() else os.open(aPath.parent, os.O_RDONLY | os.O_CLOEXEC)
+    aMark = FanotifyMark(self.nextWd, aPath, aMask, fsid, mountFd)
+    self.nextWd = self.nextWd + 1
+    self.marks[aMark.wd]    = aMark
+    self.marksByFsid[fsid]  = aMark
+    return aMark
+
+  def rm_watch(self, aMark) :
+    if self.marks.pop(aMark.wd, None) is None : return
+    self.marksByFsid.pop(aMark.fsid, None)
+    getLibC().fanotify_mark(
+      self.fd, FAN_MARK_REMOVE | FAN_MARK_FILESYSTEM, fanotifyMask,
+      AT_FDCWD, os.fsencode(aMark.path)
+    )
+    os.close(aMark.mountFd)
+
+  def close(self) :
+    for aMark in list(self.marks.values()) :
+      os.close(aMark.mountFd)
+    self.marks.clear()
+    self.marksByFsid.clear()
+    if 0 <= self.fd :
+      os.close(self.fd)
+      self.fd = -1
+
+  def __enter__(self) :
+    return self
+
+  def __exit__(self, excType, excValue, traceback) :
+    self.close()
+
+  def resolveHandle(self, fsid, aHandle) :
+    """Return the (string) path of the directory with the file handle (or
+    None if it can not be found)."""
+
+    aPath = self.dirCache.get(aHandle)
+    if aPath is not None : return aPath
+    aMark = self.marksByFsid.get(fsid)
+    if aMark is None :
+      if not self.marks : return None
+      aMark = next(iter(self.marks.values()))
+    dirFd = getLibC().open_by_handle_at(aMark.mountFd, aHandle, os.O_PATH)
+    if dirFd < 0 : return None
+    try :
+      aPath = os.readlink(f"/proc/self/fd/{dirFd}")
+    finally :
+      os.close(dirFd)
+    if self.maxCachedDirs <= len(self.dirCache) : self.dirCache.clear()
+    self.dirCache[aHandle] = aPath
+    return aPath
+
+  def parseEvents(self, someBytes) :
+    """Parse a buffer of fanotify events, adding an `FSEvent` for
+    each to the queue of events."""
+
+    offset = 0
+    numBytes = len(someBytes)
+    while offset + eventMetadata.size <= numBytes :
+      eventLen, version, reserved, metadataLen, aMask, anFd, aPid = \
+        eventMetadata.unpack_from(someBytes, offset)
+      if eventLen < metadataLen : break
+      if 0 <= anFd : os.close(anFd)
+
+      if aMask & FAN_Q_OVERFLOW :
+        self.events.append(FSEvent(None, Mask.Q_OVERFLOW))
+        offset = offset + eventLen
+        continue
+
+      aPath   = None
+      infoOff = offset + metadataLen
+      infoEnd = offset + eventLen
+      while infoOff + eventInfoHeader.size <= infoEnd :
+        infoType, pad, infoLen, fsidLow, fsidHigh = \
+          eventInfoHeader.unpack_from(someBytes, infoOff)
+        if infoLen == 0 : break
+        if infoType in (FAN_EVENT_INFO_TYPE_DFID_NAME, FAN_EVENT_INFO_TYPE_DFID) :
+          fsid = (fsidLow & 0xffffffff) | ((fsidHigh & 0xffffffff) << 32)
+          handleOff = infoOff + eventInfoHeader.size
+          handleBytes, handleType = fileHandleHeader.unpack_from(
+            someBytes, handleOff
+          )
+          nameOff = handleOff + fileHandleHeader.size + handleBytes
+          aHandle = someBytes[handleOff:nameOff]
+          dirPath = self.resolveHandle(fsid, aHandle)
+          if dirPath is not None :
+            aName = b'.'
+            if infoType == FAN_EVENT_INFO_TYPE_DFID_NAME :
+              aName = someBytes[nameOff:infoOff+infoLen].split(b'\0', 1)[0]
+            if aName == b'.' :
+              aPath = dirPath
+            else :
+              aPath = os.path.join(dirPath, os.fsdecode(aName))
+          break
+        infoOff = infoOff + infoLen
+
+      if aMask & FAN_ONDIR and \
+        aMask & (FAN_MOVED_FROM | FAN_MOVED_TO | FAN_DELETE | FAN_DELETE_SELF) :
+        # the cached paths of this directory (and its sub-directories)
+        # are no longer valid
+        self.dirCache.clear()
+
+      if aPath is not None :
+        self.events.append(FSEvent(aPath, Mask(aMask & fanotifyMask)))
+      offset = offset + eventLen
+
+  def readEvents(self) :
+    try :
+      someBytes = os.read(self.fd, 65536)
+    except BlockingIOError :
+      return
+    self.parseEvents(someBytes)
+
+  def __aiter__(self) :
+    return self
+
+  async def __anext__(self) :
+    while not self.events :
+      if self.fd < 0 : raise StopAsyncIteration
+      loop     = asyncio.get_running_loop()
+      readable = loop.create_future()
+      def markReadable() :
+        if not readable.done() : readable.set_result(None)
+      loop.add_reader(self.fd, markReadable)
+      try :
+        await readable
+      finally :
+        if 0 <= self.fd : loop.remove_reader(self.fd)
+      self.readEvents()
+    return self.events.popleft()
+
+def createBackend(backendName='inotify', logger=None) :
+  """Create a backend by name (`inotify`, `fanotify` or `auto`).
+
+  The `fanotify` and `auto` backends fall back to using inotify if the
+  process does not have the privileges required to use fanotify (or the
+  kernel does not support `FAN_REPORT_DFID_NAME`)."""
+
+  if logger is None : logger = logging.getLogger("FSWatcher")
+  if backendName in ('fanotify', 'auto') :
+    try :
+      return FanotifyBackend()
+    except OSError as err :
+      if backendName == 'fanotify' :
+        logger.warning(f"Can not use fanotify ({err})... using inotify")
+      else :
+        logger.debug(f"Can not use fanotify ({err})... using inotify")
+  elif backendName != 'inotify' :
+    raise ValueError(f"Unknown file system watcher backend: {backendName}")
+  return InotifyBackend()
@@ -0,0 +1,261 @@
+"""
+Share one `FSWatcher` between many consumers of its events.
+
+Only one consumer can iterate an `FSWatcher`'s events, so, without a hub,
+each consumer needs its own watcher (duplicating the watches, and the
+reading, of the same trees). An `FSWatcherHub` reads the events of a
+single watcher and fans them out to any number of `Subscription`s.
+
+Each subscription is interested in the paths below a path prefix
+(optionally filtered by gitignore-style include and exclude patterns, see
+`cputils.pathMatcher`). The subscriptions are indexed by a `PrefixTrie`,
+so finding the subscriptions interested in an event costs one dict lookup
+per component of the event's path, however many subscriptions there are.
+
+Each subscription has its own bounded queue of events. When a
+subscription's queue is full, its `policy` decides what happens:
+
+- `drop` : the event is dropped (and counted in `numDropped`), so a slow
+  subscriber never delays any other subscriber,
+
+- `block` : the hub waits for the subscriber to make room, so no event
+  is lost, but every subscriber waits for the slowest blocking
+  subscriber (closing a blocking subscription abandons any delivery
+  waiting for room in its queue).
+
+"""
+
+import asyncio
+from asyncinotify import Mask
+import logging
+import os
+
+from cputils.pathMatcher import PathMatcher
+
+subscriptionPolicies = ( 'drop', 'block' )
+
+class PrefixNode :
+  """A single path component in a `PrefixTrie`."""
+
+  __slots__ = ( 'children', 'values' )
+
+  def __init__(self) :
+    self.children = { }
+    self.values   = [ ]
+
+class PrefixTrie :
+  """A trie of (absolute) path prefixes, each with a list of values."""
+
+  def __init__(self) :
+    self.root = PrefixNode()
+
+  def add(self, aPrefix, aValue) :
+    aNode = self.root
+    for aName in splitPath(aPrefix) :
+      aNode = aNode.children.setdefault(aName, PrefixNode())
+    aNode.values.append(aValue)
+
+  def remove(self, aPrefix, aValue) :
+    """Remove a value from a prefix, pruning any nodes left empty."""
+
+    someNodes = [ self.root ]
+    someNames = splitPath(aPrefix)
+    for aName in someNames :
+      aNode = someNodes[-1].children.get(aName)
+      if aNode is None : return
+      someNodes.append(aNode)
+    if aValue in someNodes[-1].values : someNodes[-1].values.remove(aValue)
+    for aName in reversed(someNames) :
+      aNode = someNodes.pop()
+      if aNode.values or aNode.children : break
+      del someNodes[-1].children[aName]
+
+  def getValues(self, aPath) :
+    """Return the values of every prefix of the (absolute) path."""
+
+    aNode      = self.root
+    someValues = list(aNode.values)
+    for aName in splitPath(aPath) :
+      aNode = aNode.children.get(aName)
+      if aNode is None : break
+      someValues.extend(aNode.values)
+    return someValues
+
+def splitPath(aPath) :
+  return [ aName for aName in str(aPath).split('/') if aName ]
+
+class Subscription :
+  """A subscriber's (filtered and bounded) queue of events.
+
+  A subscription is an asynchronous iterator of events, which stops once
+  the subscription (or its hub) has been closed.
+
+  - `prefix` : the (absolute) path below which events are wanted.
+
+  - `includePatterns`, `excludePatterns` : optional gitignore-style
+    patterns, relative to the `prefix` (see `cputils.pathMatcher`).
+
+  - `maxSize` : the maximum number of events waiting in the queue.
+
+  - `policy` : what to do with an event when the queue is full (`drop`
+    or `block`).
+
+  """
+
+  def __init__(
+    self, prefix='/', includePatterns=None, excludePatterns=None,
+    maxSize=1024, policy='drop'
+  ) :
+    if policy not in subscriptionPolicies :
+      raise ValueError(f"Unknown subscription policy: {policy}")
+    self.prefix       = os.path.abspath(prefix)
+    self.pathMatcher  = None
+    if includePatterns or excludePatterns :
+      self.pathMatcher = PathMatcher(
+        self.prefix, excludePatterns, includePatterns
+      )
+    self.policy       = policy
+    self.queue        = asyncio.Queue(max(1, maxSize))
+    self.isClosed     = False
+    self.closedEvent  = asyncio.Event()
+    self.numDelivered = 0
+    self.numDropped   = 0
+
+  def wantsEvent(self, event) :
+    """Returns True if the event passes this subscription's patterns (its
+    prefix has already been matched by the hub)."""
+
+    if self.pathMatcher is None : return True
+    return self.pathMatcher.shouldReport(event.path, Mask.ISDIR in event.mask)
+
+  async def deliver(self, event) :
+    if self.isClosed : return
+    if self.policy == 'block' :
+      if self.queue.full() :
+        # wait for room in the queue, unless this subscription is closed
+        # first (otherwise the hub could wait forever)
+        #
+        putTask    = asyncio.ensure_future(self.queue.put(event))
+        closedTask = asyncio.ensure_future(self.closedEvent.wait())
+        try :
+          await asyncio.wait(
+            [ putTask, closedTask ], return_when=asyncio.FIRST_COMPLETED
+          )
+        finally :
+          closedTask.cancel()
+          if not putTask.done() : putTask.cancel()
+        if putTask.cancelled() or not putTask.done() : return
+      else :
+        self.queue.put_nowait(event)
+    else :
+      try :
+        self.queue.put_nowait(event)
+      except asyncio.QueueFull :
+        self.numDropped = self.numDropped + 1
+        return
+    self.numDelivered = self.numDelivered + 1
+
+  def close(self) :
+    """Stop this subscription (any events already queued are still
+    yielded)."""
+
+    if self.isClosed : return
+    self.isClosed = True
+    self.closedEvent.set()
+    # only an empty queue can have an iterator waiting on it
+    if self.queue.empty() : self.queue.put_nowait(None)
+
+  def getStats(self) :
+    return {
+      'prefix'       : self.prefix,
+      'policy'       : self.policy,
+      'numQueued'    : self.queue.qsize(),
+      'numDelivered' : self.numDelivered,
+      'numDropped'   : self.numDropped,
+    }
+
+  def __aiter__(self) :
+    return self
+
+  async def __anext__(self) :
+    if self.isClosed and self.queue.empty() : raise StopAsyncIteration
+    event = await self.queue.get()
+    if event is None : raise StopAsyncIteration
+    return event
+
+class FSWatcherHub :
+  """Fan the events of one `FSWatcher` out to many `Subscription`s.
+
+  - `fsWatcher` : the (shared) watcher whose events are read.
+
+  """
+
+  def __init__(self, fsWatcher, logger=None) :
+    if logger is None : logger = logging.getLogger("FSWatcherHub")
+    self.fsWatcher     = fsWatcher
+    self.logger        = logger
+    self.subscriptions = PrefixTrie()
+    self.subscribers   = [ ]
+    self.hubTask       = None
+    self.numEvents     = 0
+
+  def subscribe(
+    self, prefix='/', includePatterns=None, excludePatterns=None,
+    maxSize=1024, policy='drop'
+  ) :
+    """Return a new `Subscription` to the events below the `prefix` (see
+    `Subscription` for the other options), starting the hub if needed."""
+
+    aSubscription = Subscription(
+      prefix, includePatterns, excludePatterns, maxSize, policy
+    )
+    self.subscriptions.add(aSubscription.prefix, aSubscription)
+    self.subscribers.append(aSubscription)
+    self.start()
+    return aSubscription
+
+  def unsubscribe(self, aSubscription) :
+    """Remove the subscription from the hub and then close it (waking any
+    delivery blocked on its full queue)."""
+
+    self.subscriptions.remove(aSubscription.prefix, aSubscription)
+    if aSubscription in self.subscribers :
+      self.subscribers.remove(aSubscription)
+    aSubscription.close()
+
+  def start(self) :
+    """Ensure the (watcher owned) task reading the watcher's events is
+    running."""
+
+    if self.hubTask is None :
+      self.hubTask = self.fsWatcher.createTask(self.dispatchEvents())
+
+  async def dispatchEvents(self) :
+    """A long running asyncio process which delivers each of the
+    watcher's events to every interested subscription."""
+
+    try :
+      async for event in self.fsWatcher.watchForFileSystemEvents() :
+        if event.path is None : continue
+        self.numEvents = self.numEvents + 1
+        for aSubscription in self.subscriptions.getValues(event.path) :
+          if aSubscription.wantsEvent(event) :
+            await aSubscription.deliver(event)
+    finally :
+      for aSubscription in list(self.subscribers) :
+        aSubscription.close()
+
+  def close(self) :
+    """Close every subscription (the watcher itself is not closed)."""
+
+    if self.hubTask is not None : self.hubTask.cancel()
+    for aSubscription in list(self.subscribers) :
+      self.unsubscribe(aSubscription)
+
+  def getStats(self) :
+    return {
+      'numEvents'     : self.numEvents,
+      'subscriptions' : [
+        aSubscription.getStats() for aSubscription in self.subscribers
+      ],
+    }
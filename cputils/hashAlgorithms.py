@@ -0,0 +1,54 @@
+"""
+The hash algorithms which can be used by the file hashers.
+
+Any `hashlib` algorithm can be used, as well as the `xxhash` algorithms
+and `blake3` (if the optional `xxhash` and `blake3` packages, see the
+`fastHash` extra, are installed). The `fast` algorithm is the fastest
+available of `xxh3_128`, `blake3` and (the always available) `blake2b`.
+
+"""
+
+import hashlib
+
+try :
+  import xxhash
+except ImportError :
+  xxhash = None
+
+try :
+  import blake3
+except ImportError :
+  blake3 = None
+
+# The algorithms tried (in order) for the `fast` algorithm
+fastHashAlgorithms = [ 'xxh3_128', 'blake3', 'blake2b' ]
+
+def isHashAlgorithmAvailable(algorithm) :
+  """Returns True if the (named) hash algorithm can be used."""
+
+  if algorithm.startswith('xxh') :
+    return xxhash is not None and hasattr(xxhash, algorithm)
+  if algorithm == 'blake3' : return blake3 is not None
+  return algorithm in hashlib.algorithms_available
+
+def resolveHashAlgorithm(algorithm) :
+  """Return the name of the hash algorithm to use for the (named)
+  algorithm, replacing `fast` with the fastest available algorithm.
+  Raises ValueError if the algorithm is not available."""
+
+  if algorithm == 'fast' :
+    for aFastAlgorithm in fastHashAlgorithms :
+      if isHashAlgorithmAvailable(aFastAlgorithm) : return aFastAlgorithm
+  if not isHashAlgorithmAvailable(algorithm) :
+    raise ValueError(f"The {algorithm} hash algorithm is not available")
+  return algorithm
+
+def newHash(algorithm) :
+  """Return a new hash object (with `update` and `hexdigest` methods) for
+  the (named) algorithm."""
+
+  if algorithm.startswith('xxh') and xxhash is not None :
+    return getattr(xxhash, algorithm)()
+  if algorithm == 'blake3' and blake3 is not None :
+    return blake3.blake3()
+  return hashlib.new(algorithm)
@@ -0,0 +1,139 @@
+"""
+A priority queue of files to be hashed.
+
+When a large checkout floods the `FSWatcher`'s SHA256 queue, the hash of
+the file the user has just saved should not wait behind thousands of
+cold files. A `HashQueue` is an `asyncio.Queue` of `(path, future)`
+requests which are taken in order of:
+
+1. whether or not the path is a dependency of some task (see
+   `cputils.artefactManager.ArtefactManager.isTaskDependency`),
+
+2. the recency of the (event) time at which the path was requested, the
+   most recent first.
+
+A path which is requested while it is still queued is not queued twice.
+Its (existing) request is moved to its new priority, and the same
+future is returned to both requesters.
+
+Re-prioritised requests are collapsed lazily: the old heap entry is only
+marked as stale, and is skipped (and discarded) when it reaches the top
+of the heap.
+
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+# The indices of the fields of a heap entry (a list, so that an entry
+# can be marked as stale in place)
+#
+DEP_CLASS = 0
+RECENCY   = 1
+SEQ       = 2
+PATH      = 3
+FUTURE    = 4
+
+class HashQueue(asyncio.Queue) :
+  """An (unbounded) priority queue of `(path, future)` hash requests.
+
+  - `isDependency` : an optional callable which returns True if a path is
+    a dependency of some task (such requests are taken first).
+
+  """
+
+  def __init__(self, isDependency=None) :
+    super().__init__()
+    self.isDependency = isDependency
+    self.numCollapsed = 0
+
+  def _init(self, maxsize) :
+    # `asyncio.Queue` sizes itself using `_queue`, which (only) holds the
+    # live entries (by path)
+    self.heap    = [ ]
+    self.entries = self._queue = { }
+    self.counter = itertools.count()
+
+  def _put(self, anItem) :
+    aPath, aFuture = anItem[0], anItem[1]
+    aTime = anItem[2] if 2 < len(anItem) else time.monotonic()
+    anEntry = [
+      self.getDependencyClass(aPath), -aTime, next(self.counter),
+      aPath, aFuture
+    ]
+    self.entries[aPath] = anEntry
+    heapq.heappush(self.heap, anEntry)
+
+  def _get(self) :
+    while True :
+      anEntry = heapq.heappop(self.heap)
+      if anEntry[PATH] is not None : break
+    del self.entries[anEntry[PATH]]
+    return (anEntry[PATH], anEntry[FUTURE])
+
+  def getDependencyClass(self, aPath) :
+    if self.isDependency is not None and self.isDependency(aPath) : return 0
+    return 1
+
+  def put_nowait(self, anItem) :
+    """Put a `(path, future)` (or `(path, future, eventTime)`) request
+    into this queue. If the path is already queued, the queued request is
+    moved to its new priority, and the given future is resolved with the
+    queued request's result."""
+
+    aPath, aFuture = anItem[0], anItem[1]
+    oldEntry = self.entries.get(aPath)
+    if oldEntry is None :
+      super().put_nowait(anItem)
+      return
+    if aFuture is not oldEntry[FUTURE] :
+      oldEntry[FUTURE].add_done_callback(
+        lambda oldFuture : copyFutureResult(oldFuture, aFuture)
+      )
+    self.reprioritise(oldEntry, anItem[2] if 2 < len(anItem) else None)
+
+  def requestHash(self, aPath, aTime=None) :
+    """Queue a request to hash a path (requested in response to an event
+    at the `time.monotonic()` time `aTime`, by default now), returning
+    the `asyncio.Future` of the path's hash. A path which is already
+    queued is not queued again, its existing future is returned."""
+
+    oldEntry = self.entries.get(aPath)
+    if oldEntry is not None :
+      self.reprioritise(oldEntry, aTime)
+      return oldEntry[FUTURE]
+    if aTime is None : aTime = time.monotonic()
+    aFuture = asyncio.get_running_loop().create_future()
+    self.put_nowait((aPath, aFuture, aTime))
+    return aFuture
+
+  def reprioritise(self, oldEntry, aTime) :
+    if aTime is None : aTime = time.monotonic()
+    aPath    = oldEntry[PATH]
+    newEntry = [
+      self.getDependencyClass(aPath), min(oldEntry[RECENCY], -aTime),
+      next(self.counter), aPath, oldEntry[FUTURE]
+    ]
+    oldEntry[PATH] = None
+    self.entries[aPath] = newEntry
+    heapq.heappush(self.heap, newEntry)
+    self.numCollapsed = self.numCollapsed + 1
+
+    # Discard the stale entries once they outnumber the live ones
+    #
+    if 2 * len(self.entries) + 64 < len(self.heap) :
+      self.heap = [
+        anEntry for anEntry in self.heap if anEntry[PATH] is not None
+      ]
+      heapq.heapify(self.heap)
+
+def copyFutureResult(fromFuture, toFuture) :
+  if toFuture.done() : return
+  if fromFuture.cancelled() :
+    toFuture.cancel()
+  elif fromFuture.exception() is not None :
+    toFuture.set_exception(fromFuture.exception())
+  else :
+    toFuture.set_result(fromFuture.result())
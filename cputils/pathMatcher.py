@@ -0,0 +1,282 @@
+"""
+A gitignore-style path matcher.
+
+The `PathMatcher` compiles a collection of gitignore-style include and
+exclude patterns, *once*, into a small number of regular expressions, so
+that a path can be classified with a few regular expression matches no
+matter how many patterns have been supplied.
+
+All paths are matched *relative* to the matcher's root path, using `/` as
+the path separator. The supported pattern syntax is:
+
+- blank lines and lines starting with `#` are ignored,
+
+- a leading `!` negates a pattern (re-including anything excluded by an
+  earlier pattern),
+
+- a trailing `/` only matches directories,
+
+- a pattern containing a `/` (other than a trailing `/`) is anchored to
+  the root path, otherwise it matches at any depth,
+
+- `*` matches anything except a `/`, `?` matches any one character except
+  a `/`, and `[...]` matches one character in a character class,
+
+- `**` (as a complete path component) matches any number of directories.
+
+As with gitignore, the *last* matching pattern wins. By default a matcher
+only classifies the path it is given, it does not check the path's parent
+directories. Walkers are expected to prune excluded directories, so the
+contents of an excluded directory are never seen. Where nothing is walked
+(for example, the fanotify or replay backends of an `FSWatcher`),
+`shouldReport` can also check every ancestor directory of a path against
+the directory exclude patterns (see `isInExcludedDir`), caching the
+result for each directory.
+
+"""
+
+import os
+import re
+
+# The maximum number of directories whose exclusion is cached (by each
+# `PathMatcher`)
+#
+maxCachedDirs = 65536
+
+# Directories which are rarely of any interest to a ComputePod, but which
+# can be very large.
+#
+commonExcludePatterns = [
+  '.git/',
+  '.hg/',
+  '.svn/',
+  'node_modules/',
+  '__pycache__/',
+  '.mypy_cache/',
+  '.pytest_cache/',
+  '.tox/',
+]
+
+def translatePattern(aPattern) :
+  """Translate a single gitignore-style pattern into a tuple of (regular
+  expression string, isNegated, isDirOnly, isAnchored).
+
+  Unanchored patterns (those without a `/`) are translated so that they
+  match the *last* component of a path.
+
+  Returns None for blank lines and comments."""
+
+  aPattern = aPattern.rstrip()
+  if not aPattern or aPattern.startswith('#') : return None
+
+  isNegated = False
+  if aPattern.startswith('!') :
+    isNegated = True
+    aPattern  = aPattern[1:]
+  elif aPattern.startswith('\\!') or aPattern.startswith('\\#') :
+    aPattern  = aPattern[1:]
+
+  isDirOnly = False
+  if aPattern.endswith('/') :
+    isDirOnly = True
+    aPattern  = aPattern.rstrip('/')
+
+  isAnchored = '/' in aPattern
+  aPattern   = aPattern.lstrip('/')
+  if not aPattern : return None
+
+  regExp     = [ ]
+  components = aPattern.split('/')
+  lastIndex  = len(components) - 1
+  for index, aComponent in enumerate(components) :
+    if aComponent == '**' :
+      if index == lastIndex :
+        regExp.append('.*')
+      else :
+        regExp.append('(?:.*/)?')
+      continue
+    regExp.append(translateComponent(aComponent))
+    if index < lastIndex : regExp.append('/')
+
+  return (''.join(regExp), isNegated, isDirOnly, isAnchored)
+
+def translateComponent(aComponent) :
+  """Translate the glob characters in one path component into a regular
+  expression string."""
+
+  regExp = [ ]
+  i = 0
+  n = len(aComponent)
+  while i < n :
+    c = aComponent[i]
+    i = i + 1
+    if c == '*' :
+      while i < n and aComponent[i] == '*' : i = i + 1
+      regExp.append('[^/]*')
+    elif c == '?' :
+      regExp.append('[^/]')
+    elif c == '\\' and i < n :
+      regExp.append(re.escape(aComponent[i]))
+      i = i + 1
+    elif c == '[' :
+      j = i
+      if j < n and aComponent[j] in '!^' : j = j + 1
+      if j < n and aComponent[j] == ']' : j = j + 1
+      while j < n and aComponent[j] != ']' : j = j + 1
+      if n <= j :
+        regExp.append('\\[')
+      else :
+        charClass = aComponent[i:j].replace('\\', '\\\\')
+        if charClass and charClass[0] in '!^' :
+          charClass = '^' + charClass[1:]
+        regExp.append('[' + charClass + ']')
+        i = j + 1
+    else :
+      regExp.append(re.escape(c))
+  return ''.join(regExp)
+
+class CompiledPatterns :
+  """A collection of gitignore-style patterns compiled into (at most) two
+  regular expressions.
+
+  Unanchored patterns are compiled into one regular expression which is
+  matched against the last component of a path, while anchored patterns
+  are compiled into another regular expression which is matched against
+  the whole (relative) path. This avoids the (very expensive)
+  backtracking which would be required to match unanchored patterns at
+  any depth of the whole path.
+
+  Each pattern becomes one named alternative of its regular expression.
+  The alternatives are listed in *reverse* order, so that the first
+  alternative to (fully) match is the *last* matching pattern. The name
+  of the matching alternative records both the pattern's index and
+  whether or not it was negated."""
+
+  def __init__(self, somePatterns, forDirs) :
+    baseNameAlternatives = [ ]
+    anchoredAlternatives = [ ]
+    for index, aPattern in enumerate(somePatterns) :
+      translated = translatePattern(aPattern)
+      if translated is None : continue
+      regExp, isNegated, isDirOnly, isAnchored = translated
+      if isDirOnly and not forDirs : continue
+      groupName = ('n' if isNegated else 'p') + str(index)
+      anAlternative = f"(?P<{groupName}>{regExp})"
+      if isAnchored :
+        anchoredAlternatives.append(anAlternative)
+      else :
+        baseNameAlternatives.append(anAlternative)
+
+    self.baseNameRegExp = compileAlternatives(baseNameAlternatives)
+    self.anchoredRegExp = compileAlternatives(anchoredAlternatives)
+
+  def isEmpty(self) :
+    return self.baseNameRegExp is None and self.anchoredRegExp is None
+
+  def matches(self, relPath) :
+    """Returns True if the last pattern which matches the path is not a
+    negated pattern."""
+
+    lastGroup = None
+    if self.baseNameRegExp is not None :
+      aMatch = self.baseNameRegExp.fullmatch(relPath, relPath.rfind('/') + 1)
+      if aMatch is not None : lastGroup = aMatch.lastgroup
+    if self.anchoredRegExp is not None :
+      aMatch = self.anchoredRegExp.fullmatch(relPath)
+      if aMatch is not None :
+        if lastGroup is None or int(lastGroup[1:]) < int(aMatch.lastgroup[1:]) :
+          lastGroup = aMatch.lastgroup
+    return lastGroup is not None and lastGroup[0] == 'p'
+
+def compileAlternatives(someAlternatives) :
+  if not someAlternatives : return None
+  someAlternatives.reverse()
+  return re.compile('|'.join(someAlternatives), re.DOTALL)
+
+class PathMatcher :
+  """Decide which paths below a root path should be watched and reported,
+  using gitignore-style include and exclude patterns.
+
+  - `rootPath` : the (directory) path against which all patterns are
+    anchored (a relative root path is made absolute, so the paths
+    matched must be absolute).
+
+  - `excludePatterns` : a list of gitignore-style patterns of paths which
+    should be neither watched nor reported.
+
+  - `includePatterns` : a list of gitignore-style patterns of the *files*
+    which should be reported. When no include patterns are given, all
+    (non-excluded) files are reported. Directories are always walked
+    (unless excluded) so that included files can be found.
+
+  """
+
+  def __init__(self, rootPath, excludePatterns=None, includePatterns=None) :
+    if excludePatterns is None : excludePatterns = [ ]
+    if includePatterns is None : includePatterns = [ ]
+    self.rootPath        = os.path.abspath(rootPath)
+    self.excludePatterns = list(excludePatterns)
+    self.includePatterns = list(includePatterns)
+    self.excludeDirs     = CompiledPatterns(self.excludePatterns, True)
+    self.excludeFiles    = CompiledPatterns(self.excludePatterns, False)
+    self.includeFiles    = CompiledPatterns(self.includePatterns, False)
+    self.hasIncludes     = not self.includeFiles.isEmpty()
+    self.excludedDirs    = { }
+
+  def isEmpty(self) :
+    """Returns True if this matcher will never exclude any path."""
+
+    return self.excludeDirs.isEmpty() and not self.hasIncludes
+
+  def relativePath(self, aPath) :
+    """Return the path, relative to this matcher's root path, or None if
+    the path is not below the root path. The root path itself is returned
+    as the empty string."""
+
+    aPath = str(aPath)
+    if aPath == self.rootPath : return ''
+    rootLen = len(self.rootPath)
+    if aPath.startswith(self.rootPath) and aPath[rootLen:rootLen+1] == '/' :
+      return aPath[rootLen+1:]
+    return None
+
+  def isExcluded(self, relPath, isDir=False) :
+    """Returns True if the (relative) path matches the exclude
+    patterns."""
+
+    if not relPath : return False
+    if isDir : return self.excludeDirs.matches(relPath)
+    return self.excludeFiles.matches(relPath)
+
+  def isInExcludedDir(self, relPath) :
+    """Returns True if any ancestor directory of the (relative) path
+    matches the directory exclude patterns."""
+
+    slashIndex = relPath.rfind('/')
+    if slashIndex < 0 : return False
+    dirPath  = relPath[:slashIndex]
+    excluded = self.excludedDirs.get(dirPath)
+    if excluded is None :
+      excluded = self.isInExcludedDir(dirPath) or \
+        self.excludeDirs.matches(dirPath)
+      if maxCachedDirs <= len(self.excludedDirs) : self.excludedDirs.clear()
+      self.excludedDirs[dirPath] = excluded
+    return excluded
+
+  def isIncluded(self, relPath, isDir=False) :
+    """Returns True if the (relative) path should be reported."""
+
+    if self.isExcluded(relPath, isDir) : return False
+    if isDir or not self.hasIncludes : return True
+    return self.includeFiles.matches(relPath)
+
+  def shouldReport(self, aPath, isDir=False, checkAncestors=False) :
+    """Returns True if the (absolute) path should be reported. Paths which
+    are not below the root path are always reported. When
+    `checkAncestors` is True, paths in excluded directories are not
+    reported (for when excluded directories have not been pruned)."""
+
+    relPath = self.relativePath(aPath)
+    if relPath is None : return True
+    if checkAncestors and self.isInExcludedDir(relPath) : return False
+    return self.isIncluded(relPath, isDir)
@@ -0,0 +1,174 @@
+"""
+An adaptive, stat based, polling file system scanner.
+
+The `PollingScanner` is used by the `FSWatcher` to watch directory trees
+which can not (or should not) be watched using inotify, for example once
+the system's limit on the number of inotify watches is nearly exhausted.
+
+Each polled tree is periodically re-scanned (using `os.scandir`, in a
+worker thread) into a new `FSSnapshot` which is compared with the tree's
+previous snapshot. Each polled tree has its own polling interval, which
+doubles (up to `maxInterval`) every time a scan finds no changes, and
+which drops back to `minInterval` as soon as a change is found. So quiet
+(cold) trees cost very little to poll, while active trees are polled
+often.
+
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+
+from asyncinotify import Mask
+
+from cputils.fsSnapshot import FSSnapshot
+
+class PolledTree :
+  """The polling state of a single directory tree."""
+
+  __slots__ = (
+    'path', 'pathMatcher', 'snapshot', 'interval', 'nextPoll', 'numPolls'
+  )
+
+  def __init__(self, path, pathMatcher, snapshot, interval) :
+    self.path        = path
+    self.pathMatcher = pathMatcher
+    self.snapshot    = snapshot
+    self.interval    = interval
+    self.nextPoll    = time.monotonic()
+    self.numPolls    = 0
+
+class PollingScanner :
+  """Poll a collection of directory trees for changes.
+
+  - `reportChange` : an async callback, taking a path and an
+    `asyncinotify.Mask`, which is called for every change found.
+
+  - `minInterval`, `maxInterval` : the bounds (in seconds) of the
+    adaptive polling interval of each tree.
+
+  """
+
+  def __init__(
+    self, reportChange, minInterval=0.5, maxInterval=30.0, logger=None
+  ) :
+    if logger is None : logger = logging.getLogger("PollingScanner")
+    self.reportChange = reportChange
+    self.minInterval  = minInterval
+    self.maxInterval  = maxInterval
+    self.logger       = logger
+    self.trees        = { }
+    self.pollQueue    = [ ]
+    self.treeAdded    = None
+    self.continuePolling = True
+
+  def __len__(self) :
+    return len(self.trees)
+
+  def isPolled(self, aPath) :
+    """Returns True if the path is in one of the polled trees."""
+
+    if not self.trees : return False
+    aPath = os.path.abspath(aPath)
+    # check the path and each of its parent directories (the cost is
+    # proportional to the depth of the path, not to the number of trees)
+    index = len(aPath)
+    while 0 < index :
+      if aPath[:index] in self.trees : return True
+      index = aPath.rfind('/', 0, index)
+    return False
+
+  def getNumPolledPaths(self) :
+    """Returns the number of paths in all of the polled trees (as of their
+    last scan)."""
+
+    return sum(
+      len(aTree.snapshot) for aTree in self.trees.values()
+        if aTree.snapshot is not None
+    )
+
+  def addTree(self, aPath, pathMatcher=None, snapshot=None) :
+    """Start polling a directory tree.
+
+    The optional `snapshot` is the (`FSSnapshot`) state of the tree when
+    it stopped being watched by other means. If it is not supplied, the
+    tree's first scan only records the tree's state."""
+
+    aPath = os.path.abspath(aPath)
+    if self.isPolled(aPath) : return
+    # any polled trees below this path are now part of this tree
+    for aTreePath in list(self.trees) :
+      if aTreePath.startswith(aPath + '/') :
+        del self.trees[aTreePath]
+    aTree = PolledTree(aPath, pathMatcher, snapshot, self.minInterval)
+    self.trees[aPath] = aTree
+    heapq.heappush(self.pollQueue, (aTree.nextPoll, id(aTree), aTree))
+    if self.treeAdded is not None : self.treeAdded.set()
+
+  def removeTree(self, aPath) :
+    self.trees.pop(os.path.abspath(aPath), None)
+
+  def stopPolling(self) :
+    self.continuePolling = False
+    if self.treeAdded is not None : self.treeAdded.set()
+
+  async def pollTree(self, aTree) :
+    """Scan a tree (in a worker thread), report its changes and adapt its
+    polling interval."""
+
+    newSnapshot = FSSnapshot()
+    await asyncio.get_running_loop().run_in_executor(
+      None, newSnapshot.scanTree, aTree.path, aTree.pathMatcher
+    )
+    aTree.numPolls = aTree.numPolls + 1
+    oldSnapshot    = aTree.snapshot
+    aTree.snapshot = newSnapshot
+    if oldSnapshot is None : return 0
+
+    created, modified, deleted = oldSnapshot.diff(newSnapshot)
+    numChanges = len(created) + len(modified) + len(deleted)
+    if numChanges :
+      aTree.interval = self.minInterval
+    else :
+      aTree.interval = min(aTree.interval * 2, self.maxInterval)
+
+    for aPath, isDir in created :
+      await self.reportChange(aPath, Mask.CREATE | (Mask.ISDIR if isDir else 0))
+    for aPath, isDir in modified :
+      await self.reportChange(aPath, Mask.CLOSE_WRITE)
+    for aPath, isDir in deleted :
+      await self.reportChange(aPath, Mask.DELETE | (Mask.ISDIR if isDir else 0))
+    return numChanges
+
+  async def runPolling(self) :
+    """A long running asyncio process which polls each tree when its
+    polling interval has passed."""
+
+    self.treeAdded = asyncio.Event()
+    while self.continuePolling :
+      if not self.pollQueue :
+        self.treeAdded.clear()
+        await self.treeAdded.wait()
+        continue
+
+      nextPoll, treeId, aTree = self.pollQueue[0]
+      timeToWait = nextPoll - time.monotonic()
+      if 0 < timeToWait :
+        self.treeAdded.clear()
+        try :
+          await asyncio.wait_for(self.treeAdded.wait(), timeToWait)
+        except asyncio.TimeoutError :
+          pass
+        continue
+
+      heapq.heappop(self.pollQueue)
+      if self.trees.get(aTree.path) is not aTree : continue
+      try :
+        await self.pollTree(aTree)
+      except Exception as err :
+        self.logger.error(f"Exception while polling {aTree.path}")
+        self.logger.exception(err)
+      aTree.nextPoll = time.monotonic() + aTree.interval
+      heapq.heappush(self.pollQueue, (aTree.nextPoll, treeId, aTree))
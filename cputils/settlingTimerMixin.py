@@ -8,114 +8,353 @@ seconds).
 This mixin can also be configured to send a "settled" NATS message
 (default: no message).
 
-We implement this mixin by monkey patching a given class.
+Each object's timers are held in its own `SettlingTimerSet` (its
+`settlingTimers` attribute), whose methods are added to the object.
 
-To add this mixin to a class you supply the class object to the
-`mixinSettlingTimer`, you can then use the `addSettlingTimer` to add
+To add this mixin to an object (or to a class, in which case each
+instance lazily gets its own `SettlingTimerSet`) you supply the object to
+the `mixinSettlingTimer`, you can then use the `addSettlingTimer` to add
 additional timers.
 
 Every object with a settling timer has a `main` timer, they may have one
 or more other timers.
 
+A timer may be "adaptive", in which case its timeout follows the
+observed time between (consecutive) `unSettle` calls: an exponentially
+weighted moving average (EWMA) of the gaps, and of their variance, is
+kept, and the timeout is
+
+    adaptiveGapFactor * meanGap + adaptiveDeviations * stdDevOfGaps
+
+(bounded by the timer's `minTimeOut` and `maxTimeOut`). So the settle
+latency scales with the real traffic. A gap across a settle is only
+observed if it is less than twice the current timeout, so when the
+traffic slows down a little (and the timer settles before the next
+`unSettle`) the timeout grows again. A longer gap is taken to be the
+quiet time between two bursts, and is not observed.
+
+Under continuous traffic a timer would never settle, so a timer may have
+a `maxWait` ceiling: once `maxWait` seconds have passed since the first
+`unSettle` (of the current generation), the timer's callback is forced to
+run (even though the timer has not settled), and the timer then
+continues debouncing. Each timer counts its `numForcedFires`.
+
+Waiting for a timer to settle (see `waitUntilSettled`) gives up, by
+default, after `defaultWaitTimeOut` seconds, so a caller waiting on a
+timer under continuous traffic (without a `maxWait`) does not wait
+forever.
+
 """
 
 import asyncio
+import math
 import yaml
 
+# The weight of each new gap, the multiple of the mean gap, and the number
+# of standard deviations, used by adaptive timers
+#
+adaptiveAlpha      = 0.25
+adaptiveGapFactor  = 2.0
+adaptiveDeviations = 4.0
+
+# The default time (in seconds) `waitUntilSettled` waits for a timer to
+# settle
+#
+defaultWaitTimeOut = 1.0
+
 class SettlingTimer :
+  """A single settling (debouncing) timer.
+
+  Each timer keeps (at most) one `loop.call_at` handle. Re-starting an
+  unsettled timer only moves its deadline (an O(1) update which creates
+  no tasks), the handle is only re-scheduled (to the latest deadline)
+  when it fires early. A task is only created to run the callback, once,
+  when the timer settles.
+
+  Each "generation" of an unsettled timer has (at most) one
+  `settledFuture`, created by the first waiter (see `waitUntilSettled`),
+  which is resolved once the timer has settled (and its callback has
+  finished), so any number of waiters wake exactly once."""
+
+  __slots__ = (
+    'timerName', 'timeOut', 'callback', 'hasSettled',
+    'deadline', 'handle', 'future', 'settledFuture',
+    'adaptive', 'minTimeOut', 'maxTimeOut', 'lastTime', 'meanGap', 'varGap',
+    'maxWait', 'firstTime', 'numForcedFires'
+  )
+
   def __init__(
     self,
     timerName,
     timeOut=0.01,
     aCallback=None,
+    adaptive=False,
+    minTimeOut=None,
+    maxTimeOut=None,
+    maxWait=None,
   ) :
     if timeOut is None    : timeOut = 0.01
+    if minTimeOut is None : minTimeOut = 0
+    if maxTimeOut is None : maxTimeOut = 10 * timeOut
 
+    self.timerName   = timerName
     self.timeOut     = timeOut
     self.callback    = aCallback
     self.hasSettled  = True
+    self.deadline    = None
+    self.handle      = None
     self.future      = None
+    self.settledFuture = None
+    self.adaptive    = adaptive
+    self.minTimeOut  = minTimeOut
+    self.maxTimeOut  = maxTimeOut
+    self.lastTime    = None
+    self.meanGap     = None
+    self.varGap      = 0.0
+    self.maxWait     = maxWait
+    self.firstTime   = None
+    self.numForcedFires = 0
+
+  def observeGap(self, aGap) :
+    """Update the EWMA of the gaps between unSettle calls, and so the
+    timeout, of this (adaptive) timer."""
+
+    if self.meanGap is None :
+      self.meanGap = aGap
+    else :
+      aDelta       = aGap - self.meanGap
+      self.meanGap = self.meanGap + adaptiveAlpha * aDelta
+      self.varGap  = (1 - adaptiveAlpha) * (
+        self.varGap + adaptiveAlpha * aDelta * aDelta
+      )
+    aTimeOut = adaptiveGapFactor * self.meanGap + \
+      adaptiveDeviations * math.sqrt(self.varGap)
+    self.timeOut = min(self.maxTimeOut, max(self.minTimeOut, aTimeOut))
+
+  def unSettle(self) :
+    """(re)Starts this timer."""
+
+    loop = asyncio.get_running_loop()
+    now  = loop.time()
+    if self.adaptive :
+      if self.lastTime is not None and now - self.lastTime < 2 * self.timeOut :
+        self.observeGap(now - self.lastTime)
+      self.lastTime = now
+    if self.hasSettled : self.firstTime = now
+    self.hasSettled = False
+    self.deadline   = now + self.timeOut
+    fireTime = self.getFireTime()
+    if self.handle is not None and fireTime < self.handle.when() :
+      # an adaptive timeout has shrunk
+      self.handle.cancel()
+      self.handle = None
+    if self.handle is None :
+      self.handle = loop.call_at(fireTime, self.checkDeadline, loop)
+
+  def getFireTime(self) :
+    """Return the time at which this (unsettled) timer fires: its deadline,
+    or, if sooner, its `maxWait` ceiling."""
+
+    if self.maxWait is None : return self.deadline
+    return min(self.deadline, self.firstTime + self.maxWait)
+
+  def checkDeadline(self, loop) :
+    # the deadline has moved since the handle was scheduled
+    fireTime = self.getFireTime()
+    if self.handle.when() < fireTime :
+      self.handle = loop.call_at(fireTime, self.checkDeadline, loop)
+      return
+
+    # the maxWait ceiling has been reached before the timer settled, so
+    # force the callback to run, and continue debouncing
+    #
+    if fireTime < self.deadline :
+      self.numForcedFires = self.numForcedFires + 1
+      self.firstTime      = fireTime
+      if self.callback is not None :
+        self.future = asyncio.ensure_future(self.callback())
+      self.handle = loop.call_at(self.getFireTime(), self.checkDeadline, loop)
+      return
+
+    self.handle     = None
+    self.hasSettled = True
+    settledFuture   = self.settledFuture
+    self.settledFuture = None
+    if self.callback is not None :
+      self.future = asyncio.ensure_future(self.callback())
+      if settledFuture is not None :
+        self.future.add_done_callback(
+          lambda aFuture : signalSettled(settledFuture)
+        )
+    elif settledFuture is not None :
+      signalSettled(settledFuture)
+
+  def getSettledFuture(self) :
+    """Return the future which is resolved once this (unsettled) timer's
+    current generation has settled."""
+
+    if self.settledFuture is None :
+      self.settledFuture = asyncio.get_running_loop().create_future()
+    return self.settledFuture
+
+  def getStats(self) :
+    return {
+      'timeOut'        : self.timeOut,
+      'hasSettled'     : self.hasSettled,
+      'maxWait'        : self.maxWait,
+      'numForcedFires' : self.numForcedFires,
+    }
+
+def signalSettled(settledFuture) :
+  if not settledFuture.done() : settledFuture.set_result(True)
+
+class SettlingTimerSet :
+  """A (per object) collection of named settling timers, which always
+  contains a `main` timer.
+
+  - `mainTimeOut` : the main timer will sleep for mainTimeOut seconds
+    before determining that the object's values have settled.
+
+  - `mainCallback` : an async python method which will be called when
+    the main timer settles (this can be used, for example, to send a NATS
+    message which contains details of the settled object).
 
-def mixinSettlingTimer(
-  klass,
-  mainTimeOut=0.01,
-  mainCallback=None,
-) :
-  """Mixin the settling (debouncing) timer to the supplied class.
+  """
 
-    - `timeOut` : the settling timer will sleep for timeOut seconds before
-      determining that the instance's values have settled.
+  __slots__ = ( 'timers', )
 
-    - `aCallback` : an async python method which will be called when the
-      timer settles (this can be used, for example, to send a NATS
-      message which contains details of the settled object).
+  def __init__(self, mainTimeOut=0.01, mainCallback=None) :
+    self.timers = { 'main' : SettlingTimer('main', mainTimeOut, mainCallback) }
 
-  """
+  def __len__(self) :
+    return len(self.timers)
 
-  timers         = {}
-  timers['main'] = SettlingTimer('main', mainTimeOut, mainCallback)
+  def hasSettled(self, timerName = 'main') :
+    """Returns True if the object is not currently waiting for its settle
+    timer."""
 
-  async def runSettlingTimer(timerName = 'main') :
-    """Runs the settling timer."""
+    timer = self.timers.get(timerName)
+    if timer is None : return True
 
-    if timerName not in timers : return
+    return timer.hasSettled
 
-    timer = timers[timerName]
-    timer.hasSettled = False
-    await asyncio.sleep(timer.timeOut)
-    timer.hasSettled = True
+  async def unSettle(self, timerName = 'main') :
+    """(re)Starts the settling timer."""
 
-    if timer.callback is not None :
-      await timer.callback()
+    timer = self.timers.get(timerName)
+    if timer is None : return
 
-  def hasSettled(timerName = 'main') :
-    """Returns True if the class is not currently waiting for its settle
-    timer."""
+    timer.unSettle()
 
-    if timerName not in timers : return True
+  async def waitUntilSettled(
+    self, timerName='main', timeOut=defaultWaitTimeOut
+  ) :
+    """Wait until the timer has settled (and its callback has finished),
+    or until `timeOut` seconds (by default, `defaultWaitTimeOut`) have
+    passed. A `timeOut` of None waits forever. Returns True if the timer
+    settled, or False if the wait timed out."""
+
+    timer = self.timers.get(timerName)
+    if timer is None : return True
+
+    if timer.hasSettled :
+      if timer.future is None or timer.future.done() : return True
+      # the callback is still running
+      aFuture = timer.future
+    else :
+      aFuture = timer.getSettledFuture()
+    done, pending = await asyncio.wait([ aFuture ], timeout=timeOut)
+    return bool(done)
 
-    return timers[timerName].hasSettled
+  def addSettlingTimer(
+    self,
+    timerName,
+    timeOut=0.01,
+    aCallback=None,
+    adaptive=False,
+    minTimeOut=None,
+    maxTimeOut=None,
+    maxWait=None
+  ) :
+    """Add a named timer.
 
-  klass.hasSettled = hasSettled
+    - `adaptive` : when True, the timer's timeout (initially `timeOut`)
+      follows the observed gaps between its `unSettle` calls, bounded by
+      `minTimeOut` (default 0) and `maxTimeOut` (default ten times
+      `timeOut`).
 
-  async def unSettle(timerName = 'main') :
-    """(re)Starts the settling timer."""
+    - `maxWait` : when not None, the callback is forced to run once
+      `maxWait` seconds have passed since the first (unsettled)
+      `unSettle`, even if the timer is still being unsettled.
 
-    if timerName not in timers : return
+    """
 
-    timer = timers[timerName]
+    if timerName in self.timers : return
 
-    if timer.future :
-      timer.future.cancel()
-      if not timer.future.done() :
-        await asyncio.wait([timer.future])
-    timer.future = asyncio.ensure_future(runSettlingTimer(timerName))
+    self.timers[timerName] = SettlingTimer(
+      timerName, timeOut, aCallback, adaptive, minTimeOut, maxTimeOut,
+      maxWait
+    )
 
-  klass.unSettle  = unSettle
+  def getTimerStats(self, timerName='main') :
+    """Returns a dict of the named timer's current timeout, state and
+    number of forced fires (or None if there is no such timer)."""
 
-  async def waitUntilSettled(timerName='main', sleepTime=0.01, maxSleeps=100) :
+    timer = self.timers.get(timerName)
+    if timer is None : return None
 
-    if timerName not in timers : return
+    return timer.getStats()
 
-    timer = timers[timerName]
-    for i in range(maxSleeps) :
-      await asyncio.sleep(sleepTime)
-      if timer.hasSettled : break
-    await asyncio.sleep(sleepTime)
+settlingTimerMethods = (
+  'hasSettled', 'unSettle', 'waitUntilSettled', 'addSettlingTimer',
+  'getTimerStats'
+)
 
-  klass.waitUntilSettled = waitUntilSettled
+def mixinSettlingTimer(
+  klass,
+  mainTimeOut=0.01,
+  mainCallback=None,
+) :
+  """Mixin the settling (debouncing) timers to the supplied object (or
+  class).
 
-  def addSettlingTimer(
-    timerName,
-    timeOut=0.01,
-    aCallback=None
-  ) :
+    - `mainTimeOut` : the main settling timer will sleep for mainTimeOut
+      seconds before determining that the instance's values have settled.
 
-    if timerName in timers : return
+    - `mainCallback` : an async python method which will be called when
+      the main timer settles (this can be used, for example, to send a
+      NATS message which contains details of the settled object). When
+      mixed into a class, the callback is bound to each instance.
 
-    timers[timerName] = SettlingTimer(timerName, timeOut, aCallback)
+  """
 
-  klass.addSettlingTimer = addSettlingTimer
+  if not isinstance(klass, type) :
+    timerSet = SettlingTimerSet(mainTimeOut, mainCallback)
+    klass.settlingTimers = timerSet
+    for aMethodName in settlingTimerMethods :
+      setattr(klass, aMethodName, getattr(timerSet, aMethodName))
+    return
+
+  def getSettlingTimers(self) :
+    timerSet = self.__dict__.get('settlingTimers')
+    if timerSet is None :
+      aCallback = mainCallback
+      if aCallback is not None : aCallback = aCallback.__get__(self)
+      timerSet = SettlingTimerSet(mainTimeOut, aCallback)
+      self.__dict__['settlingTimers'] = timerSet
+    return timerSet
+
+  klass.settlingTimers = property(getSettlingTimers)
+
+  def delegateTo(aMethodName) :
+    def aMethod(self, *args, **kwargs) :
+      return getattr(self.settlingTimers, aMethodName)(*args, **kwargs)
+    aMethod.__name__ = aMethodName
+    aMethod.__doc__  = getattr(SettlingTimerSet, aMethodName).__doc__
+    return aMethod
+
+  for aMethodName in settlingTimerMethods :
+    setattr(klass, aMethodName, delegateTo(aMethodName))
 
 def moveKWarg(key, kwargs, options) :
   if key in kwargs :
@@ -130,4 +369,4 @@ class SettlingDict(dict) :
     moveKWarg('natsSubject', kwargs, options)
     moveKWarg('natsMessage', kwargs, options)
     super().__init__(*args, **kwargs)
-    mixinSettlingTimer(self, **kwargs)
+    mixinSettlingTimer(self, options.get('timeOut', 0.01))
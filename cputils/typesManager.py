@@ -12,10 +12,12 @@ class TypesManager :
 
     mixinSettlingTimer(self)
     self.addSettlingTimer(
-      'typeRegistration', 0.5, self.typeRegistrationSettled
+      'typeRegistration', 0.5, self.typeRegistrationSettled,
+      adaptive=True, minTimeOut=0.15, maxTimeOut=5.0, maxWait=10.0
     )
     self.addSettlingTimer(
-      'rulesRegistration', 0.5, self.ruleRegistrationSettled
+      'rulesRegistration', 0.5, self.ruleRegistrationSettled,
+      adaptive=True, minTimeOut=0.15, maxTimeOut=5.0, maxWait=10.0
     )
 
   def getTypeNames(self) :
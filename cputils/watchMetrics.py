@@ -0,0 +1,211 @@
+"""
+Lightweight metrics for the `FSWatcher`.
+
+A `Histogram` records (positive) values in logarithmic buckets (a fixed
+number of buckets per power of two), so recording a value is a few
+arithmetic operations and a dict update, while percentiles can still be
+estimated to within the width of one bucket.
+
+A `TimedQueue` is an `asyncio.Queue` which records how long each item
+waits in the queue, and how deep the queue is when each item is put.
+
+The `WatchMetrics` collects all of the histograms kept by an `FSWatcher`
+which has been created with `collectMetrics=True`.
+
+"""
+
+import asyncio
+import collections
+import math
+import time
+
+class Histogram :
+  """A histogram of values with logarithmic buckets.
+
+  - `subBuckets` : the number of buckets per power of two (the relative
+    width of each bucket is at most `1/subBuckets`).
+
+  """
+
+  __slots__ = (
+    'subBuckets', 'count', 'total', 'minValue', 'maxValue', 'numZeros',
+    'buckets'
+  )
+
+  def __init__(self, subBuckets=4) :
+    self.subBuckets = subBuckets
+    self.clear()
+
+  def clear(self) :
+    self.count    = 0
+    self.total    = 0
+    self.minValue = None
+    self.maxValue = None
+    self.numZeros = 0
+    self.buckets  = { }
+
+  def record(self, aValue) :
+    """Add a value to this histogram."""
+
+    self.count = self.count + 1
+    self.total = self.total + aValue
+    if self.minValue is None or aValue < self.minValue : self.minValue = aValue
+    if self.maxValue is None or self.maxValue < aValue : self.maxValue = aValue
+    if aValue <= 0 :
+      self.numZeros = self.numZeros + 1
+      return
+    mantissa, exponent = math.frexp(aValue)
+    index = exponent * self.subBuckets + \
+      int((mantissa - 0.5) * 2 * self.subBuckets)
+    buckets = self.buckets
+    buckets[index] = buckets.get(index, 0) + 1
+
+  def getBucketLimit(self, index) :
+    """Return the upper limit of the values in a bucket."""
+
+    exponent, subBucket = divmod(index, self.subBuckets)
+    return math.ldexp(0.5 + (subBucket + 1) / (2 * self.subBuckets), exponent)
+
+  def getPercentile(self, aPercentile) :
+    """Return an estimate (the upper limit of the bucket) of the value
+    below which the given percentage of the recorded values lie."""
+
+    if not self.count : return None
+    wanted = aPercentile * self.count / 100
+    numSeen = self.numZeros
+    if wanted <= numSeen : return 0
+    for index in sorted(self.buckets) :
+      numSeen = numSeen + self.buckets[index]
+      if wanted <= numSeen :
+        return min(self.getBucketLimit(index), self.maxValue)
+    return self.maxValue
+
+  def toDict(self) :
+    """Return a (JSON serializable) summary of this histogram."""
+
+    return {
+      'count'   : self.count,
+      'mean'    : self.total / self.count if self.count else None,
+      'min'     : self.minValue,
+      'max'     : self.maxValue,
+      'p50'     : self.getPercentile(50),
+      'p90'     : self.getPercentile(90),
+      'p99'     : self.getPercentile(99),
+      'buckets' : [ [ 0, self.numZeros ] ] + [
+        [ self.getBucketLimit(index), self.buckets[index] ]
+          for index in sorted(self.buckets)
+      ],
+    }
+
+class RateCounter :
+  """Count events, recording the number of events in each (non-empty)
+  second in a `Histogram`."""
+
+  __slots__ = ( 'second', 'numThisSecond', 'numEvents', 'rates' )
+
+  def __init__(self) :
+    self.second        = None
+    self.numThisSecond = 0
+    self.numEvents     = 0
+    self.rates         = Histogram()
+
+  def record(self, aTime) :
+    aSecond = int(aTime)
+    if aSecond != self.second :
+      if self.numThisSecond : self.rates.record(self.numThisSecond)
+      self.second        = aSecond
+      self.numThisSecond = 0
+    self.numThisSecond = self.numThisSecond + 1
+    self.numEvents     = self.numEvents + 1
+
+  def toDict(self) :
+    return {
+      'numEvents'       : self.numEvents,
+      'eventsPerSecond' : self.rates.toDict(),
+    }
+
+class TimedQueue(asyncio.Queue) :
+  """An `asyncio.Queue` which calls `onPut(item, depth)` whenever an item
+  is put, and `onGet(item, waitTime)` whenever an item is taken, where
+  `waitTime` is the time (in seconds) the item spent in the queue."""
+
+  def __init__(self, onPut=None, onGet=None) :
+    super().__init__()
+    self.onPut    = onPut
+    self.onGet    = onGet
+    self.putTimes = collections.deque()
+
+  def _put(self, anItem) :
+    super()._put(anItem)
+    self.putTimes.append(time.perf_counter())
+    if self.onPut is not None : self.onPut(anItem, self.qsize())
+
+  def _get(self) :
+    anItem   = super()._get()
+    waitTime = time.perf_counter() - self.putTimes.popleft()
+    if self.onGet is not None : self.onGet(anItem, waitTime)
+    return anItem
+
+class WatchMetrics :
+  """The histograms collected by an `FSWatcher`:
+
+  - `queueDepths` : the depths of the `pathsToWatch` and `fsWatch`
+    queues, recorded as each item is added,
+
+  - `watchRequestWaits` : the time (in seconds) each request to (un)watch
+    a path waits in the `pathsToWatchQueue`,
+
+  - `eventLatencies` : for each kind of change (see
+    `cputils.fsWatcher.getChangeKind`), the time (in seconds) from an
+    event being read (or found by a rescan or by polling) to it being
+    taken by a consumer of the watcher's events,
+
+  - `addWatchTimes` : the time (in seconds) taken to add each watch,
+
+  - `rootRates` : for each root path, the number of events per second.
+
+  """
+
+  def __init__(self) :
+    self.startTime         = time.perf_counter()
+    self.queueDepths       = {
+      'pathsToWatch' : Histogram(),
+      'fsWatch'      : Histogram(),
+    }
+    self.watchRequestWaits = Histogram()
+    self.eventLatencies    = { }
+    self.addWatchTimes     = Histogram()
+    self.rootRates         = { }
+
+  def recordEventLatency(self, aKind, waitTime) :
+    aHistogram = self.eventLatencies.get(aKind)
+    if aHistogram is None :
+      aHistogram = self.eventLatencies[aKind] = Histogram()
+    aHistogram.record(waitTime)
+
+  def recordRootEvent(self, aRootPath, aTime) :
+    aCounter = self.rootRates.get(aRootPath)
+    if aCounter is None :
+      aCounter = self.rootRates[aRootPath] = RateCounter()
+    aCounter.record(aTime)
+
+  def toDict(self) :
+    """Return a (JSON serializable) summary of all of the histograms."""
+
+    return {
+      'duration'          : time.perf_counter() - self.startTime,
+      'queueDepths'       : {
+        aName : aHistogram.toDict()
+          for aName, aHistogram in self.queueDepths.items()
+      },
+      'watchRequestWaits' : self.watchRequestWaits.toDict(),
+      'eventLatencies'    : {
+        aKind : aHistogram.toDict()
+          for aKind, aHistogram in self.eventLatencies.items()
+      },
+      'addWatchTimes'     : self.addWatchTimes.toDict(),
+      'rootRates'         : {
+        aRootPath : aCounter.toDict()
+          for aRootPath, aCounter in self.rootRates.items()
+      },
+    }
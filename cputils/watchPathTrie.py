@@ -0,0 +1,242 @@
+"""
+An index of inotify watches keyed by both watch descriptor and path.
+
+The `WatchPathTrie` stores each watched path as a chain of nodes, one node
+per path component, so that all of the watches below a given directory
+form a single sub-tree. When a watched directory is moved, the sub-tree
+can be detached and re-attached under its new name, after which only the
+paths of the watches *in* the moved sub-tree need to be updated.
+
+Each node also records the (monotonic) time of the last event seen by its
+watch, so that the coldest (least recently active) sub-trees can be found
+when watches need to be given up.
+
+"""
+
+from pathlib import Path
+
+class WatchNode :
+  """A single path component in a `WatchPathTrie`."""
+
+  __slots__ = ( 'name', 'parent', 'children', 'watch', 'lastEvent' )
+
+  def __init__(self, name, parent) :
+    self.name      = name
+    self.parent    = parent
+    self.children  = None
+    self.watch     = None
+    self.lastEvent = 0
+
+  def getPath(self) :
+    """Return the (string) path of this node."""
+
+    someNames = [ ]
+    aNode     = self
+    while aNode.parent is not None :
+      someNames.append(aNode.name)
+      aNode = aNode.parent
+    someNames.reverse()
+    return '/' + '/'.join(someNames)
+
+class WatchPathTrie :
+  """A trie of the (absolute) paths being watched, indexed by watch
+  descriptor.
+
+  Watches are expected to be `asyncinotify.Watch`-like objects which have
+  a `wd` (watch descriptor) and a (settable) `path`. """
+
+  def __init__(self) :
+    self.root    = WatchNode('', None)
+    self.wd2node = { }
+
+  def __len__(self) :
+    return len(self.wd2node)
+
+  def __contains__(self, aPath) :
+    aNode = self.getNode(aPath)
+    return aNode is not None and aNode.watch is not None
+
+  def getNode(self, aPath, create=False) :
+    """Return the node for the (absolute) path, creating it (and any
+    missing parent nodes) if `create` is True."""
+
+    aNode = self.root
+    for aName in str(aPath).split('/') :
+      if not aName : continue
+      children = aNode.children
+      if children is None :
+        if not create : return None
+        children = aNode.children = { }
+      aChild = children.get(aName)
+      if aChild is None :
+        if not create : return None
+        aChild = children[aName] = WatchNode(aName, aNode)
+      aNode = aChild
+    return aNode
+
+  def addWatch(self, aPath, aWatch) :
+    """Record that the (absolute) path is being watched by the watch."""
+
+    oldNode = self.wd2node.get(aWatch.wd)
+    aNode   = self.getNode(aPath, create=True)
+    if oldNode is not None and oldNode is not aNode :
+      oldNode.watch = None
+      self.pruneNode(oldNode)
+    aNode.watch = aWatch
+    self.wd2node[aWatch.wd] = aNode
+
+  def removeWatch(self, wd) :
+    """Forget the watch with the given watch descriptor, returning it (or
+    None if it is not known)."""
+
+    aNode = self.wd2node.pop(wd, None)
+    if aNode is None : return None
+    aWatch = aNode.watch
+    aNode.watch = None
+    self.pruneNode(aNode)
+    return aWatch
+
+  def pruneNode(self, aNode) :
+    """Remove the node, and any of its parents, which no longer hold
+    either a watch or any children."""
+
+    while aNode.parent is not None and aNode.watch is None \
+      and not aNode.children :
+      parent   = aNode.parent
+      children = parent.children
+      if children is not None and children.get(aNode.name) is aNode :
+        del children[aNode.name]
+      aNode = parent
+
+  def touchWatch(self, wd, aTime) :
+    """Record the time of the most recent event seen by a watch."""
+
+    aNode = self.wd2node.get(wd)
+    if aNode is not None : aNode.lastEvent = aTime
+
+  def getWatch(self, aPath) :
+    aNode = self.getNode(aPath)
+    if aNode is None : return None
+    return aNode.watch
+
+  def getPath(self, wd) :
+    """Return the (string) path of the watch descriptor, or None if the
+    watch descriptor is not known."""
+
+    aNode = self.wd2node.get(wd)
+    if aNode is None : return None
+    return aNode.getPath()
+
+  def walkSubTree(self, aNode, nodePath) :
+    """Yield the (node, path) pairs for all of the nodes in the sub-tree
+    starting at (and including) aNode, whose path is nodePath."""
+
+    nodesToWalk = [ (aNode, nodePath) ]
+    while nodesToWalk :
+      aNode, nodePath = nodesToWalk.pop()
+      yield (aNode, nodePath)
+      if aNode.children :
+        for aName, aChild in aNode.children.items() :
+          nodesToWalk.append((aChild, nodePath + '/' + aName))
+
+  def getWatchesBelow(self, aPath) :
+    """Return a list of all of the watches at or below the path."""
+
+    aNode = self.getNode(aPath)
+    if aNode is None : return [ ]
+    return [
+      aNode.watch for aNode, nodePath in self.walkSubTree(aNode, str(aPath))
+        if aNode.watch is not None
+    ]
+
+  def moveSubTree(self, oldPath, newPath) :
+    """Move the sub-tree of watches at oldPath to newPath, updating the
+    path of each watch in the sub-tree.
+
+    The cost is proportional to the size of the moved sub-tree. Returns
+    the number of watches whose paths have been updated."""
+
+    oldPath = str(oldPath).rstrip('/')
+    newPath = str(newPath).rstrip('/')
+    aNode   = self.getNode(oldPath)
+    if aNode is None or aNode.parent is None : return 0
+
+    oldParent = aNode.parent
+    del oldParent.children[aNode.name]
+
+    newParentPath, newName = newPath.rsplit('/', 1)
+    newParent = self.getNode(newParentPath, create=True)
+    if newParent.children is None : newParent.children = { }
+    # any sub-tree already at newPath has been replaced (its watches will
+    # be removed by their (inotify) IGNORED events)
+    newParent.children[newName] = aNode
+    aNode.name   = newName
+    aNode.parent = newParent
+    self.pruneNode(oldParent)
+
+    numRenamed = 0
+    for aSubNode, subNodePath in self.walkSubTree(aNode, newPath) :
+      if aSubNode.watch is not None :
+        aSubNode.watch.path = Path(subNodePath)
+        numRenamed = numRenamed + 1
+    return numRenamed
+
+  def getColdestSubTrees(self, numWatches, keepPaths=( )) :
+    """Choose the coldest sub-trees which together hold at least
+    `numWatches` watches, returning a list of their (string) paths.
+
+    The temperature of a sub-tree is the time of the most recent event
+    seen by any watch in the sub-tree. Of two equally cold sub-trees, the
+    larger is chosen first (so that as few sub-trees as possible are
+    chosen). The paths in `keepPaths` (and their parent directories) are
+    never chosen, and no chosen sub-tree contains another."""
+
+    # walk the trie once, then accumulate each sub-tree's temperature and
+    # number of watches from its leaves upwards
+    someNodes  = list(self.walkSubTree(self.root, ''))
+    lastEvents = { }
+    numInTree  = { }
+    for aNode, nodePath in reversed(someNodes) :
+      lastEvent = aNode.lastEvent
+      numFound  = 0 if aNode.watch is None else 1
+      if aNode.children :
+        for aChild in aNode.children.values() :
+          if lastEvent < lastEvents[aChild] : lastEvent = lastEvents[aChild]
+          numFound = numFound + numInTree[aChild]
+      lastEvents[aNode] = lastEvent
+      numInTree[aNode]  = numFound
+
+    blocked = set()
+    for aPath in keepPaths :
+      aNode = self.getNode(str(aPath).rstrip('/'))
+      while aNode is not None :
+        blocked.add(aNode)
+        aNode = aNode.parent
+
+    candidates = [
+      ( lastEvents[aNode], -numInTree[aNode], nodePath, aNode )
+        for aNode, nodePath in someNodes
+          if aNode.watch is not None and aNode not in blocked
+    ]
+    candidates.sort(key=lambda aCandidate : aCandidate[:3])
+
+    chosen      = set()
+    chosenPaths = [ ]
+    numChosen   = 0
+    for lastEvent, negNumInTree, nodePath, aNode in candidates :
+      if numWatches <= numChosen : break
+      if aNode in blocked : continue
+      # skip any sub-tree inside an already chosen sub-tree
+      aParent = aNode.parent
+      while aParent is not None and aParent not in chosen :
+        aParent = aParent.parent
+      if aParent is not None : continue
+      chosen.add(aNode)
+      chosenPaths.append(nodePath)
+      numChosen = numChosen - negNumInTree
+      # block the parents of this sub-tree (they would contain it)
+      aParent = aNode.parent
+      while aParent is not None and aParent not in blocked :
+        blocked.add(aParent)
+        aParent = aParent.parent
+    return chosenPaths
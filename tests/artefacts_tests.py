@@ -384,3 +384,29 @@ class TestArtefactsManager(unittest.TestCase) :
 
     am.createTupGraphDot('/tmp/artefactsTupGraph.dot')
 
+
+  def test_isTaskDependency(t) :
+    """Ensure only the (secondary) dependencies of tasks are task
+    dependencies."""
+
+    am = ArtefactManager(None)
+    am.artefacts = {
+      'a.joy'  : { 'creates'   : { 'a.jout' : { 'aTask' : { 'chef' : True } } } },
+      'b.joy'  : { 'usedBy'    : { 'a.jout' : { 'aTask' : { 'chef' : True } } } },
+      'a.jout' : { 'createdBy' : { 'a.joy'  : { 'aTask' : { 'chef' : True } } } },
+    }
+    t.assertTrue(am.isTaskDependency('a.joy'))
+    t.assertTrue(am.isTaskDependency('b.joy'))
+    t.assertFalse(am.isTaskDependency('a.jout'))
+    t.assertFalse(am.isTaskDependency('c.joy'))
+
+    # absolute paths are only checked below the project root
+    t.assertFalse(am.isTaskDependency('/project/a.joy'))
+    am = ArtefactManager(None, '/project')
+    am.artefacts = {
+      'src/a.joy' : { 'creates' : { 'a.jout' : { 'aTask' : { 'chef' : True } } } },
+    }
+    t.assertTrue(am.isTaskDependency('/project/src/a.joy'))
+    t.assertTrue(am.isTaskDependency('src/a.joy'))
+    t.assertFalse(am.isTaskDependency('/project/src/b.joy'))
+    t.assertFalse(am.isTaskDependency('/elsewhere/src/a.joy'))
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import shutil
+import unittest
+
+from cputils.chunkedHasher import ( ChunkManifest, hashFileInChunks,
+  merkleRoot, readChunk )
+from cputils.hashAlgorithms import resolveHashAlgorithm
+
+chunkedTestDir = '/tmp/cputils-tests-chunkedHasher'
+chunkSize      = 4096
+
+class TestChunkedHasher(unittest.TestCase) :
+
+  def setUp(t) :
+    os.makedirs(chunkedTestDir, exist_ok=True)
+    t.aPath = os.path.join(chunkedTestDir, 'large.bin')
+    with open(t.aPath, 'wb') as f :
+      f.write(os.urandom(10 * chunkSize + 100))
+
+  def tearDown(t) :
+    shutil.rmtree(chunkedTestDir)
+
+  def test_merkleRoot(t) :
+    """Ensure the Merkle root depends upon every digest and upon their
+    order."""
+
+    someDigests = [ hashlib.sha256(bytes([i])).digest() for i in range(5) ]
+    aRoot = merkleRoot(someDigests)
+    t.assertNotEqual(aRoot, merkleRoot(someDigests[:4]))
+    t.assertNotEqual(aRoot, merkleRoot(list(reversed(someDigests))))
+    t.assertNotEqual(merkleRoot(someDigests[:1]), someDigests[0].hex())
+    t.assertEqual(merkleRoot([]), hashlib.sha256().hexdigest())
+
+  def test_hashFileInChunks(t) :
+    """Ensure only the changed chunks of a modified (or appended) file are
+    re-hashed (unless verifying), and that the result is the same as
+    hashing every chunk."""
+
+    aManifest, numHashed = hashFileInChunks(t.aPath, chunkSize=chunkSize)
+    t.assertEqual((len(aManifest), numHashed), (11, 11))
+    t.assertEqual(aManifest.checkAlgorithm, resolveHashAlgorithm('fast'))
+
+    # an unchanged file re-hashes nothing
+    sameManifest, numHashed = hashFileInChunks(t.aPath, aManifest, chunkSize)
+    t.assertEqual(numHashed, 0)
+    t.assertEqual(sameManifest.root, aManifest.root)
+    sameManifest, numHashed = hashFileInChunks(
+      t.aPath, aManifest, chunkSize, verify=True
+    )
+    t.assertEqual(numHashed, 11)
+    t.assertEqual(sameManifest.root, aManifest.root)
+
+    # the checks of a different check algorithm can not be compared
+    sha256Manifest, numHashed = hashFileInChunks(
+      t.aPath, aManifest, chunkSize, checkAlgorithm='sha256'
+    )
+    t.assertEqual(numHashed, 11)
+    t.assertEqual(sha256Manifest.checks, sha256Manifest.digests)
+    t.assertEqual(sha256Manifest.root, aManifest.root)
+
+    # modify one chunk in the middle and append to the (short) last chunk
+    with open(t.aPath, 'r+b') as f :
+      f.seek(3 * chunkSize + 10)
+      f.write(b'changed')
+      f.seek(0, os.SEEK_END)
+      f.write(os.urandom(2 * chunkSize))
+    newManifest, numHashed = hashFileInChunks(t.aPath, aManifest, chunkSize)
+    t.assertEqual(len(newManifest), 13)
+    t.assertEqual(numHashed, 1 + 3)
+    t.assertNotEqual(newManifest.root, aManifest.root)
+
+    fullManifest, numHashed = hashFileInChunks(
+      t.aPath, newManifest, chunkSize, verify=True
+    )
+    t.assertEqual(numHashed, 13)
+    t.assertEqual(fullManifest.root, newManifest.root)
+
+  def test_truncatedFile(t) :
+    """Ensure a file which is shorter than when it was opened (for
+    example, truncated while being hashed) is hashed up to its end."""
+
+    aManifest, numHashed = hashFileInChunks(t.aPath, chunkSize=chunkSize)
+    with open(t.aPath, 'r+b') as f :
+      f.truncate(3 * chunkSize + 5)
+      f.seek(0)
+      aView = memoryview(bytearray(chunkSize))
+      t.assertEqual(
+        [ readChunk(f, aView) for i in range(5) ],
+        [ chunkSize, chunkSize, chunkSize, 5, 0 ]
+      )
+    newManifest, numHashed = hashFileInChunks(t.aPath, aManifest, chunkSize)
+    t.assertEqual((len(newManifest), newManifest.size), (4, 3 * chunkSize + 5))
+    t.assertEqual(newManifest.digests[:3], aManifest.digests[:3])
+
+  def test_manifestBytes(t) :
+    """Ensure a manifest survives its binary encoding."""
+
+    aManifest, numHashed = hashFileInChunks(t.aPath, chunkSize=chunkSize)
+    copiedManifest = ChunkManifest.fromBytes(aManifest.toBytes())
+    t.assertEqual(copiedManifest.size, aManifest.size)
+    t.assertEqual(copiedManifest.chunkSize, chunkSize)
+    t.assertEqual(copiedManifest.checkAlgorithm, aManifest.checkAlgorithm)
+    t.assertEqual(copiedManifest.checks, aManifest.checks)
+    t.assertEqual(copiedManifest.digests, aManifest.digests)
+    t.assertEqual(copiedManifest.root, aManifest.root)
+
+    emptyPath = os.path.join(chunkedTestDir, 'empty.bin')
+    open(emptyPath, 'wb').close()
+    emptyManifest, numHashed = hashFileInChunks(emptyPath)
+    t.assertEqual((len(emptyManifest), numHashed), (0, 0))
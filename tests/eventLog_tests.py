@@ -0,0 +1,101 @@
+import asyncio
+import os
+import shutil
+import time
+import unittest
+
+from asyncinotify import Mask
+from cputils.eventLog import EventRecorder, ReplayBackend, readEventLog
+from cputils.fsWatcher import FSEvent, FSWatcher
+from tests.testUtils import asyncTestOfProcess
+
+eventLogTestDir = '/tmp/cputils-tests-eventLog'
+
+class TestEventLog(unittest.TestCase) :
+
+  def setUp(t) :
+    os.makedirs(eventLogTestDir, exist_ok=True)
+    t.logPath = os.path.join(eventLogTestDir, 'events.log')
+
+  def tearDown(t) :
+    shutil.rmtree(eventLogTestDir)
+
+  def writeLog(t, someEvents) :
+    with EventRecorder(t.logPath) as aRecorder :
+      for aTime, aPath, aMask in someEvents :
+        aRecorder.record(FSEvent(aPath, aMask), aTime)
+
+  def test_recordAndRead(t) :
+    """Ensure recorded events are read back unchanged."""
+
+    t.writeLog([
+      (10.0,  '/a/b.txt',       Mask.CREATE),
+      (10.5,  '/a/b.txt',       Mask.CLOSE_WRITE),
+      (11.25, '/a/été', Mask.DELETE | Mask.ISDIR),
+    ])
+    someEvents = [
+      (aTime, event.pathStr, event.mask, event.cookie)
+        for aTime, event in readEventLog(t.logPath)
+    ]
+    t.assertEqual(someEvents, [
+      (10.0,  '/a/b.txt',       Mask.CREATE,               0),
+      (10.5,  '/a/b.txt',       Mask.CLOSE_WRITE,          0),
+      (11.25, '/a/été', Mask.DELETE | Mask.ISDIR, 0),
+    ])
+
+    with open(t.logPath, 'wb') as f :
+      f.write(b'not an event log')
+    with t.assertRaises(ValueError) :
+      readEventLog(t.logPath)
+
+  @asyncTestOfProcess(None)
+  async def test_replaySpeeds(t) :
+    """Ensure events are replayed with their (scaled) timing, or as fast
+    as possible, and that the watcher's consumers then stop."""
+
+    t.writeLog([
+      (100.0 + i * 0.1, f"/a/f{i}.txt", Mask.CLOSE_WRITE) for i in range(5)
+    ])
+    for aSpeed, minTime, maxTime in [ (2, 0.18, 0.5), (None, 0, 0.1) ] :
+      async with FSWatcher(backend=ReplayBackend(t.logPath, aSpeed)) as aWatcher :
+        startTime = time.monotonic()
+        somePaths = [
+          str(anEvent.path) async for anEvent in aWatcher.watchForFileSystemEvents()
+        ]
+        duration  = time.monotonic() - startTime
+      t.assertEqual(somePaths, [ f"/a/f{i}.txt" for i in range(5) ])
+      t.assertTrue(minTime <= duration <= maxTime, (aSpeed, duration))
+
+  @asyncTestOfProcess(None)
+  async def test_recordWatcherEvents(t) :
+    """Ensure a watcher records the events it yields, and that replaying
+    them (as batches) yields the same changes."""
+
+    watchedDir = os.path.join(eventLogTestDir, 'watched')
+    os.makedirs(watchedDir)
+    async with FSWatcher() as aWatcher :
+      await aWatcher.watchARootPath(watchedDir)
+      await aWatcher.pathsToWatchQueue.join()
+      aWatcher.recordEvents(t.logPath)
+      someEvents = aWatcher.watchForFileSystemEvents()
+      for aName in [ 'a.txt', 'b.txt' ] :
+        with open(os.path.join(watchedDir, aName), 'w') as f :
+          f.write("some text")
+      recordedPaths = set()
+      while len(recordedPaths) < 2 :
+        anEvent = await asyncio.wait_for(someEvents.__anext__(), 2)
+        recordedPaths.add(str(anEvent.path))
+      await asyncio.sleep(0.1)
+      numRecorded = aWatcher.eventRecorder.numRecorded
+      await someEvents.aclose()
+    t.assertIsNone(aWatcher.eventRecorder)
+
+    async with FSWatcher(backend=ReplayBackend(t.logPath, None)) as aWatcher :
+      await aWatcher.watchARootPath(watchedDir)
+      someChanges = [ ]
+      async for aBatch in aWatcher.watchForFileSystemEventBatches() :
+        someChanges.extend(aBatch)
+      t.assertEqual(aWatcher.backend.numReplayed, numRecorded)
+    t.assertEqual(
+      set(str(aChange.path) for aChange in someChanges), recordedPaths
+    )
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import shutil
+import unittest
+
+from cputils.fileHasher import (
+  FileHasher, HashCache, hashFile, isHashAlgorithmAvailable, newHash,
+  resolveHashAlgorithm
+)
+from tests.testUtils import asyncTestOfProcess
+
+hasherTestDir = '/tmp/cputils-tests-fileHasher'
+
+class TestFileHasher(unittest.TestCase) :
+
+  def setUp(t) :
+    os.makedirs(hasherTestDir, exist_ok=True)
+    t.somePaths = { }
+    for aSize in [ 0, 1, 1024 * 1024, 3 * 1024 * 1024 + 7 ] :
+      aPath = os.path.join(hasherTestDir, f"file{aSize}")
+      someBytes = os.urandom(aSize)
+      with open(aPath, 'wb') as f :
+        f.write(someBytes)
+      t.somePaths[aPath] = someBytes
+
+  def tearDown(t) :
+    shutil.rmtree(hasherTestDir)
+
+  def test_hashFile(t) :
+    """Ensure chunked hashing matches hashing the whole file at once."""
+
+    for aPath, someBytes in t.somePaths.items() :
+      t.assertEqual(hashFile(aPath), hashlib.sha256(someBytes).hexdigest())
+      t.assertEqual(
+        hashFile(aPath, 'blake2b', chunkSize=4096),
+        hashlib.blake2b(someBytes).hexdigest()
+      )
+
+  @asyncTestOfProcess(None)
+  async def test_fileHasher(t) :
+    """Ensure files are hashed in the worker threads."""
+
+    aHasher = FileHasher(numWorkers=2)
+    try :
+      for aPath, someBytes in t.somePaths.items() :
+        t.assertEqual(
+          await aHasher.hashFile(aPath), hashlib.sha256(someBytes).hexdigest()
+        )
+    finally :
+      aHasher.shutdown()
+
+  def test_hashCache(t) :
+    """Ensure cached hashes are only valid while their signatures are
+    unchanged, and that the least recently used hashes are evicted."""
+
+    aCache = HashCache(maxEntries=2)
+    aCache.put('/a', (1, 1, 1, False), 'hashA')
+    aCache.put('/b', (2, 2, 2, False), 'hashB')
+    t.assertEqual(aCache.get('/a', (1, 1, 1, False)), 'hashA')
+    t.assertIsNone(aCache.get('/b', (2, 3, 2, False)))
+    t.assertEqual(aCache.getLastHash('/b'), 'hashB')
+    aCache.put('/c', (3, 3, 3, False), 'hashC')
+    t.assertIsNone(aCache.getLastHash('/b'))
+    t.assertEqual(aCache.getLastHash('/a'), 'hashA')
+    t.assertEqual(
+      (aCache.numHits, aCache.numMisses, aCache.numEvictions), (1, 1, 1)
+    )
+
+  @asyncTestOfProcess(None)
+  async def test_cachedFileHasher(t) :
+    """Ensure a file is only re-hashed once its signature has changed."""
+
+    aCache  = HashCache()
+    aHasher = FileHasher(hashCache=aCache)
+    try :
+      aPath = next(iter(t.somePaths))
+      firstHash = await aHasher.hashFile(aPath)
+      t.assertEqual(await aHasher.hashFile(aPath), firstHash)
+      t.assertEqual((aCache.numHits, aCache.numMisses), (1, 1))
+      with open(aPath, 'wb') as f :
+        f.write(b"some new contents")
+      t.assertEqual(
+        await aHasher.hashFile(aPath),
+        hashlib.sha256(b"some new contents").hexdigest()
+      )
+      t.assertEqual((aCache.numHits, aCache.numMisses), (1, 2))
+    finally :
+      aHasher.shutdown()
+
+  def test_resolveHashAlgorithm(t) :
+    """Ensure `fast` resolves to an available algorithm (at worst
+    `blake2b`), and that unavailable algorithms are rejected."""
+
+    fastAlgorithm = resolveHashAlgorithm('fast')
+    t.assertTrue(isHashAlgorithmAvailable(fastAlgorithm))
+    if not isHashAlgorithmAvailable('xxh3_128') \
+      and not isHashAlgorithmAvailable('blake3') :
+      t.assertEqual(fastAlgorithm, 'blake2b')
+    t.assertEqual(resolveHashAlgorithm('sha256'), 'sha256')
+    with t.assertRaises(ValueError) :
+      resolveHashAlgorithm('noSuchHash')
+
+    aPath, someBytes = list(t.somePaths.items())[-1]
+    aHash = newHash(fastAlgorithm)
+    aHash.update(someBytes)
+    t.assertEqual(hashFile(aPath, fastAlgorithm), aHash.hexdigest())
+
+  @asyncTestOfProcess(None)
+  async def test_sharedExecutor(t) :
+    """Ensure hashers can share (but not shut down) another's workers."""
+
+    sha256Hasher = FileHasher(numWorkers=2)
+    fastHasher   = FileHasher(
+      algorithm='fast', hashCache=HashCache(), executor=sha256Hasher.executor
+    )
+    try :
+      aPath, someBytes = list(t.somePaths.items())[-1]
+      aHash = newHash(fastHasher.algorithm)
+      aHash.update(someBytes)
+      t.assertEqual(await fastHasher.hashFile(aPath), aHash.hexdigest())
+      fastHasher.shutdown()
+      t.assertEqual(
+        await sha256Hasher.hashFile(aPath), hashlib.sha256(someBytes).hexdigest()
+      )
+    finally :
+      sha256Hasher.shutdown()
@@ -0,0 +1,167 @@
+import os
+import shutil
+import unittest
+
+from cputils.chunkedHasher import hashFileInChunks
+from cputils.fsSnapshot import FSSnapshot
+from cputils.pathMatcher import PathMatcher
+
+cputilsTestDir = '/tmp/cputils-tests-fsSnapshot'
+
+def writeFile(aPath, someText) :
+  with open(aPath, 'w') as f :
+    f.write(someText)
+
+class TestFSSnapshot(unittest.TestCase) :
+
+  def setUp(t) :
+    os.makedirs(os.path.join(cputilsTestDir, 'sub'), exist_ok=True)
+    os.makedirs(os.path.join(cputilsTestDir, '.git'), exist_ok=True)
+    writeFile(os.path.join(cputilsTestDir, 'a.txt'), "a")
+    writeFile(os.path.join(cputilsTestDir, 'sub', 'b.txt'), "b")
+    writeFile(os.path.join(cputilsTestDir, '.git', 'HEAD'), "head")
+
+  def tearDown(t) :
+    shutil.rmtree(cputilsTestDir)
+
+  def test_scanTree(t) :
+    """Ensure a tree can be scanned, pruning excluded directories."""
+
+    aSnapshot = FSSnapshot()
+    t.assertEqual(aSnapshot.scanTree(cputilsTestDir), 6)
+    t.assertTrue(os.path.join(cputilsTestDir, '.git', 'HEAD') in aSnapshot)
+
+    aSnapshot = FSSnapshot()
+    aMatcher  = PathMatcher(cputilsTestDir, [ '.git/' ])
+    t.assertEqual(aSnapshot.scanTree(cputilsTestDir, aMatcher), 4)
+    t.assertFalse(os.path.join(cputilsTestDir, '.git') in aSnapshot)
+    t.assertTrue(aSnapshot.get(os.path.join(cputilsTestDir, 'sub'))[3])
+
+    aSnapshot.removeTree(os.path.join(cputilsTestDir, 'sub'))
+    t.assertEqual(len(aSnapshot), 2)
+
+  def test_removeAndSubSnapshotTree(t) :
+    """Ensure the paths below a path are found using the children index,
+    without matching sibling paths which share the path as a prefix."""
+
+    os.makedirs(os.path.join(cputilsTestDir, 'sub2'), exist_ok=True)
+    writeFile(os.path.join(cputilsTestDir, 'sub2', 'c.txt'), "c")
+    subPath   = os.path.join(cputilsTestDir, 'sub')
+    aSnapshot = FSSnapshot()
+    t.assertEqual(aSnapshot.scanTree(cputilsTestDir), 8)
+
+    subSnapshot = aSnapshot.subSnapshot(subPath)
+    t.assertEqual(sorted(subSnapshot.entries), [
+      subPath, os.path.join(subPath, 'b.txt')
+    ])
+    t.assertEqual(sorted(subSnapshot.iterateTree(subPath)), [
+      subPath, os.path.join(subPath, 'b.txt')
+    ])
+
+    aSnapshot.removeTree(subPath)
+    t.assertEqual(len(aSnapshot), 6)
+    t.assertFalse(subPath in aSnapshot)
+    t.assertFalse(subPath in aSnapshot.children)
+    t.assertTrue(os.path.join(cputilsTestDir, 'sub2', 'c.txt') in aSnapshot)
+
+    # paths recorded one at a time are indexed too
+    aSnapshot.updatePath(subPath)
+    aSnapshot.updatePath(os.path.join(subPath, 'b.txt'))
+    t.assertEqual(len(aSnapshot.subSnapshot(subPath)), 2)
+    aSnapshot.removeTree(cputilsTestDir)
+    t.assertEqual(len(aSnapshot), 0)
+
+  def test_diff(t) :
+    """Ensure the differences between two snapshots are exactly the
+    created, modified and deleted paths."""
+
+    oldSnapshot = FSSnapshot()
+    oldSnapshot.scanTree(cputilsTestDir)
+
+    writeFile(os.path.join(cputilsTestDir, 'a.txt'), "a longer text")
+    os.remove(os.path.join(cputilsTestDir, 'sub', 'b.txt'))
+    os.makedirs(os.path.join(cputilsTestDir, 'new'))
+    writeFile(os.path.join(cputilsTestDir, 'new', 'c.txt'), "c")
+
+    newSnapshot = FSSnapshot()
+    newSnapshot.scanTree(cputilsTestDir)
+    created, modified, deleted = oldSnapshot.diff(newSnapshot)
+    t.assertEqual(created, [
+      (os.path.join(cputilsTestDir, 'new'), True),
+      (os.path.join(cputilsTestDir, 'new', 'c.txt'), False)
+    ])
+    t.assertEqual(modified, [ (os.path.join(cputilsTestDir, 'a.txt'), False) ])
+    t.assertEqual(deleted, [ (os.path.join(cputilsTestDir, 'sub', 'b.txt'), False) ])
+
+    t.assertEqual(newSnapshot.diff(newSnapshot), ([], [], []))
+
+  def test_saveLoad(t) :
+    """Ensure a snapshot, including its hashes, can be saved and loaded,
+    and that loading can be restricted to a root path."""
+
+    dbPath    = os.path.join(cputilsTestDir + '-db', 'snapshot.db')
+    aSnapshot = FSSnapshot()
+    aSnapshot.scanTree(cputilsTestDir)
+    aPath = os.path.join(cputilsTestDir, 'a.txt')
+    aSnapshot.setHash(aPath, 'aHash')
+    aSnapshot.setHash(aPath, 'ignoredHash', (0, 0, 0, False))
+    try :
+      aSnapshot.save(dbPath)
+
+      loadedSnapshot = FSSnapshot()
+      t.assertEqual(loadedSnapshot.load(dbPath), 6)
+      t.assertEqual(loadedSnapshot.entries, aSnapshot.entries)
+      t.assertEqual(loadedSnapshot.getHash(aPath), 'aHash')
+
+      subSnapshot = FSSnapshot()
+      t.assertEqual(subSnapshot.load(dbPath, os.path.join(cputilsTestDir, 'sub')), 2)
+
+      t.assertEqual(FSSnapshot().load(dbPath + '.missing'), 0)
+    finally :
+      shutil.rmtree(cputilsTestDir + '-db')
+
+  def test_replaceTreeKeepsHashes(t) :
+    """Ensure replacing a tree keeps only the hashes of unchanged
+    paths."""
+
+    aSnapshot = FSSnapshot()
+    aSnapshot.scanTree(cputilsTestDir)
+    aPath = os.path.join(cputilsTestDir, 'a.txt')
+    bPath = os.path.join(cputilsTestDir, 'sub', 'b.txt')
+    aSnapshot.setHash(aPath, 'aHash')
+    aSnapshot.setHash(bPath, 'bHash')
+
+    writeFile(aPath, "a longer text")
+    newSnapshot = FSSnapshot()
+    newSnapshot.scanTree(cputilsTestDir)
+    aSnapshot.replaceTree(cputilsTestDir, newSnapshot)
+    t.assertIsNone(aSnapshot.getHash(aPath))
+    t.assertEqual(aSnapshot.getHash(bPath), 'bHash')
+
+  def test_saveLoadManifests(t) :
+    """Ensure chunk manifests are saved and loaded with their paths, and
+    are kept when their path's signature changes."""
+
+    aPath = os.path.join(cputilsTestDir, 'a.txt')
+    aSnapshot = FSSnapshot()
+    aSnapshot.scanTree(cputilsTestDir)
+    aManifest, numHashed = hashFileInChunks(aPath, chunkSize=16)
+    aSnapshot.setManifest(aPath, aManifest)
+
+    dbPath = cputilsTestDir + '.db'
+    try :
+      aSnapshot.save(dbPath)
+      loadedSnapshot = FSSnapshot()
+      loadedSnapshot.load(dbPath, cputilsTestDir)
+      t.assertEqual(loadedSnapshot.getManifest(aPath).root, aManifest.root)
+    finally :
+      os.remove(dbPath)
+
+    writeFile(aPath, "a changed")
+    newSnapshot = FSSnapshot()
+    newSnapshot.scanTree(cputilsTestDir)
+    aSnapshot.replaceTree(cputilsTestDir, newSnapshot)
+    t.assertIs(aSnapshot.getManifest(aPath), aManifest)
+    os.remove(aPath)
+    aSnapshot.updatePath(aPath)
+    t.assertIsNone(aSnapshot.getManifest(aPath))
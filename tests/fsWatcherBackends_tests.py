@@ -0,0 +1,80 @@
+import asyncio
+import os
+import shutil
+import unittest
+
+from asyncinotify import Mask
+from cputils.fsWatcher import FSWatcher
+from cputils.fsWatcherBackends import ( createBackend,
+  FanotifyBackend, InotifyBackend )
+from tests.testUtils import asyncTestOfProcess
+
+backendsTestDir = '/tmp/cputils-tests-fsWatcherBackends'
+
+def canUseFanotify() :
+  try :
+    FanotifyBackend().close()
+  except OSError :
+    return False
+  return True
+
+class TestFSWatcherBackends(unittest.TestCase) :
+
+  def test_createBackend(t) :
+    """Ensure backends are created by name, and that unknown names are
+    rejected."""
+
+    aBackend = createBackend('inotify')
+    t.assertTrue(isinstance(aBackend, InotifyBackend))
+    t.assertTrue(aBackend.watchesDirectories)
+    aBackend.close()
+
+    aBackend = createBackend('auto')
+    t.assertEqual(
+      aBackend.name, 'fanotify' if canUseFanotify() else 'inotify'
+    )
+    aBackend.close()
+
+    with t.assertRaises(ValueError) :
+      createBackend('dnotify')
+
+  @asyncTestOfProcess(None)
+  async def test_fanotifyWatcher(t) :
+    """Ensure an FSWatcher using fanotify reports the changes below its
+    root path (and only below its root path) using a single mark."""
+
+    if not canUseFanotify() : t.skipTest("fanotify is not available")
+
+    otherDir = backendsTestDir + '-other'
+    os.makedirs(backendsTestDir, exist_ok=True)
+    os.makedirs(otherDir, exist_ok=True)
+    try :
+      aWatcher = FSWatcher(backend='fanotify')
+      t.assertFalse(aWatcher.backend.watchesDirectories)
+      asyncio.create_task(aWatcher.managePathsToWatchQueue())
+      await aWatcher.watchARootPath(backendsTestDir)
+      await aWatcher.pathsToWatchQueue.join()
+      t.assertEqual(aWatcher.getWatchStats()['numActiveWatches'], 1)
+      aWatcher.startReadingFileSystemEvents()
+
+      with open(os.path.join(otherDir, 'ignored.txt'), 'w') as f :
+        f.write("some text")
+      os.makedirs(os.path.join(backendsTestDir, 'sub'))
+      aPath = os.path.join(backendsTestDir, 'sub', 'a.txt')
+      with open(aPath, 'w') as f :
+        f.write("some text")
+
+      someEvents = [ ]
+      while len(someEvents) < 2 :
+        anEvent = await asyncio.wait_for(aWatcher.fsWatchQueue.get(), 2)
+        someEvents.append(anEvent)
+      t.assertEqual(str(someEvents[0].path), os.path.join(backendsTestDir, 'sub'))
+      t.assertTrue(Mask.CREATE in someEvents[0].mask)
+      t.assertTrue(Mask.ISDIR in someEvents[0].mask)
+      t.assertEqual(str(someEvents[1].path), aPath)
+      t.assertTrue(Mask.CREATE in someEvents[1].mask)
+      aWatcher.stopWatchingFileSystem()
+      aWatcher.backend.close()
+    finally :
+      shutil.rmtree(backendsTestDir)
+      shutil.rmtree(otherDir)
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import shutil
+import unittest
+
+from asyncinotify import Mask
+from cputils.eventLog import EventRecorder, ReplayBackend
+from cputils.fsWatcher import FSEvent, FSWatcher
+from cputils.fsWatcherHub import FSWatcherHub, PrefixTrie, Subscription
+from tests.testUtils import asyncTestOfProcess
+
+hubTestDir = '/tmp/cputils-tests-fsWatcherHub'
+
+class TestFSWatcherHub(unittest.TestCase) :
+
+  def test_prefixTrie(t) :
+    """Ensure the values of every prefix of a path are found, and that
+    removed prefixes are pruned."""
+
+    aTrie = PrefixTrie()
+    aTrie.add('/', 'all')
+    aTrie.add('/a/b', 'ab')
+    aTrie.add('/a/b', 'ab2')
+    aTrie.add('/a/c', 'ac')
+    t.assertEqual(aTrie.getValues('/a/b/c.txt'), [ 'all', 'ab', 'ab2' ])
+    t.assertEqual(aTrie.getValues('/a/bc.txt'), [ 'all' ])
+    aTrie.remove('/a/b', 'ab')
+    aTrie.remove('/a/b', 'ab2')
+    t.assertNotIn('b', aTrie.root.children['a'].children)
+    t.assertEqual(aTrie.getValues('/a/c'), [ 'all', 'ac' ])
+
+  @asyncTestOfProcess(None)
+  async def test_subscriptionPolicies(t) :
+    """Ensure full `drop` subscriptions drop events, while `block`
+    subscriptions wait for room."""
+
+    dropSub = Subscription('/a', maxSize=2, policy='drop')
+    for i in range(3) :
+      await dropSub.deliver(FSEvent(f"/a/f{i}", Mask.CLOSE_WRITE))
+    t.assertEqual((dropSub.numDelivered, dropSub.numDropped), (2, 1))
+
+    blockSub = Subscription('/a', maxSize=1, policy='block')
+    await blockSub.deliver(FSEvent("/a/f0", Mask.CLOSE_WRITE))
+    aDelivery = asyncio.create_task(
+      blockSub.deliver(FSEvent("/a/f1", Mask.CLOSE_WRITE))
+    )
+    await asyncio.sleep(0.01)
+    t.assertFalse(aDelivery.done())
+    t.assertEqual(str((await blockSub.__anext__()).path), "/a/f0")
+    await asyncio.wait_for(aDelivery, 1)
+    blockSub.close()
+    somePaths = [ str(anEvent.path) async for anEvent in blockSub ]
+    t.assertEqual(somePaths, [ "/a/f1" ])
+
+    with t.assertRaises(ValueError) :
+      Subscription('/a', policy='wait')
+
+  @asyncTestOfProcess(None)
+  async def test_unsubscribeBlocked(t) :
+    """Ensure unsubscribing a full `block` subscription, while the hub is
+    waiting for room in its queue, does not stall the other
+    subscriptions."""
+
+    os.makedirs(hubTestDir, exist_ok=True)
+    logPath = os.path.join(hubTestDir, 'events.log')
+    try :
+      with EventRecorder(logPath) as aRecorder :
+        for i in range(10) :
+          aRecorder.record(FSEvent(f"/a/f{i}", Mask.CLOSE_WRITE), i * 0.001)
+      async with FSWatcher(backend=ReplayBackend(logPath, None)) as aWatcher :
+        aHub     = FSWatcherHub(aWatcher)
+        blockSub = aHub.subscribe('/a', maxSize=2, policy='block')
+        dropSub  = aHub.subscribe('/a', maxSize=100, policy='drop')
+        while not blockSub.queue.full() : await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        t.assertEqual(dropSub.numDelivered, 2)
+
+        aHub.unsubscribe(blockSub)
+
+        async def getPaths(aSubscription) :
+          return [ str(anEvent.path) async for anEvent in aSubscription ]
+
+        # the replay ends (closing the subscriptions) once every event
+        # has been dispatched
+        somePaths = await asyncio.wait_for(getPaths(dropSub), 2)
+        t.assertEqual(somePaths, [ f"/a/f{i}" for i in range(10) ])
+        t.assertEqual(blockSub.numDelivered, 2)
+        t.assertEqual(
+          [ str(anEvent.path) async for anEvent in blockSub ],
+          [ "/a/f0", "/a/f1" ]
+        )
+    finally :
+      shutil.rmtree(hubTestDir)
+
+  @asyncTestOfProcess(None)
+  async def test_fanOut(t) :
+    """Ensure one watcher's events are delivered to every (matching)
+    subscription."""
+
+    os.makedirs(os.path.join(hubTestDir, 'src'), exist_ok=True)
+    os.makedirs(os.path.join(hubTestDir, 'doc'), exist_ok=True)
+    try :
+      async with FSWatcher() as aWatcher :
+        await aWatcher.watchARootPath(hubTestDir)
+        await aWatcher.pathsToWatchQueue.join()
+        aHub    = FSWatcherHub(aWatcher)
+        allSub  = aHub.subscribe(hubTestDir)
+        srcSub  = aHub.subscribe(os.path.join(hubTestDir, 'src'))
+        pySub   = aHub.subscribe(hubTestDir, includePatterns=[ '*.py' ])
+
+        for aName in [ 'src/a.py', 'doc/b.md' ] :
+          with open(os.path.join(hubTestDir, aName), 'w') as f :
+            f.write("some text")
+
+        async def getPaths(aSubscription, numPaths) :
+          somePaths = set()
+          while len(somePaths) < numPaths :
+            anEvent = await asyncio.wait_for(aSubscription.__anext__(), 2)
+            somePaths.add(os.path.relpath(anEvent.path, hubTestDir))
+          return somePaths
+
+        t.assertEqual(await getPaths(allSub, 2), { 'src/a.py', 'doc/b.md' })
+        t.assertEqual(await getPaths(srcSub, 1), { 'src/a.py' })
+        t.assertEqual(await getPaths(pySub, 1), { 'src/a.py' })
+        await asyncio.sleep(0.1)
+        for aSubscription in [ srcSub, pySub ] :
+          while not aSubscription.queue.empty() :
+            anEvent = aSubscription.queue.get_nowait()
+            t.assertEqual(
+              os.path.relpath(anEvent.path, hubTestDir), 'src/a.py'
+            )
+        t.assertEqual(len(aHub.getStats()['subscriptions']), 3)
+
+        aHub.unsubscribe(srcSub)
+        t.assertEqual([ anEvent async for anEvent in srcSub ], [ ])
+        aHub.close()
+        t.assertTrue(allSub.isClosed)
+    finally :
+      shutil.rmtree(hubTestDir)
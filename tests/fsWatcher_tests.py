@@ -2,17 +2,24 @@ import aiofiles
 import aiofiles.os
 import aioshutil
 import asyncio
+import hashlib
 import logging
 import os
 from pathlib import Path
 import shutil
+import sys
 import time
 import unittest
 from unittest import mock
 import yaml
 
 from asyncinotify import Mask
-from cputils.fsWatcher import FSWatcher, get_directories_recursive, mask2text
+from cputils.artefactManager import ArtefactManager
+from cputils.fsWatcher import ( FSWatcher, EventCoalescer, FSEvent, WalkStats,
+  eventToMessage, getEventPath, getMaskName, get_directories_recursive,
+  mask2text, maskNames, watchForInotifyEvents )
+from cputils.eventLog import EventRecorder, ReplayBackend
+from cputils.pathMatcher import PathMatcher, commonExcludePatterns
 from tests.testUtils import asyncTestOfProcess
 
 logger = logging.getLogger()
@@ -40,17 +47,68 @@ class TestFSWatcher(unittest.TestCase):
 
   def test_get_directories_recursive(t):
     """Ensure the `get_directories_recursive` method can walk the file
-    system."""
+    system, yielding only directories."""
 
     someFiles = []
-    for aFile in get_directories_recursive(Path(cputilsTestDir)) :
+    walkStats = WalkStats()
+    for aFile in get_directories_recursive(Path(cputilsTestDir), walkStats) :
       someFiles.append(aFile)
 
-    t.assertEqual(str(someFiles.pop()), os.path.join(cputilsTestDir, 'test01', 'silly.txt'))
     t.assertEqual(str(someFiles.pop()), os.path.join(cputilsTestDir, 'test01'))
     t.assertEqual(str(someFiles.pop()), cputilsTestDir)
     t.assertEqual(someFiles, [])
+    t.assertEqual(walkStats.numDirs, 2)
+    t.assertEqual(walkStats.numFiles, 1)
+    t.assertEqual(walkStats.numStatsSaved, 3)
 
+    someFiles = list(get_directories_recursive(
+      Path(os.path.join(cputilsTestDir, 'test01', 'silly.txt'))
+    ))
+    t.assertEqual(len(someFiles), 1)
+
+  def test_get_directories_recursive_pruned(t):
+    """Ensure the `get_directories_recursive` method prunes the
+    directories excluded by a `PathMatcher`."""
+
+    prunedDir = cputilsTestDir + '-pruned'
+    for aDir in [ 'src', 'src/__pycache__', '.git/objects', 'build/out' ] :
+      os.makedirs(os.path.join(prunedDir, aDir), exist_ok=True)
+    try :
+      walkStats = WalkStats()
+      aMatcher  = PathMatcher(prunedDir, ['.git/', '__pycache__/', '/build'])
+      someDirs  = [
+        str(aDir) for aDir in get_directories_recursive(
+          Path(prunedDir), walkStats, aMatcher
+        )
+      ]
+      t.assertEqual(sorted(someDirs), [
+        prunedDir, os.path.join(prunedDir, 'src')
+      ])
+      t.assertEqual(walkStats.numPruned, 3)
+    finally :
+      shutil.rmtree(prunedDir)
+
+  def test_get_directories_recursive_deepTree(t):
+    """Ensure the `get_directories_recursive` method can walk a directory
+    tree which is deeper than Python's recursion limit."""
+
+    deepDir = cputilsTestDir + '-deep'
+    depth   = sys.getrecursionlimit() + 100
+    aDir    = deepDir
+    os.makedirs(aDir, exist_ok=True)
+    try :
+      for i in range(depth) :
+        aDir = os.path.join(aDir, 'd')
+        os.makedirs(aDir, exist_ok=True)
+      someDirs = list(get_directories_recursive(Path(deepDir)))
+      t.assertEqual(len(someDirs), depth + 1)
+      t.assertEqual(str(someDirs[0]), deepDir)
+      t.assertEqual(str(someDirs[-1]), aDir)
+    finally :
+      # shutil.rmtree is itself recursive... so remove the tree by hand
+      while aDir != os.path.dirname(deepDir) :
+        os.rmdir(aDir)
+        aDir = os.path.dirname(aDir)
 
   async def watchRecursiveProcessRunner(t) :
     """This is our long running process which expects to run forever. We
@@ -120,4 +178,771 @@ class TestFSWatcher(unittest.TestCase):
     t.assertTrue('CloseWrite' in t.eventsCollection[sillyTxt3Path])
     t.assertTrue('Delete' in t.eventsCollection[sillyTxt3Path])
     t.assertTrue('DeletedDir' in t.eventsCollection[test1Dir])
-    t.assertTrue('CreatedDir' in t.eventsCollection[test2Dir])
\ No newline at end of file
+    t.assertTrue('CreatedDir' in t.eventsCollection[test2Dir])
+
+  @asyncTestOfProcess(None)
+  async def test_watchTreeInThread(t) :
+    """Ensure a large directory tree can be walked in a worker thread
+    while the event loop remains responsive."""
+
+    bigDir = cputilsTestDir + '-big'
+    for i in range(20) :
+      for j in range(50) :
+        os.makedirs(os.path.join(bigDir, f"dir{i}", f"subDir{j}"), exist_ok=True)
+
+    try :
+      numTicks = 0
+      async def ticker() :
+        nonlocal numTicks
+        while True :
+          numTicks = numTicks + 1
+          await asyncio.sleep(0)
+      tickerTask = asyncio.create_task(ticker())
+
+      aWatcher = FSWatcher(walkInThread=True, maxWatchesPerTick=50)
+      await aWatcher.watchTreeInThread(Path(bigDir))
+      tickerTask.cancel()
+
+      watchStats = aWatcher.getWatchStats()
+      t.assertEqual(watchStats['numWatches'], 1 + 20 + 20*50)
+      t.assertEqual(watchStats['numDirsWalked'], 1 + 20 + 20*50)
+      t.assertTrue(20 < numTicks)
+    finally :
+      shutil.rmtree(bigDir)
+
+  async def watchIgnoredProcessRunner(t) :
+    """Collect the events for a root path watched with exclude and include
+    patterns."""
+
+    os.makedirs(os.path.join(t.ignoredDir, 'node_modules'), exist_ok=True)
+    aWatcher = FSWatcher()
+    asyncio.create_task(aWatcher.managePathsToWatchQueue())
+    await aWatcher.watchARootPath(
+      t.ignoredDir, [ 'node_modules/' ], [ '*.txt' ]
+    )
+    await aWatcher.pathsToWatchQueue.join()
+    t.asyncTestQueue.put_nowait(aWatcher)
+    async for anEvent in aWatcher.watchForFileSystemEvents() :
+      t.eventsCollection.append(str(anEvent.path))
+
+  ignoredDir = cputilsTestDir + '-ignored'
+
+  @asyncTestOfProcess(watchIgnoredProcessRunner)
+  async def test_watchIgnoredPaths(t) :
+    """Ensure events for excluded (or not included) paths are never
+    yielded and that excluded directories are not watched."""
+
+    t.eventsCollection = []
+    try :
+      aWatcher = await t.asyncTestQueue.get()
+      t.assertEqual(aWatcher.getWatchStats()['numWatches'], 1)
+      t.assertEqual(aWatcher.getWatchStats()['numDirsPruned'], 1)
+
+      for aFile in [ 'node_modules/a.txt', 'b.txt', 'c.pdf' ] :
+        async with aiofiles.open(os.path.join(t.ignoredDir, aFile), 'w') as f :
+          await f.write("some text")
+      await asyncio.sleep(0.2)
+
+      t.assertTrue(os.path.join(t.ignoredDir, 'b.txt') in t.eventsCollection)
+      t.assertFalse(os.path.join(t.ignoredDir, 'c.pdf') in t.eventsCollection)
+      t.assertFalse(os.path.join(t.ignoredDir, 'node_modules') in t.eventsCollection)
+      t.assertFalse(os.path.join(t.ignoredDir, 'node_modules', 'a.txt') in t.eventsCollection)
+    finally :
+      shutil.rmtree(t.ignoredDir)
+
+  @asyncTestOfProcess(None)
+  async def test_ignoredPathsWithoutWalking(t) :
+    """Ensure events below excluded directories are not yielded by a
+    backend which does not walk (and so does not prune) the watched
+    trees."""
+
+    os.makedirs(t.ignoredDir, exist_ok=True)
+    logPath = t.ignoredDir + '.log'
+    try :
+      with EventRecorder(logPath) as aRecorder :
+        for aName in [
+          '.git/index', 'node_modules/x/index.js', 'build/out/a.o',
+          'src/a.c', 'b.txt', 'c.pdf'
+        ] :
+          aRecorder.record(
+            FSEvent(os.path.join(t.ignoredDir, aName), Mask.CLOSE_WRITE)
+          )
+      aWatcher = FSWatcher(backend=ReplayBackend(logPath, None))
+      async with aWatcher :
+        await aWatcher.watchARootPath(
+          t.ignoredDir, commonExcludePatterns + [ 'build/', '*.pdf' ]
+        )
+        somePaths = [
+          str(anEvent.path)
+            async for anEvent in aWatcher.watchForFileSystemEvents()
+        ]
+      t.assertEqual(somePaths, [
+        os.path.join(t.ignoredDir, 'src/a.c'),
+        os.path.join(t.ignoredDir, 'b.txt')
+      ])
+    finally :
+      shutil.rmtree(t.ignoredDir)
+      os.remove(logPath)
+
+  async def watchMovesProcessRunner(t) :
+    """Collect the events for a tree in which directories are moved."""
+
+    os.makedirs(os.path.join(t.movesDir, 'a', 'b', 'c'), exist_ok=True)
+    os.makedirs(os.path.join(t.movesDir, 'd'), exist_ok=True)
+    aWatcher = FSWatcher(moveTimeout=0.05)
+    asyncio.create_task(aWatcher.managePathsToWatchQueue())
+    await aWatcher.watchARootPath(t.movesDir)
+    await aWatcher.pathsToWatchQueue.join()
+    t.asyncTestQueue.put_nowait(aWatcher)
+    async for anEvent in aWatcher.watchForFileSystemEvents() :
+      t.eventsCollection.append(str(anEvent.path))
+
+  movesDir = cputilsTestDir + '-moves'
+
+  @asyncTestOfProcess(watchMovesProcessRunner)
+  async def test_watchMovedDirectories(t) :
+    """Ensure directories moved within the watched tree keep reporting
+    the correct paths, and that directories moved out of the watched tree
+    are no longer watched."""
+
+    t.eventsCollection = []
+    outsideDir = cputilsTestDir + '-outside'
+    try :
+      aWatcher = await t.asyncTestQueue.get()
+      t.assertEqual(aWatcher.getWatchStats()['numActiveWatches'], 5)
+
+      await aioshutil.move(
+        os.path.join(t.movesDir, 'a', 'b'), os.path.join(t.movesDir, 'd', 'e')
+      )
+      await asyncio.sleep(0.1)
+      newFile = os.path.join(t.movesDir, 'd', 'e', 'c', 'new.txt')
+      async with aiofiles.open(newFile, 'w') as f :
+        await f.write("some text")
+      await asyncio.sleep(0.1)
+
+      watchStats = aWatcher.getWatchStats()
+      t.assertEqual(watchStats['numMovesTracked'], 1)
+      t.assertEqual(watchStats['numWatchesRenamed'], 2)
+      t.assertTrue(newFile in t.eventsCollection)
+
+      await aioshutil.move(os.path.join(t.movesDir, 'd', 'e'), outsideDir)
+      await asyncio.sleep(0.2)
+      watchStats = aWatcher.getWatchStats()
+      t.assertEqual(watchStats['numMovesOut'], 1)
+      t.assertEqual(watchStats['numActiveWatches'], 3)
+    finally :
+      shutil.rmtree(t.movesDir)
+      shutil.rmtree(outsideDir, ignore_errors=True)
+
+  def test_eventCoalescer(t) :
+    """Ensure the `EventCoalescer` merges duplicate events and folds the
+    CREATE, MODIFY and CLOSE_WRITE events of a path into one change."""
+
+    aCoalescer = EventCoalescer()
+    for aPath, aMask in [
+      ('a', Mask.CREATE), ('a', Mask.MODIFY), ('b', Mask.MODIFY),
+      ('a', Mask.MODIFY), ('a', Mask.CLOSE_WRITE), ('b', Mask.DELETE),
+      ('c', Mask.MOVED_FROM), ('d', Mask.MOVED_TO), ('e', Mask.CREATE | Mask.ISDIR)
+    ] :
+      aCoalescer.addEvent(mock.Mock(path=aPath, mask=aMask))
+    t.assertEqual(aCoalescer.numEvents, 9)
+    changes = aCoalescer.getChanges()
+    t.assertEqual(
+      [ (aChange.path, aChange.kind, aChange.numEvents) for aChange in changes ],
+      [ ('a', 'changed', 4), ('b', 'deleted', 2), ('c', 'movedFrom', 1),
+        ('d', 'movedTo', 1), ('e', 'changed', 1) ]
+    )
+    t.assertEqual(changes[0].mask, Mask.CREATE | Mask.MODIFY | Mask.CLOSE_WRITE)
+    t.assertEqual(changes[1].mask, Mask.DELETE)
+    t.assertFalse(changes[0].isDir())
+    t.assertTrue(changes[-1].isDir())
+
+  def test_eventCoalescerFinalState(t) :
+    """Ensure a path which is written, deleted and written again is
+    reported (once) as changed, after the changes which came before its
+    re-creation."""
+
+    aCoalescer = EventCoalescer()
+    for aPath, aMask in [
+      ('a', Mask.CREATE), ('a', Mask.MODIFY), ('a', Mask.CLOSE_WRITE),
+      ('b', Mask.MODIFY), ('a', Mask.DELETE),
+      ('a', Mask.CREATE), ('a', Mask.MODIFY), ('a', Mask.CLOSE_WRITE),
+    ] :
+      aCoalescer.addEvent(mock.Mock(path=aPath, mask=aMask))
+    changes = aCoalescer.getChanges()
+    t.assertEqual(
+      [ (aChange.path, aChange.kind, aChange.numEvents) for aChange in changes ],
+      [ ('b', 'changed', 1), ('a', 'changed', 7) ]
+    )
+    t.assertEqual(changes[1].mask, Mask.CREATE | Mask.MODIFY | Mask.CLOSE_WRITE)
+
+  async def watchBatchesProcessRunner(t) :
+    """Collect the batches of changes for a watched tree."""
+
+    os.makedirs(t.batchesDir, exist_ok=True)
+    aWatcher = FSWatcher()
+    asyncio.create_task(aWatcher.managePathsToWatchQueue())
+    await aWatcher.watchARootPath(t.batchesDir)
+    await aWatcher.pathsToWatchQueue.join()
+    t.asyncTestQueue.put_nowait(aWatcher)
+    async for aBatch in aWatcher.watchForFileSystemEventBatches(0.1, 1000) :
+      t.batchesCollection.append(aBatch)
+
+  batchesDir = cputilsTestDir + '-batches'
+
+  @asyncTestOfProcess(watchBatchesProcessRunner)
+  async def test_watchEventBatches(t) :
+    """Ensure a burst of file system events is delivered as a single batch
+    of coalesced changes."""
+
+    t.batchesCollection = []
+    try :
+      aWatcher = await t.asyncTestQueue.get()
+      for i in range(10) :
+        async with aiofiles.open(os.path.join(t.batchesDir, f"file{i}.txt"), 'w') as f :
+          await f.write("some text")
+          await f.flush()
+          await f.write("some more text")
+      await asyncio.sleep(0.3)
+
+      t.assertEqual(len(t.batchesCollection), 1)
+      aBatch = t.batchesCollection[0]
+      t.assertEqual(len(aBatch), 10)
+      for aChange in aBatch :
+        t.assertEqual(aChange.kind, 'changed')
+        t.assertTrue(3 <= aChange.numEvents)
+    finally :
+      shutil.rmtree(t.batchesDir)
+
+  def test_compactEvents(t) :
+    """Ensure mask names are cached, and that events only build `Path`s
+    when they are asked for."""
+
+    aMask = Mask.CREATE | Mask.ISDIR
+    t.assertEqual(getMaskName(aMask), 'Create IsDir CreatedDir DeletedDir')
+    t.assertIn(int(aMask), maskNames)
+    oddMask = Mask.ATTRIB | Mask.MODIFY | Mask.ACCESS
+    t.assertNotIn(int(oddMask), maskNames)
+    t.assertEqual(getMaskName(oddMask), 'Access Modify')
+    t.assertIn(int(oddMask), maskNames)
+
+    anEvent = FSEvent('/a/b/c.txt', Mask.CLOSE_WRITE)
+    t.assertIsNone(anEvent.pathObj)
+    t.assertEqual(getEventPath(anEvent), '/a/b/c.txt')
+    t.assertEqual(eventToMessage(anEvent), {
+      'path' : '/a/b/c.txt', 'mask' : int(Mask.CLOSE_WRITE),
+      'maskName' : 'CloseWrite'
+    })
+    t.assertIsNone(anEvent.pathObj)
+    t.assertEqual(anEvent.path, Path('/a/b/c.txt'))
+    t.assertEqual(anEvent.name, Path('c.txt'))
+    t.assertTrue(Mask.CLOSE_WRITE in anEvent)
+    t.assertIsNone(FSEvent(None, Mask.Q_OVERFLOW).path)
+
+  @asyncTestOfProcess(None)
+  async def test_forwardEventsToNats(t) :
+    """Ensure events are forwarded (as messages) to NATS."""
+
+    class MessageRecorder :
+      def __init__(self) :
+        self.messages = asyncio.Queue()
+      async def sendMessage(self, aSubject, aMsg, sleepTime=None) :
+        await self.messages.put((aSubject, aMsg))
+
+    natsDir = cputilsTestDir + '-nats'
+    os.makedirs(natsDir, exist_ok=True)
+    try :
+      async with FSWatcher() as aWatcher :
+        await aWatcher.watchARootPath(natsDir)
+        await aWatcher.pathsToWatchQueue.join()
+        aRecorder = MessageRecorder()
+        aWatcher.createTask(watchForInotifyEvents(aWatcher, aRecorder))
+        await asyncio.sleep(0)
+        aPath = os.path.join(natsDir, 'a.txt')
+        with open(aPath, 'w') as f :
+          f.write("some text")
+        aSubject, aMsg = await asyncio.wait_for(aRecorder.messages.get(), 2)
+        t.assertEqual(aSubject, 'fsWatcher.events')
+        t.assertEqual(aMsg['path'], aPath)
+        t.assertEqual(aMsg['mask'], int(Mask.CREATE))
+    finally :
+      shutil.rmtree(natsDir)
+
+  @asyncTestOfProcess(None)
+  async def test_overflowRescan(t) :
+    """Ensure an inotify queue overflow is counted and that the rescan
+    reports exactly the changes which were made since the snapshot."""
+
+    overflowDir = cputilsTestDir + '-overflow'
+    os.makedirs(os.path.join(overflowDir, 'sub'), exist_ok=True)
+    for aFile in [ 'a.txt', 'b.txt' ] :
+      with open(os.path.join(overflowDir, aFile), 'w') as f :
+        f.write("some text")
+    try :
+      aWatcher = FSWatcher(keepSnapshot=True)
+      asyncio.create_task(aWatcher.managePathsToWatchQueue())
+      await aWatcher.watchARootPath(overflowDir)
+      await aWatcher.pathsToWatchQueue.join()
+      t.assertEqual(len(aWatcher.fsSnapshot), 4)
+
+      # we do NOT read any inotify events, so these changes are "lost"
+      with open(os.path.join(overflowDir, 'a.txt'), 'a') as f :
+        f.write("some more text")
+      os.remove(os.path.join(overflowDir, 'b.txt'))
+      os.makedirs(os.path.join(overflowDir, 'sub2'))
+      with open(os.path.join(overflowDir, 'sub2', 'c.txt'), 'w') as f :
+        f.write("some text")
+
+      t.assertFalse(await aWatcher.processEvent(FSEvent(None, Mask.Q_OVERFLOW)))
+      await aWatcher.rescanTask
+      await aWatcher.pathsToWatchQueue.join()
+
+      someEvents = [ ]
+      while not aWatcher.fsWatchQueue.empty() :
+        anEvent = aWatcher.fsWatchQueue.get_nowait()
+        someEvents.append((str(anEvent.path), mask2text[int(anEvent.mask)]))
+      t.assertEqual(sorted(someEvents), sorted([
+        (os.path.join(overflowDir, 'sub2'), 'CreatedDir'),
+        (os.path.join(overflowDir, 'sub2', 'c.txt'), 'Create'),
+        (os.path.join(overflowDir, 'a.txt'), 'CloseWrite'),
+        (os.path.join(overflowDir, 'b.txt'), 'Delete'),
+      ]))
+      watchStats = aWatcher.getWatchStats()
+      t.assertEqual(watchStats['numOverflows'], 1)
+      t.assertEqual(watchStats['numRescans'], 1)
+      t.assertEqual(watchStats['numRescanEvents'], 4)
+      t.assertEqual(watchStats['numActiveWatches'], 3)
+    finally :
+      shutil.rmtree(overflowDir)
+
+  @asyncTestOfProcess(None)
+  async def test_relativeRootPath(t) :
+    """Ensure the patterns of a relative root path are used by a rescan,
+    and that its events have absolute paths."""
+
+    relRootDir = cputilsTestDir + '-relRoot'
+    os.makedirs(os.path.join(relRootDir, 'src'), exist_ok=True)
+    oldCwd = os.getcwd()
+    os.chdir(os.path.dirname(relRootDir))
+    try :
+      aWatcher = FSWatcher(keepSnapshot=True)
+      asyncio.create_task(aWatcher.managePathsToWatchQueue())
+      await aWatcher.watchARootPath(os.path.basename(relRootDir), [ '*.o' ])
+      await aWatcher.pathsToWatchQueue.join()
+      t.assertEqual(aWatcher.getRootPaths(), [ relRootDir ])
+
+      # we do NOT read any inotify events, so these changes are "lost"
+      for aName in [ 'a.c', 'a.o' ] :
+        with open(os.path.join(relRootDir, 'src', aName), 'w') as f :
+          f.write("some text")
+
+      t.assertFalse(await aWatcher.processEvent(FSEvent(None, Mask.Q_OVERFLOW)))
+      await aWatcher.rescanTask
+      someEvents = [ ]
+      while not aWatcher.fsWatchQueue.empty() :
+        anEvent = aWatcher.fsWatchQueue.get_nowait()
+        someEvents.append((str(anEvent.path), mask2text[int(anEvent.mask)]))
+      t.assertEqual(someEvents, [
+        (os.path.join(relRootDir, 'src', 'a.c'), 'Create')
+      ])
+
+      # the live events have absolute paths too
+      with open(os.path.join(relRootDir, 'src', 'a.c'), 'a') as f :
+        f.write("some more text")
+      anEvent = await asyncio.wait_for(aWatcher.backend.get(), 2)
+      t.assertEqual(str(anEvent.path), os.path.join(relRootDir, 'src', 'a.c'))
+    finally :
+      os.chdir(oldCwd)
+      shutil.rmtree(relRootDir)
+
+  @asyncTestOfProcess(None)
+  async def test_overflowRescanWithoutSnapshot(t) :
+    """Ensure a rescan without a snapshot reports every path, and watches
+    the directories it finds without walking them again."""
+
+    overflowDir = cputilsTestDir + '-overflow'
+    os.makedirs(os.path.join(overflowDir, 'sub', 'subSub'), exist_ok=True)
+    with open(os.path.join(overflowDir, 'a.txt'), 'w') as f :
+      f.write("some text")
+    try :
+      aWatcher = FSWatcher()
+      asyncio.create_task(aWatcher.managePathsToWatchQueue())
+      await aWatcher.watchARootPath(overflowDir)
+      await aWatcher.pathsToWatchQueue.join()
+      t.assertEqual(aWatcher.getWatchStats()['numDirsWalked'], 3)
+
+      # this new tree's events are "lost"
+      os.makedirs(os.path.join(overflowDir, 'new', 'newSub'))
+
+      t.assertFalse(await aWatcher.processEvent(FSEvent(None, Mask.Q_OVERFLOW)))
+      await aWatcher.rescanTask
+      await aWatcher.pathsToWatchQueue.join()
+
+      numEvents = 0
+      while not aWatcher.fsWatchQueue.empty() :
+        aWatcher.fsWatchQueue.get_nowait()
+        numEvents = numEvents + 1
+      t.assertEqual(numEvents, 6)
+      watchStats = aWatcher.getWatchStats()
+      t.assertEqual(watchStats['numDirsWalked'], 3)
+      t.assertEqual(watchStats['numActiveWatches'], 5)
+      t.assertTrue(os.path.join(overflowDir, 'new', 'newSub') in aWatcher.watchPathTrie)
+    finally :
+      shutil.rmtree(overflowDir)
+
+  @asyncTestOfProcess(None)
+  async def test_offlineChanges(t) :
+    """Ensure a watcher with a saved snapshot reports exactly the changes
+    made while the tree was not being watched."""
+
+    offlineDir   = cputilsTestDir + '-offline'
+    snapshotPath = cputilsTestDir + '-offline.db'
+    os.makedirs(os.path.join(offlineDir, 'sub'), exist_ok=True)
+    for aFile in [ 'a.txt', 'b.txt' ] :
+      with open(os.path.join(offlineDir, aFile), 'w') as f :
+        f.write("some text")
+
+    async def watchAndCollect() :
+      aWatcher = FSWatcher()
+      asyncio.create_task(aWatcher.managePathsToWatchQueue())
+      await aWatcher.watchARootPath(offlineDir, snapshotPath=snapshotPath)
+      await aWatcher.pathsToWatchQueue.join()
+      someEvents = [ ]
+      while not aWatcher.fsWatchQueue.empty() :
+        anEvent = aWatcher.fsWatchQueue.get_nowait()
+        someEvents.append((str(anEvent.path), mask2text[int(anEvent.mask)]))
+      aWatcher.stopWatchingFileSystem()
+      return (aWatcher, sorted(someEvents))
+
+    try :
+      # with no saved snapshot, everything has been created
+      aWatcher, someEvents = await watchAndCollect()
+      t.assertEqual(len(someEvents), 4)
+      aWatcher.saveSnapshots()
+      t.assertTrue(os.path.exists(snapshotPath))
+
+      with open(os.path.join(offlineDir, 'a.txt'), 'a') as f :
+        f.write("some more text")
+      os.remove(os.path.join(offlineDir, 'b.txt'))
+      with open(os.path.join(offlineDir, 'sub', 'c.txt'), 'w') as f :
+        f.write("some text")
+
+      aWatcher, someEvents = await watchAndCollect()
+      t.assertEqual(someEvents, sorted([
+        (os.path.join(offlineDir, 'a.txt'), 'CloseWrite'),
+        (os.path.join(offlineDir, 'b.txt'), 'Delete'),
+        (os.path.join(offlineDir, 'sub', 'c.txt'), 'Create'),
+      ]))
+    finally :
+      shutil.rmtree(offlineDir)
+      os.remove(snapshotPath)
+
+  @asyncTestOfProcess(None)
+  async def test_watchLimitPolling(t) :
+    """Ensure a watcher which reaches its watch limit polls some sub-trees
+    instead, and that changes in a polled sub-tree are still reported."""
+
+    limitDir = cputilsTestDir + '-limit'
+    for aDir in [ 'hot', 'cold1/a', 'cold1/b', 'cold1/c', 'cold2/a', 'cold2/b' ] :
+      os.makedirs(os.path.join(limitDir, aDir), exist_ok=True)
+    try :
+      aWatcher = FSWatcher(
+        maxWatches=6, watchHighWaterMark=1.0, watchLowWaterMark=0.5,
+        minPollInterval=0.05, maxPollInterval=0.2
+      )
+      asyncio.create_task(aWatcher.managePathsToWatchQueue())
+      await aWatcher.watchARootPath(limitDir)
+      await aWatcher.pathsToWatchQueue.join()
+
+      watchStats = aWatcher.getWatchStats()
+      t.assertTrue(watchStats['numActiveWatches'] <= 6)
+      t.assertTrue(1 <= watchStats['numPolledTrees'])
+      t.assertTrue(limitDir in aWatcher.watchPathTrie)
+      polledDirs = [
+        str(aDir) for aDir in get_directories_recursive(limitDir)
+          if aWatcher.poller.isPolled(aDir)
+      ]
+      t.assertTrue(polledDirs)
+      # every directory is either watched or polled
+      t.assertEqual(
+        watchStats['numActiveWatches'] + len(polledDirs), 9
+      )
+
+      # allow the first poll to record the polled sub-trees
+      await asyncio.sleep(0.2)
+      aPath = os.path.join(polledDirs[0], 'new.txt')
+      with open(aPath, 'w') as f :
+        f.write("some text")
+      anEvent = await asyncio.wait_for(aWatcher.fsWatchQueue.get(), 2)
+      t.assertEqual(str(anEvent.path), aPath)
+      t.assertEqual(mask2text[int(anEvent.mask)], 'Create')
+      t.assertTrue(1 <= aWatcher.getWatchStats()['numPolledEvents'])
+      aWatcher.stopWatchingFileSystem()
+    finally :
+      shutil.rmtree(limitDir)
+
+  @asyncTestOfProcess(None)
+  async def test_close(t) :
+    """Ensure closing a watcher cancels all of its tasks, wakes any
+    consumer of its events, and closes its file descriptor."""
+
+    closeDir = cputilsTestDir + '-close'
+    os.makedirs(os.path.join(closeDir, 'sub'), exist_ok=True)
+    aPath = os.path.join(closeDir, 'a.txt')
+    with open(aPath, 'w') as f :
+      f.write("some text")
+    numFds = len(os.listdir('/proc/self/fd'))
+    try :
+      async with FSWatcher(numSHA256Workers=2) as aWatcher :
+        await aWatcher.watchARootPath(closeDir)
+        await aWatcher.pathsToWatchQueue.join()
+        t.assertEqual(
+          await (await aWatcher.computeSHA256For(aPath)),
+          hashlib.sha256(b"some text").hexdigest()
+        )
+        someEvents = [ ]
+        async def collectEvents() :
+          async for anEvent in aWatcher.watchForFileSystemEvents() :
+            someEvents.append(anEvent)
+        collectTask = asyncio.create_task(collectEvents())
+        await asyncio.sleep(0)
+        someTasks = list(aWatcher.tasks)
+        t.assertEqual(len(someTasks), 4)
+
+      await asyncio.wait_for(collectTask, 1)
+      t.assertTrue(all(aTask.done() for aTask in someTasks))
+      t.assertEqual(len(aWatcher.tasks), 0)
+      t.assertEqual(len(os.listdir('/proc/self/fd')), numFds)
+      await aWatcher.close()
+    finally :
+      shutil.rmtree(closeDir)
+
+  @asyncTestOfProcess(None)
+  async def test_watchMetrics(t) :
+    """Ensure a watcher collecting metrics records its queue depths, event
+    latencies, watch times and per root event rates (and that a watcher
+    which is not collecting metrics has none)."""
+
+    t.assertIsNone(FSWatcher().getWatchMetrics())
+
+    metricsDir = cputilsTestDir + '-metrics'
+    os.makedirs(os.path.join(metricsDir, 'sub'), exist_ok=True)
+    try :
+      aWatcher = FSWatcher(collectMetrics=True)
+      asyncio.create_task(aWatcher.managePathsToWatchQueue())
+      await aWatcher.watchARootPath(metricsDir)
+      await aWatcher.pathsToWatchQueue.join()
+
+      with open(os.path.join(metricsDir, 'sub', 'a.txt'), 'w') as f :
+        f.write("some text")
+      someEvents = aWatcher.watchForFileSystemEvents()
+      while True :
+        anEvent = await asyncio.wait_for(someEvents.__anext__(), 2)
+        if Mask.CLOSE_WRITE in anEvent.mask : break
+
+      someMetrics = aWatcher.getWatchMetrics()
+      yaml.safe_dump(someMetrics)
+      t.assertEqual(someMetrics['addWatchTimes']['count'], 2)
+      t.assertEqual(someMetrics['watchRequestWaits']['count'], 1)
+      t.assertEqual(someMetrics['queueDepths']['pathsToWatch']['count'], 1)
+      t.assertTrue(1 <= someMetrics['queueDepths']['fsWatch']['count'])
+      t.assertTrue(1 <= someMetrics['eventLatencies']['changed']['count'])
+      t.assertEqual(list(someMetrics['rootRates'].keys()), [ metricsDir ])
+      aWatcher.stopWatchingFileSystem()
+    finally :
+      shutil.rmtree(metricsDir)
+
+  @asyncTestOfProcess(None)
+  async def test_computeSHA256(t) :
+    """Ensure SHA256 checksums are computed (in-process) for files with
+    awkward names, and that unreadable files raise their exceptions."""
+
+    hashDir = cputilsTestDir + '-sha256'
+    os.makedirs(hashDir, exist_ok=True)
+    try :
+      aWatcher = FSWatcher(numSHA256Workers=2)
+      someFutures = { }
+      for aName in [ 'plain.txt', "it's a $(file) with spaces;.txt" ] :
+        aPath = os.path.join(hashDir, aName)
+        with open(aPath, 'wb') as f :
+          f.write(aName.encode('utf8') * 100000)
+        someFutures[aPath] = await aWatcher.computeSHA256For(aPath)
+      for aPath, aFuture in someFutures.items() :
+        with open(aPath, 'rb') as f :
+          t.assertEqual(await aFuture, hashlib.sha256(f.read()).hexdigest())
+      t.assertEqual(len(aWatcher.sha256Workers), 2)
+
+      aFuture = await aWatcher.computeSHA256For(os.path.join(hashDir, 'missing'))
+      with t.assertRaises(FileNotFoundError) :
+        await aFuture
+    finally :
+      shutil.rmtree(hashDir)
+
+  @asyncTestOfProcess(None)
+  async def test_prioritySHA256(t) :
+    """Ensure the SHA256 checksums of task dependencies (and of recently
+    changed files) are computed before those of a flood of cold files."""
+
+    priorityDir = cputilsTestDir + '-priority'
+    os.makedirs(priorityDir, exist_ok=True)
+    try :
+      somePaths = [ ]
+      for i in range(200) :
+        aPath = os.path.join(priorityDir, f"cold{i}.txt")
+        with open(aPath, 'w') as f :
+          f.write(f"cold file {i}")
+        somePaths.append(aPath)
+      depPath = os.path.join(priorityDir, 'task.dep')
+      with open(depPath, 'w') as f :
+        f.write("a dependency")
+
+      anArtefactManager = ArtefactManager(None, priorityDir)
+      anArtefactManager.artefacts = {
+        'task.dep' : {
+          'creates' : { 'task.out' : { 'aTask' : { 'chef' : True } } }
+        }
+      }
+      aWatcher = FSWatcher(numSHA256Workers=1)
+      aWatcher.setTaskDependencyCheck(anArtefactManager.isTaskDependency)
+      t.assertEqual(aWatcher.computeSHA256Queue.getDependencyClass(depPath), 0)
+      t.assertEqual(
+        aWatcher.computeSHA256Queue.getDependencyClass(somePaths[0]), 1
+      )
+      someFutures = [
+        await aWatcher.computeSHA256For(aPath) for aPath in somePaths
+      ]
+      t.assertIs(await aWatcher.computeSHA256For(somePaths[0]), someFutures[0])
+      depFuture = await aWatcher.computeSHA256For(depPath)
+      t.assertEqual(
+        await depFuture, hashlib.sha256(b"a dependency").hexdigest()
+      )
+      numDone = sum(1 for aFuture in someFutures if aFuture.done())
+      t.assertLess(numDone, 10)
+      await asyncio.gather(*someFutures)
+      t.assertEqual(aWatcher.getWatchStats()['numHashesCollapsed'], 1)
+    finally :
+      shutil.rmtree(priorityDir)
+
+  @asyncTestOfProcess(None)
+  async def test_suppressUnchanged(t) :
+    """Ensure cached hashes are re-used while a file's signature is
+    unchanged, and that saving identical contents is not reported."""
+
+    unchangedDir = cputilsTestDir + '-unchanged'
+    os.makedirs(unchangedDir, exist_ok=True)
+    aPath = os.path.join(unchangedDir, 'a.txt')
+    with open(aPath, 'w') as f :
+      f.write("some text")
+    try :
+      aWatcher = FSWatcher(suppressUnchanged=True)
+      asyncio.create_task(aWatcher.managePathsToWatchQueue())
+      await aWatcher.watchARootPath(unchangedDir)
+      await aWatcher.pathsToWatchQueue.join()
+
+      firstHash = await (await aWatcher.computeSHA256For(aPath))
+      t.assertEqual(await (await aWatcher.computeSHA256For(aPath)), firstHash)
+      watchStats = aWatcher.getWatchStats()
+      t.assertEqual(watchStats['numHashMisses'], 1)
+      t.assertEqual(watchStats['numHashHits'], 1)
+
+      someEvents = asyncio.Queue()
+      async def collectEvents() :
+        async for anEvent in aWatcher.watchForFileSystemEvents() :
+          await someEvents.put(anEvent)
+      asyncio.create_task(collectEvents())
+
+      # until a CLOSE_WRITE has been seen for a file, its MODIFY events
+      # are reported (but an identical save's CLOSE_WRITE is suppressed)
+      with open(aPath, 'w') as f :
+        f.write("some text")
+      anEvent = await asyncio.wait_for(someEvents.get(), 2)
+      t.assertTrue(Mask.MODIFY in anEvent.mask)
+      await asyncio.sleep(0.2)
+      t.assertTrue(someEvents.empty())
+      t.assertEqual(aWatcher.getWatchStats()['numEventsSuppressed'], 1)
+
+      # an identical save is suppressed (both its MODIFY and CLOSE_WRITE)
+      with open(aPath, 'w') as f :
+        f.write("some text")
+      await asyncio.sleep(0.2)
+      t.assertTrue(someEvents.empty())
+      t.assertEqual(aWatcher.getWatchStats()['numEventsSuppressed'], 3)
+
+      with open(aPath, 'w') as f :
+        f.write("some other text")
+      anEvent = await asyncio.wait_for(someEvents.get(), 2)
+      t.assertEqual(str(anEvent.path), aPath)
+      t.assertTrue(Mask.CLOSE_WRITE in anEvent.mask)
+      t.assertNotEqual(aWatcher.hashCache.getLastHash(aPath), firstHash)
+
+      # a file which is kept open (like a log) only has MODIFY events
+      logPath = os.path.join(unchangedDir, 'a.log')
+      with open(logPath, 'w') as f :
+        f.write("a line\n")
+        f.flush()
+        anEvent = await asyncio.wait_for(someEvents.get(), 2)
+        t.assertEqual(str(anEvent.path), logPath)
+        t.assertTrue(Mask.CREATE in anEvent.mask)
+        anEvent = await asyncio.wait_for(someEvents.get(), 2)
+        t.assertTrue(Mask.MODIFY in anEvent.mask)
+        f.write("another line\n")
+        f.flush()
+        anEvent = await asyncio.wait_for(someEvents.get(), 2)
+        t.assertEqual(str(anEvent.path), logPath)
+        t.assertTrue(Mask.MODIFY in anEvent.mask)
+      aWatcher.stopWatchingFileSystem()
+    finally :
+      shutil.rmtree(unchangedDir)
+
+  @asyncTestOfProcess(None)
+  async def test_perRootHashAlgorithm(t) :
+    """Ensure each root path detects changes with its own hash algorithm,
+    while SHA256 checksums are only computed when asked for."""
+
+    fastDir = cputilsTestDir + '-fastHash'
+    os.makedirs(fastDir, exist_ok=True)
+    aPath = os.path.join(fastDir, 'a.txt')
+    with open(aPath, 'w') as f :
+      f.write("some text")
+    try :
+      aWatcher = FSWatcher(suppressUnchanged=True)
+      await aWatcher.watchARootPath(fastDir, hashAlgorithm='blake2b')
+      t.assertEqual(aWatcher.getChangeHasher(aPath).algorithm, 'blake2b')
+      t.assertEqual(
+        aWatcher.getChangeHasher('/tmp/elsewhere').algorithm, 'sha256'
+      )
+      t.assertEqual(
+        await aWatcher.computeChangeHashFor(aPath),
+        hashlib.blake2b(b"some text").hexdigest()
+      )
+      t.assertEqual(len(aWatcher.hashCache), 0)
+      t.assertEqual(aWatcher.getWatchStats()['numCachedHashes'], 1)
+      t.assertEqual(
+        await (await aWatcher.computeSHA256For(aPath)),
+        hashlib.sha256(b"some text").hexdigest()
+      )
+      t.assertEqual(aWatcher.getWatchStats()['numCachedHashes'], 2)
+    finally :
+      shutil.rmtree(fastDir)
+
+  @asyncTestOfProcess(None)
+  async def test_computeChunkedHash(t) :
+    """Ensure a re-hashed large file only re-hashes its changed chunks."""
+
+    chunkedDir = cputilsTestDir + '-chunked'
+    os.makedirs(chunkedDir, exist_ok=True)
+    aPath = os.path.join(chunkedDir, 'large.bin')
+    with open(aPath, 'wb') as f :
+      f.write(os.urandom(8 * 1024))
+    try :
+      aWatcher = FSWatcher()
+      firstRoot = await aWatcher.computeChunkedHashFor(aPath, chunkSize=1024)
+      with open(aPath, 'ab') as f :
+        f.write(os.urandom(1024))
+      secondRoot = await aWatcher.computeChunkedHashFor(aPath, chunkSize=1024)
+      t.assertNotEqual(firstRoot, secondRoot)
+      watchStats = aWatcher.getWatchStats()
+      t.assertEqual(watchStats['numChunksHashed'], 8 + 1)
+      t.assertEqual(watchStats['numChunksReused'], 8)
+    finally :
+      shutil.rmtree(chunkedDir)
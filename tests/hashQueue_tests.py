@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+
+from cputils.hashQueue import HashQueue
+from tests.testUtils import asyncTestOfProcess
+
+class TestHashQueue(unittest.TestCase) :
+
+  @asyncTestOfProcess(None)
+  async def test_priorities(t) :
+    """Ensure task dependencies are taken first, then the most recent
+    requests."""
+
+    aQueue = HashQueue(isDependency=lambda aPath : aPath.endswith('.dep'))
+    aQueue.requestHash('/cold1', 1.0)
+    aQueue.requestHash('/cold2', 2.0)
+    aQueue.requestHash('/a.dep', 0.5)
+    aQueue.requestHash('/hot', 3.0)
+    t.assertEqual(aQueue.qsize(), 4)
+    somePaths = [ (await aQueue.get())[0] for i in range(4) ]
+    t.assertEqual(somePaths, [ '/a.dep', '/hot', '/cold2', '/cold1' ])
+    t.assertTrue(aQueue.empty())
+
+  @asyncTestOfProcess(None)
+  async def test_collapseDuplicates(t) :
+    """Ensure a path requested while it is queued is only queued once,
+    at its most recent priority."""
+
+    aQueue = HashQueue()
+    aFuture = aQueue.requestHash('/a', 1.0)
+    aQueue.requestHash('/b', 2.0)
+    t.assertIs(aQueue.requestHash('/a', 3.0), aFuture)
+    t.assertEqual(aQueue.qsize(), 2)
+    t.assertEqual(aQueue.numCollapsed, 1)
+
+    # a plain put of a queued path shares the queued request's result
+    otherFuture = asyncio.get_running_loop().create_future()
+    aQueue.put_nowait(('/b', otherFuture))
+    t.assertEqual(aQueue.qsize(), 2)
+
+    aPath, theFuture = await aQueue.get()
+    t.assertEqual(aPath, '/b')
+    t.assertIsNot(theFuture, otherFuture)
+    theFuture.set_result('hashB')
+    aQueue.task_done()
+    t.assertEqual(await otherFuture, 'hashB')
+
+    aPath, theFuture = await aQueue.get()
+    t.assertEqual(aPath, '/a')
+    t.assertIs(theFuture, aFuture)
+    aQueue.task_done()
+    t.assertTrue(aQueue.empty())
+    await asyncio.wait_for(aQueue.join(), 1)
+
+    # once taken, a path can be queued again
+    t.assertIsNot(aQueue.requestHash('/a'), aFuture)
+
+  @asyncTestOfProcess(None)
+  async def test_compactStaleEntries(t) :
+    """Ensure stale (re-prioritised) entries do not accumulate."""
+
+    aQueue = HashQueue()
+    for i in range(1000) :
+      aQueue.requestHash(f"/{i % 10}", float(i))
+    t.assertEqual(aQueue.qsize(), 10)
+    t.assertLessEqual(len(aQueue.heap), 2 * 10 + 64 + 1)
+    somePaths = [ (await aQueue.get())[0] for i in range(10) ]
+    t.assertEqual(somePaths, [ f"/{i}" for i in range(9, -1, -1) ])
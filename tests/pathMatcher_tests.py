@@ -0,0 +1,107 @@
+import os
+import unittest
+
+from cputils.pathMatcher import ( PathMatcher,
+  commonExcludePatterns, translatePattern )
+
+class TestPathMatcher(unittest.TestCase) :
+
+  def test_translatePattern(t) :
+    """Ensure blank lines and comments are ignored and that negated and
+    directory only patterns are recognised."""
+
+    t.assertIsNone(translatePattern(''))
+    t.assertIsNone(translatePattern('   '))
+    t.assertIsNone(translatePattern('# a comment'))
+    t.assertEqual(translatePattern('build/')[1:], (False, True, False))
+    t.assertEqual(translatePattern('!src/keep.o')[1:], (True, False, True))
+
+  def test_unanchoredPatterns(t) :
+    """Ensure patterns without a `/` match at any depth."""
+
+    aMatcher = PathMatcher('/root', ['*.o', 'node_modules/'])
+    t.assertTrue(aMatcher.isExcluded('main.o'))
+    t.assertTrue(aMatcher.isExcluded('src/lib/main.o'))
+    t.assertFalse(aMatcher.isExcluded('src/main.c'))
+    t.assertTrue(aMatcher.isExcluded('node_modules', True))
+    t.assertTrue(aMatcher.isExcluded('web/node_modules', True))
+    # directory only patterns do not match files
+    t.assertFalse(aMatcher.isExcluded('web/node_modules', False))
+
+  def test_anchoredPatterns(t) :
+    """Ensure patterns containing a `/` are anchored to the root path and
+    that `**` matches any number of directories."""
+
+    aMatcher = PathMatcher('/root', ['/build', 'docs/*.pdf', 'out/**/tmp'])
+    t.assertTrue(aMatcher.isExcluded('build', True))
+    t.assertFalse(aMatcher.isExcluded('src/build', True))
+    t.assertTrue(aMatcher.isExcluded('docs/manual.pdf'))
+    t.assertFalse(aMatcher.isExcluded('docs/old/manual.pdf'))
+    t.assertTrue(aMatcher.isExcluded('out/tmp', True))
+    t.assertTrue(aMatcher.isExcluded('out/a/b/tmp', True))
+    t.assertFalse(aMatcher.isExcluded('tmp', True))
+
+  def test_negatedPatterns(t) :
+    """Ensure the last matching pattern wins."""
+
+    aMatcher = PathMatcher('/root', ['*.log', '!important.log', 'old/*.log'])
+    t.assertTrue(aMatcher.isExcluded('build.log'))
+    t.assertFalse(aMatcher.isExcluded('important.log'))
+    t.assertTrue(aMatcher.isExcluded('old/important.log'))
+
+  def test_includePatterns(t) :
+    """Ensure include patterns select the files which are reported, while
+    directories are always reported unless excluded."""
+
+    aMatcher = PathMatcher(
+      '/root', commonExcludePatterns, ['*.tex', '*.bib']
+    )
+    t.assertTrue(aMatcher.isIncluded('paper/paper.tex'))
+    t.assertTrue(aMatcher.isIncluded('refs.bib'))
+    t.assertFalse(aMatcher.isIncluded('paper/paper.pdf'))
+    t.assertTrue(aMatcher.isIncluded('paper', True))
+    t.assertFalse(aMatcher.isIncluded('.git', True))
+
+  def test_shouldReport(t) :
+    """Ensure absolute paths are matched relative to the root path."""
+
+    aMatcher = PathMatcher('/root/project/', ['*.o'])
+    t.assertEqual(aMatcher.relativePath('/root/project'), '')
+    t.assertEqual(aMatcher.relativePath('/root/project/src/a.o'), 'src/a.o')
+    t.assertIsNone(aMatcher.relativePath('/root/projectTwo/a.o'))
+    t.assertFalse(aMatcher.shouldReport('/root/project/src/a.o'))
+    t.assertTrue(aMatcher.shouldReport('/root/project/src/a.c'))
+    t.assertTrue(aMatcher.shouldReport('/root/projectTwo/a.o'))
+    t.assertTrue(aMatcher.shouldReport('/root/project', True))
+
+  def test_relativeRootPath(t) :
+    """Ensure a relative root path is made absolute."""
+
+    aMatcher = PathMatcher('project', ['*.o'])
+    t.assertEqual(aMatcher.rootPath, os.path.join(os.getcwd(), 'project'))
+    t.assertEqual(
+      aMatcher.relativePath(os.path.abspath('project/src/a.o')), 'src/a.o'
+    )
+    t.assertFalse(aMatcher.shouldReport(os.path.abspath('project/src/a.o')))
+
+  def test_checkAncestors(t) :
+    """Ensure paths in excluded directories are only rejected when their
+    ancestors are checked, and that each directory's result is cached."""
+
+    aMatcher = PathMatcher(
+      '/root/project', commonExcludePatterns + [ 'build/', '/docs/' ]
+    )
+    for aPath in [
+      '/root/project/.git/index', '/root/project/node_modules/x/index.js',
+      '/root/project/src/build/out/a.o', '/root/project/docs/a.md',
+    ] :
+      t.assertTrue(aMatcher.shouldReport(aPath))
+      t.assertFalse(aMatcher.shouldReport(aPath, checkAncestors=True))
+    t.assertTrue(
+      aMatcher.shouldReport('/root/project/src/docs/a.md', checkAncestors=True)
+    )
+    t.assertTrue(
+      aMatcher.shouldReport('/root/project/src/a.c', checkAncestors=True)
+    )
+    t.assertTrue(aMatcher.excludedDirs['src/build/out'])
+    t.assertFalse(aMatcher.excludedDirs['src'])
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import shutil
+import unittest
+
+from asyncinotify import Mask
+from cputils.pollingScanner import PollingScanner
+from tests.testUtils import asyncTestOfProcess
+
+pollingTestDir = '/tmp/cputils-tests-pollingScanner'
+
+class TestPollingScanner(unittest.TestCase) :
+
+  def test_isPolled(t) :
+    """Ensure paths inside (and only inside) polled trees are polled, and
+    that a polled tree absorbs any polled trees below it."""
+
+    async def reportChange(aPath, aMask) : pass
+    aPoller = PollingScanner(reportChange)
+    aPoller.addTree('/a/b/c')
+    aPoller.addTree('/a/b/d')
+    t.assertTrue(aPoller.isPolled('/a/b/c'))
+    t.assertTrue(aPoller.isPolled('/a/b/c/e/f'))
+    t.assertFalse(aPoller.isPolled('/a/b'))
+    t.assertFalse(aPoller.isPolled('/a/b/cd'))
+    aPoller.addTree('/a/b')
+    t.assertEqual(len(aPoller), 1)
+    t.assertTrue(aPoller.isPolled('/a/b/cd'))
+
+  @asyncTestOfProcess(None)
+  async def test_adaptiveInterval(t) :
+    """Ensure changes are reported, and that the polling interval doubles
+    while a tree is quiet and is reset once a change is found."""
+
+    os.makedirs(os.path.join(pollingTestDir, 'sub'), exist_ok=True)
+    try :
+      someChanges = [ ]
+      async def reportChange(aPath, aMask) :
+        someChanges.append((aPath, aMask))
+
+      aPoller = PollingScanner(reportChange, minInterval=1, maxInterval=4)
+      aPoller.addTree(pollingTestDir)
+      aTree = aPoller.trees[pollingTestDir]
+      t.assertEqual(await aPoller.pollTree(aTree), 0)
+      t.assertEqual(aPoller.getNumPolledPaths(), 2)
+
+      for anInterval in [ 2, 4, 4 ] :
+        t.assertEqual(await aPoller.pollTree(aTree), 0)
+        t.assertEqual(aTree.interval, anInterval)
+
+      aPath = os.path.join(pollingTestDir, 'sub', 'a.txt')
+      with open(aPath, 'w') as f :
+        f.write("some text")
+      t.assertEqual(await aPoller.pollTree(aTree), 1)
+      t.assertEqual(aTree.interval, 1)
+      t.assertEqual(someChanges, [ (aPath, Mask.CREATE) ])
+    finally :
+      shutil.rmtree(pollingTestDir)
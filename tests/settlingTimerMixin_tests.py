@@ -2,7 +2,9 @@ import asyncio
 import os
 import unittest
 
-from cputils.settlingTimerMixin import mixinSettlingTimer
+from cputils.settlingTimerMixin import \
+  defaultWaitTimeOut, mixinSettlingTimer, SettlingTimer, SettlingTimerSet
+from cputils.artefactManager import ArtefactManager
 from cputils.natsClient import NatsClient
 from tests.testUtils import asyncTestOfProcess
 
@@ -75,3 +77,228 @@ class TestSettlingTimerMixin(unittest.TestCase) :
     t.assertTrue(obj.hasSettled('noTimer'))
     await obj.waitUntilSettled('noTimer')
     t.assertTrue(obj.hasSettled('noTimer'))
+
+  @asyncTestOfProcess(None)
+  async def test_reArmWithoutTasks(t) :
+    """Ensure re-starting an unsettled timer only moves its deadline (no
+    tasks are created), and that the callback is called once, a timeOut
+    after the last unSettle."""
+
+    t.numCalls = 0
+    async def countCalls() :
+      t.numCalls = t.numCalls + 1
+
+    obj = SimpleObject()
+    mixinSettlingTimer(obj, 0.05, countCalls)
+    numTasks = len(asyncio.all_tasks())
+    loop = asyncio.get_running_loop()
+    for i in range(10) :
+      for j in range(1000) : await obj.unSettle()
+      t.assertEqual(len(asyncio.all_tasks()), numTasks)
+      await asyncio.sleep(0.01)
+    lastTime = loop.time()
+    t.assertFalse(obj.hasSettled())
+    t.assertEqual(t.numCalls, 0)
+    while not obj.hasSettled() : await asyncio.sleep(0.005)
+    t.assertGreaterEqual(loop.time() - lastTime, 0.04)
+    await asyncio.sleep(0.01)
+    t.assertEqual(t.numCalls, 1)
+
+  @asyncTestOfProcess(None)
+  async def test_timerSetPerInstance(t) :
+    """Ensure each instance of a class with the settling timers mixed in
+    has its own timers (and its own bound callback)."""
+
+    class SettlingObject :
+      async def settled(self) :
+        self.numSettles = self.numSettles + 1
+
+    mixinSettlingTimer(SettlingObject, 0.02, SettlingObject.settled)
+    objA = SettlingObject()
+    objB = SettlingObject()
+    objA.numSettles = 0
+    objB.numSettles = 0
+    t.assertIsInstance(objA.settlingTimers, SettlingTimerSet)
+    t.assertIsNot(objA.settlingTimers, objB.settlingTimers)
+
+    objA.addSettlingTimer('anArtefact', 0.02)
+    t.assertEqual(len(objA.settlingTimers), 2)
+    t.assertEqual(len(objB.settlingTimers), 1)
+    await objA.unSettle()
+    await objA.unSettle('anArtefact')
+    t.assertFalse(objA.hasSettled())
+    t.assertFalse(objA.hasSettled('anArtefact'))
+    t.assertTrue(objB.hasSettled())
+    await objA.waitUntilSettled()
+    t.assertTrue(objA.hasSettled('anArtefact'))
+    t.assertEqual(objA.numSettles, 1)
+    t.assertEqual(objB.numSettles, 0)
+
+    obj = SimpleObject()
+    mixinSettlingTimer(obj)
+    t.assertIsInstance(obj.settlingTimers, SettlingTimerSet)
+    t.assertFalse(hasattr(SimpleObject, 'unSettle'))
+
+  @asyncTestOfProcess(None)
+  async def test_waitUntilSettled(t) :
+    """Ensure any number of waiters wake once, as soon as the timer (and
+    its callback) has settled, and that waits can time out."""
+
+    t.callbackDone = False
+    async def slowCallback() :
+      await asyncio.sleep(0.02)
+      t.callbackDone = True
+
+    obj = SimpleObject()
+    mixinSettlingTimer(obj, 0.05, slowCallback)
+    t.assertTrue(await obj.waitUntilSettled())
+    t.assertTrue(await obj.waitUntilSettled('noTimer'))
+
+    await obj.unSettle()
+    t.assertFalse(await obj.waitUntilSettled(timeOut=0.01))
+    waiters = [
+      asyncio.ensure_future(obj.waitUntilSettled()) for i in range(100)
+    ]
+    await asyncio.sleep(0.02)
+    await obj.unSettle()
+    loop = asyncio.get_running_loop()
+    startTime = loop.time()
+    results = await asyncio.gather(*waiters)
+    t.assertEqual(results, [ True ] * 100)
+    t.assertTrue(t.callbackDone)
+    t.assertTrue(obj.hasSettled())
+    # the timeOut, plus the callback's sleep, plus (a little) scheduling
+    t.assertGreaterEqual(loop.time() - startTime, 0.06)
+    t.assertLess(loop.time() - startTime, 0.07 + 0.02)
+
+  @asyncTestOfProcess(None)
+  async def test_waitUntilSettledDefaultTimeOut(t) :
+    """Ensure, by default, waiting for a timer which is never allowed to
+    settle gives up after the defaultWaitTimeOut."""
+
+    obj = SimpleObject()
+    mixinSettlingTimer(obj, 0.05)
+    async def keepUnSettling() :
+      while True :
+        await obj.unSettle()
+        await asyncio.sleep(0.01)
+    aTask = asyncio.create_task(keepUnSettling())
+    await asyncio.sleep(0.02)
+    loop  = asyncio.get_running_loop()
+    startTime = loop.time()
+    try :
+      t.assertFalse(await obj.waitUntilSettled())
+    finally :
+      aTask.cancel()
+    t.assertGreaterEqual(loop.time() - startTime, defaultWaitTimeOut)
+    t.assertTrue(await obj.waitUntilSettled(timeOut=None))
+
+  def test_adaptiveTimeOutBounds(t) :
+    """Ensure an adaptive timeout follows the observed gaps, within its
+    bounds."""
+
+    timer = SettlingTimer('timer', 0.5, adaptive=True, minTimeOut=0.15)
+    t.assertEqual(timer.maxTimeOut, 5.0)
+    for i in range(20) : timer.observeGap(0.1)
+    t.assertAlmostEqual(timer.meanGap, 0.1)
+    t.assertAlmostEqual(timer.timeOut, 0.2)
+    for i in range(20) : timer.observeGap(0.01)
+    t.assertAlmostEqual(timer.timeOut, 0.15)
+    for i in range(20) : timer.observeGap(100)
+    t.assertEqual(timer.timeOut, 5.0)
+
+  @asyncTestOfProcess(None)
+  async def test_adaptiveTimeOut(t) :
+    """Ensure an adaptive timer settles soon after a burst of closely
+    spaced unSettle calls (rather than after its initial timeOut)."""
+
+    obj = SimpleObject()
+    mixinSettlingTimer(obj)
+    obj.addSettlingTimer(
+      'burst', 0.5, adaptive=True, minTimeOut=0.02, maxTimeOut=1.0
+    )
+    loop = asyncio.get_running_loop()
+    for i in range(10) :
+      await obj.unSettle('burst')
+      await asyncio.sleep(0.01)
+    startTime = loop.time()
+    t.assertTrue(await obj.waitUntilSettled('burst'))
+    t.assertLess(loop.time() - startTime, 0.1)
+    t.assertLess(obj.settlingTimers.timers['burst'].timeOut, 0.1)
+
+  @asyncTestOfProcess(None)
+  async def test_adaptiveTimeOutGrows(t) :
+    """Ensure an adaptive timeout stretches again when the traffic slows
+    down (rather than firing the callback for every slower unSettle)."""
+
+    t.numCalls = 0
+    async def countCalls() :
+      t.numCalls = t.numCalls + 1
+
+    obj = SimpleObject()
+    mixinSettlingTimer(obj)
+    obj.addSettlingTimer(
+      'traffic', 0.5, countCalls, adaptive=True, minTimeOut=0.01,
+      maxTimeOut=1.0
+    )
+    timer = obj.settlingTimers.timers['traffic']
+    for i in range(10) :
+      await obj.unSettle('traffic')
+      await asyncio.sleep(0.02)
+    t.assertLess(timer.timeOut, 0.06)
+    for i in range(10) :
+      await obj.unSettle('traffic')
+      await asyncio.sleep(0.06)
+    t.assertGreater(timer.timeOut, 0.06)
+    t.assertLessEqual(t.numCalls, 2)
+    t.assertTrue(await obj.waitUntilSettled('traffic'))
+
+  @asyncTestOfProcess(None)
+  async def test_adaptiveTimeOutBursts(t) :
+    """Ensure the quiet time between two bursts (using the parameters of
+    the ArtefactManager's timers) does not stretch an adaptive
+    timeout."""
+
+    class MessageRecorder :
+      async def sendMessage(self, aSubject, aMsg, sleepTime=None) :
+        pass
+
+    am   = ArtefactManager(MessageRecorder())
+    loop = asyncio.get_running_loop()
+    for aBurst in range(2) :
+      for i in range(5) :
+        await am.unSettle('taskRegistration')
+        await asyncio.sleep(0.1)
+      startTime = loop.time() - 0.1
+      t.assertTrue(await am.waitUntilSettled('taskRegistration'))
+      if aBurst : t.assertLess(loop.time() - startTime, 0.5)
+      await asyncio.sleep(1.0)
+    timerStats = am.getTimerStats('taskRegistration')
+    t.assertLess(timerStats['timeOut'], 0.5)
+    t.assertEqual(timerStats['numForcedFires'], 0)
+
+  @asyncTestOfProcess(None)
+  async def test_maxWait(t) :
+    """Ensure a timer which is continuously unsettled is forced to fire
+    every maxWait seconds, and still settles once the traffic stops."""
+
+    t.numCalls = 0
+    async def countCalls() :
+      t.numCalls = t.numCalls + 1
+
+    obj = SimpleObject()
+    mixinSettlingTimer(obj)
+    obj.addSettlingTimer('busy', 0.03, countCalls, maxWait=0.1)
+    loop = asyncio.get_running_loop()
+    startTime = loop.time()
+    while loop.time() - startTime < 0.35 :
+      await obj.unSettle('busy')
+      await asyncio.sleep(0.01)
+    t.assertFalse(obj.hasSettled('busy'))
+    numForcedFires = obj.getTimerStats('busy')['numForcedFires']
+    t.assertEqual(numForcedFires, 3)
+    t.assertEqual(t.numCalls, 3)
+    t.assertTrue(await obj.waitUntilSettled('busy'))
+    t.assertEqual(t.numCalls, 4)
+    t.assertEqual(obj.getTimerStats('busy')['numForcedFires'], 3)
+    t.assertIsNone(obj.getTimerStats('noTimer'))
@@ -0,0 +1,58 @@
+import asyncio
+import json
+import unittest
+
+from cputils.watchMetrics import Histogram, RateCounter, TimedQueue
+from tests.testUtils import asyncTestOfProcess
+
+class TestWatchMetrics(unittest.TestCase) :
+
+  def test_histogram(t) :
+    """Ensure percentiles are estimated to within the width of a bucket."""
+
+    aHistogram = Histogram()
+    t.assertIsNone(aHistogram.getPercentile(50))
+    for aValue in range(1, 1001) :
+      aHistogram.record(aValue / 1000)
+    aHistogram.record(0)
+    t.assertEqual(aHistogram.count, 1001)
+    t.assertEqual(aHistogram.minValue, 0)
+    t.assertEqual(aHistogram.maxValue, 1)
+    for aPercentile in [ 50, 90, 99 ] :
+      anEstimate = aHistogram.getPercentile(aPercentile)
+      t.assertTrue(aPercentile / 100 <= anEstimate)
+      t.assertTrue(anEstimate <= 1.25 * aPercentile / 100)
+    t.assertEqual(aHistogram.getPercentile(100), 1)
+    t.assertEqual(sum(aCount for aLimit, aCount in aHistogram.toDict()['buckets']), 1001)
+    json.dumps(aHistogram.toDict())
+
+  def test_rateCounter(t) :
+    """Ensure the number of events in each second is recorded."""
+
+    aCounter = RateCounter()
+    for aTime in [ 10.1, 10.5, 10.9, 12.0, 13.2, 13.3 ] :
+      aCounter.record(aTime)
+    t.assertEqual(aCounter.numEvents, 6)
+    # the current (13th) second is not yet complete
+    t.assertEqual(aCounter.rates.count, 2)
+    t.assertEqual(aCounter.rates.maxValue, 3)
+
+  @asyncTestOfProcess(None)
+  async def test_timedQueue(t) :
+    """Ensure the depth of the queue and the time each item waits in the
+    queue are reported."""
+
+    someDepths = [ ]
+    someWaits  = [ ]
+    aQueue = TimedQueue(
+      lambda anItem, aDepth : someDepths.append(aDepth),
+      lambda anItem, waitTime : someWaits.append((anItem, waitTime))
+    )
+    await aQueue.put('a')
+    aQueue.put_nowait('b')
+    await asyncio.sleep(0.01)
+    t.assertEqual(await aQueue.get(), 'a')
+    t.assertEqual(aQueue.get_nowait(), 'b')
+    t.assertEqual(someDepths, [ 1, 2 ])
+    t.assertEqual([ anItem for anItem, waitTime in someWaits ], [ 'a', 'b' ])
+    t.assertTrue(0.01 <= someWaits[0][1])
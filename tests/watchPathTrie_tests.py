@@ -0,0 +1,80 @@
+import unittest
+from pathlib import Path
+
+from cputils.watchPathTrie import WatchPathTrie
+
+class FakeWatch :
+  def __init__(self, wd, path) :
+    self.wd   = wd
+    self.path = Path(path)
+
+class TestWatchPathTrie(unittest.TestCase) :
+
+  def addWatches(t, aTrie, somePaths) :
+    someWatches = { }
+    for wd, aPath in enumerate(somePaths) :
+      someWatches[aPath] = FakeWatch(wd, aPath)
+      aTrie.addWatch(aPath, someWatches[aPath])
+    return someWatches
+
+  def test_addRemoveWatches(t) :
+    """Ensure watches can be found by path and by watch descriptor, and
+    that removing watches prunes the trie."""
+
+    aTrie = WatchPathTrie()
+    someWatches = t.addWatches(aTrie, [ '/a', '/a/b', '/a/b/c', '/x/y' ])
+    t.assertEqual(len(aTrie), 4)
+    t.assertTrue('/a/b' in aTrie)
+    t.assertFalse('/x' in aTrie)
+    t.assertEqual(aTrie.getPath(someWatches['/a/b/c'].wd), '/a/b/c')
+    t.assertIs(aTrie.getWatch('/x/y'), someWatches['/x/y'])
+    t.assertEqual(len(aTrie.getWatchesBelow('/a/b')), 2)
+
+    t.assertIs(aTrie.removeWatch(someWatches['/x/y'].wd), someWatches['/x/y'])
+    t.assertIsNone(aTrie.removeWatch(someWatches['/x/y'].wd))
+    t.assertIsNone(aTrie.getNode('/x'))
+    t.assertEqual(len(aTrie), 3)
+
+  def test_moveSubTree(t) :
+    """Ensure moving a sub-tree re-keys only the watches in the moved
+    sub-tree."""
+
+    aTrie = WatchPathTrie()
+    someWatches = t.addWatches(aTrie, [
+      '/a', '/a/b', '/a/b/c', '/a/b/c/d', '/a/e', '/f'
+    ])
+    t.assertEqual(aTrie.moveSubTree('/a/b', '/f/g'), 3)
+    t.assertEqual(str(someWatches['/a/b'].path), '/f/g')
+    t.assertEqual(str(someWatches['/a/b/c/d'].path), '/f/g/c/d')
+    t.assertEqual(str(someWatches['/a/e'].path), '/a/e')
+    t.assertEqual(aTrie.getPath(someWatches['/a/b/c'].wd), '/f/g/c')
+    t.assertFalse('/a/b' in aTrie)
+    t.assertTrue('/f/g/c/d' in aTrie)
+    t.assertEqual(len(aTrie), 6)
+
+    t.assertEqual(aTrie.moveSubTree('/not/watched', '/f/h'), 0)
+
+  def test_getColdestSubTrees(t) :
+    """Ensure the coldest (and then the largest) sub-trees are chosen
+    first, that kept paths are never chosen and that no chosen sub-tree
+    contains another."""
+
+    aTrie = WatchPathTrie()
+    someWatches = t.addWatches(aTrie, [
+      '/r', '/r/hot', '/r/hot/x', '/r/warm', '/r/cold', '/r/cold/a', '/r/cold/b'
+    ])
+    aTrie.touchWatch(someWatches['/r/hot/x'].wd, 30)
+    aTrie.touchWatch(someWatches['/r/warm'].wd, 20)
+    aTrie.touchWatch(someWatches['/r/cold/a'].wd, 10)
+
+    t.assertEqual(aTrie.getColdestSubTrees(1, [ '/r' ]), [ '/r/cold/b' ])
+    t.assertEqual(
+      aTrie.getColdestSubTrees(2, [ '/r' ]), [ '/r/cold/b', '/r/cold/a' ]
+    )
+    t.assertEqual(
+      aTrie.getColdestSubTrees(4, [ '/r' ]),
+      [ '/r/cold/b', '/r/cold/a', '/r/warm', '/r/hot' ]
+    )
+    t.assertEqual(aTrie.getColdestSubTrees(1, [ '/r/cold/b' ]), [ '/r/cold/a' ])
+    # without any kept paths the whole (cold) tree can be chosen
+    t.assertEqual(aTrie.getColdestSubTrees(1), [ '/r/cold/b' ])